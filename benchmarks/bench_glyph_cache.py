@@ -0,0 +1,69 @@
+"""
+グリフキャッシュの有無で描画結果と速度を比較するベンチマーク。
+
+同じ行データをキャッシュ無効・有効のレンダラーでそれぞれ描画し、
+全ページがピクセル単位で一致することを確認したうえで、1枚あたりの描画時間を表示する。
+一致しないページがあった場合は終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_glyph_cache.py --rows 200 --cache-size 4096
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import ImageChops
+
+from postcard_generator import FONT_PATH, PostcardRenderer
+from bench_memory import SAMPLE_ROWS
+
+# 郵便番号の桁や半角入力など、キャッシュのキーが変わりやすい行も含める
+EXTRA_ROWS = [
+    {'氏名': 'ﾔﾏﾀﾞ ﾊﾅｺ', '郵便番号': '1234567', '住所１': '東京都港区１－２－３', '住所２': 'ｻﾝﾗｲｽﾞ１０２号室', '敬称': '', '敬称２': ''},
+    {'氏名': '鈴木商店', '郵便番号': '300-0003', '住所１': '神奈川県横浜市中区横浜町1-2-3', '住所２': '鈴木ビル1F', '敬称': '御中'},
+    {'氏名': '伊藤 太郎', '氏名２': '伊藤 次郎', '郵便番号': '700-0007', '住所１': '広島県広島市中区紙屋町1-1', '住所２': '平和ビル3F', '敬称': '様'},
+]
+
+
+def render_all(renderer, rows):
+    """全行を描画し、(ページ画像のリスト, 経過秒) を返す。"""
+    start = time.perf_counter()
+    pages = [renderer.render_row(row) for row in rows]
+    return pages, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='グリフキャッシュの有無で描画結果と速度を比較します。')
+    parser.add_argument('--rows', type=int, default=100, help='描画する行数 (既定: 100)')
+    parser.add_argument('--cache-size', type=int, default=4096, help='グリフキャッシュの最大文字数 (既定: 4096)')
+    parser.add_argument('--font', default=FONT_PATH, help='使用するフォントファイル')
+    args = parser.parse_args(argv)
+
+    base_rows = SAMPLE_ROWS + EXTRA_ROWS
+    rows = [base_rows[i % len(base_rows)] for i in range(args.rows)]
+
+    uncached = PostcardRenderer(font_path=args.font, glyph_cache_size=0)
+    cached = PostcardRenderer(font_path=args.font, glyph_cache_size=args.cache_size)
+
+    uncached_pages, uncached_seconds = render_all(uncached, rows)
+    cached_pages, cached_seconds = render_all(cached, rows)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(uncached_pages, cached_pages))
+                  if ImageChops.difference(a, b).getbbox() is not None]
+
+    cache = cached.glyph_cache
+    print(f"キャッシュなし: {uncached_seconds / args.rows * 1000:.1f} ms/枚")
+    print(f"キャッシュあり: {cached_seconds / args.rows * 1000:.1f} ms/枚 "
+          f"(ヒット {cache.hits}, ミス {cache.misses}, 保持 {len(cache)} 文字)")
+    if mismatches:
+        print(f"描画結果が一致しないページがあります: {mismatches}")
+        return 1
+    print(f"全{args.rows}ページがピクセル単位で一致しました。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
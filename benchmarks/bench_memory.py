@@ -0,0 +1,81 @@
+"""
+行数ごとのピークメモリ使用量 (最大RSS) を計測するベンチマーク。
+
+指定した行数の住所録CSVを一時フォルダに生成し、行数ごとに別プロセスで
+`python -m postcard_generator --csv ... --out ...` を実行して最大RSSを記録する。
+ストリーミング書き出しが正しく動いていれば、行数を増やしても最大RSSはほぼ一定になる。
+
+使い方:
+    python benchmarks/bench_memory.py 10 100 1000 --json memory.json
+
+os.wait4 を使用するため、Linux / macOS 専用。
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_ROWS = [
+    {'氏名': '山田 太郎', '氏名２': '', '郵便番号': '100-0001', '住所１': '東京都千代田区千代田1-1', '住所２': '皇居', '敬称': '様', '敬称２': ''},
+    {'氏名': '田中 花子', '氏名２': '一郎', '郵便番号': '200-0002', '住所１': '大阪府大阪市中央区中央1-1', '住所２': '大阪城ビルディング5F', '敬称': '様', '敬称２': ''},
+    {'氏名': '木村 拓哉', '氏名２': '工藤 静香', '郵便番号': '600-0006', '住所１': '京都府京都市中京区河原町通1-1', '住所２': '京都タワーレジデンス20F', '敬称': '様', '敬称２': '様'},
+]
+
+
+def write_csv(path, row_count):
+    """SAMPLE_ROWS を繰り返して row_count 行のCSVを書き出す。"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(SAMPLE_ROWS[0]))
+        writer.writeheader()
+        for i in range(row_count):
+            writer.writerow(SAMPLE_ROWS[i % len(SAMPLE_ROWS)])
+
+
+def measure(row_count, work_dir, extra_args):
+    """1回分の生成を別プロセスで実行し、(最大RSS[MB], 経過秒, PDFサイズ[bytes]) を返す。"""
+    csv_path = os.path.join(work_dir, f'rows_{row_count}.csv')
+    pdf_path = os.path.join(work_dir, f'rows_{row_count}.pdf')
+    write_csv(csv_path, row_count)
+
+    command = [sys.executable, '-m', 'postcard_generator', '--csv', csv_path, '--out', pdf_path] + extra_args
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f'{row_count}行の生成に失敗しました: {" ".join(command)}')
+
+    # ru_maxrss の単位は Linux ではKB、macOS ではバイト
+    max_rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / (1024 * 1024)
+    return max_rss, elapsed, os.path.getsize(pdf_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='行数ごとのピークメモリ使用量を計測します。')
+    parser.add_argument('row_counts', nargs='*', type=int, default=[10, 100, 1000], help='計測する行数 (既定: 10 100 1000)')
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    parser.add_argument('--extra', default='', help='postcard_generator に渡す追加の引数 (空白区切り)')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'行数':>8} {'最大RSS(MB)':>12} {'時間(秒)':>10} {'PDF(MB)':>10}")
+        for row_count in args.row_counts:
+            max_rss, elapsed, pdf_size = measure(row_count, work_dir, args.extra.split())
+            results.append({'rows': row_count, 'max_rss_mb': round(max_rss, 1), 'seconds': round(elapsed, 3), 'pdf_bytes': pdf_size})
+            print(f"{row_count:>8} {max_rss:>12.1f} {elapsed:>10.2f} {pdf_size / (1024 * 1024):>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
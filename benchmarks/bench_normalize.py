@@ -0,0 +1,198 @@
+"""
+住所・氏名の正規化処理のマイクロベンチマークと、旧実装との出力一致の確認。
+
+旧実装 (1文字ずつのNFKC正規化と、プレースホルダーを使った漢数字変換) をこのファイル内に
+そのまま残しておき、現在の変換表ベースの実装と次の2点を比較する。
+  1. 実在しそうな住所と、変換対象の文字をランダムに組み合わせた文字列で出力が完全に一致すること
+  2. 1秒あたりに処理できる文字列数 (旧実装 / 新実装 / キャッシュあり)
+出力が一致しない文字列があった場合は終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_normalize.py --random 20000 --repeat 50000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import postcard_generator as pg
+
+ADDRESSES = [
+    '東京都千代田区千代田1-1', '皇居', '大阪府大阪市中央区中央1-1', '大阪城ビルディング5F',
+    '神奈川県横浜市中区横浜町1-2-3', '鈴木ビル1F', '北海道札幌市中央区大通西1-1', '大通公園タワー10F',
+    '京都府京都市中京区河原町通1-1', '京都タワーレジデンス20F', '広島県広島市中区紙屋町1-1', '平和ビル3F',
+    '東京都港区１－２－３', 'ｻﾝﾗｲｽﾞ１０２号室', '３階', 'A棟１０２号室', '1丁目2番地3号', 'ｺｰﾎﾟ山田 2-B',
+    'Ｍａｎｓｉｏｎ１２Ｆ', '123ー45', '千代田区丸の内2丁目7-2 JPタワー',
+]
+
+# ランダムな文字列に使う文字 (変換の境界になりやすい文字を多めに含める)
+RANDOM_ALPHABET = (
+    '0123456789０１２３４５６７８９abcxyzABCXYZａｂＡＢ -－ー_ '
+    'ｱｲｳｶﾞﾊﾟｰﾝｦﾟｧ アイウンヴァヶ 階号室棟丁目番地東京都港区 　()（）#＃&.'
+)
+
+# --- 旧実装 (出力の比較用に、変更前のコードをそのまま残している) ---
+def legacy_convert_halfwidth_to_fullwidth_all(text):
+    """
+    文字列中の全ての半角文字（英数字、記号、カタカナ、スペース）を全角に変換する。
+    特に半角アルファベットの変換を強化。
+    """
+    fullwidth_chars = []
+    for char in text:
+        # 半角アルファベットを全角に変換
+        if 'a' <= char <= 'z':
+            fullwidth_chars.append(chr(ord(char) - ord('a') + ord('ａ')))
+        elif 'A' <= char <= 'Z':
+            fullwidth_chars.append(chr(ord(char) - ord('A') + ord('Ａ')))
+        # 半角数字を全角に変換
+        elif '0' <= char <= '9':
+            fullwidth_chars.append(chr(ord(char) - ord('0') + ord('０')))
+        # 半角スペースを全角スペースに変換
+        elif char == ' ':
+            fullwidth_chars.append('　')
+        # その他の文字（半角カタカナ、特定の記号など）はNFKC正規化を適用
+        else:
+            fullwidth_chars.append(unicodedata.normalize('NFKC', char))
+            
+    return "".join(fullwidth_chars)
+
+
+def legacy_convert_address_numbers_and_hyphens(text):
+    """
+    住所内の数字を漢数字に変換し、ハイフン（半角・全角問わず）を全角縦棒に変換する。
+    ただし、数字の直後にアルファベットやカタカナ、特定の単位を表す漢字が続く場合は、
+    その数字は漢数字に変換せず、全角数字のままにする。
+    この関数は、_convert_halfwidth_to_fullwidth_all の後に呼び出されることを想定。
+    これにより、半角ハイフンは先に全角ハイフンに変換され、その後縦棒になる。
+    """
+    kanji_map = {
+        '0': '〇', '1': '一', '2': '二', '3': '三', '4': '四',
+        '5': '五', '6': '六', '7': '七', '8': '八', '9': '九',
+    }
+
+    # フェーズ1: 漢数字変換をスキップすべき部分を特定し、プレースホルダーに置き換える
+    # パターン: 1桁以上の全角数字が続き、その直後に特定の非数字文字が1つ以上続く
+    skip_pattern = re.compile(
+        r'[０-９]+'  # 1桁以上の全角数字
+        r'([a-zA-ZＡ-Ｚａ-ｚァ-ヶア-ンーヴｱ-ﾝｦ-ﾟ階号室棟]+)' # その後に続く特定の文字群
+    )
+
+    preserved_parts = {} # プレースホルダーと元の文字列のマッピング
+    placeholder_idx = 0
+
+    def replace_with_placeholder(match):
+        nonlocal placeholder_idx
+        full_match = match.group(0)  
+        placeholder = f"__PLACEHOLDER_{placeholder_idx}__"
+        preserved_parts[placeholder] = full_match
+        placeholder_idx += 1
+        return placeholder
+
+    # まず、スキップすべきパターンをプレースホルダーに置き換え
+    temp_text = skip_pattern.sub(replace_with_placeholder, text)
+
+    # フェーズ2: プレースホルダー以外の部分に対して通常の変換を行う
+    converted_temp_text = ""
+    i = 0
+    while i < len(temp_text):
+        char = temp_text[i]
+        
+        # プレースホルダーかどうかのチェック
+        if char == '_' and temp_text[i:i+16].startswith('__PLACEHOLDER_'): # __PLACEHOLDER_XX__ の長さ
+            end_idx = temp_text.find('__', i + 1)
+            if end_idx != -1:
+                end_idx += 2
+                placeholder = temp_text[i:end_idx]
+                converted_temp_text += placeholder
+                i = end_idx
+                continue
+            
+        # 数字と判断される文字 (全角数字)
+        if '０' <= char <= '９':
+            converted_temp_text += kanji_map[chr(ord(char) - ord('０') + ord('0'))]
+        # ハイフン（全角・半角長音符）を縦棒に変換
+        elif char in ['-', '－', 'ー']:
+            converted_temp_text += '｜'
+        else:
+            converted_temp_text += char
+        i += 1
+    
+    # フェーズ3: プレースホルダーを元の文字列に戻す
+    final_text = converted_temp_text
+    for placeholder, original_text in preserved_parts.items():
+        final_text = final_text.replace(placeholder, original_text)
+
+    return final_text
+
+
+def random_strings(count, seed):
+    """変換対象の文字をランダムに組み合わせた文字列を作成する。"""
+    rng = random.Random(seed)
+    return [''.join(rng.choice(RANDOM_ALPHABET) for _ in range(rng.randint(0, 24))) for _ in range(count)]
+
+
+def legacy_normalize_address(text):
+    return legacy_convert_address_numbers_and_hyphens(legacy_convert_halfwidth_to_fullwidth_all(text))
+
+
+def current_normalize_address(text):
+    return pg._convert_address_numbers_and_hyphens(pg._convert_halfwidth_to_fullwidth_all(text))
+
+
+def check_equivalence(corpus):
+    """旧実装と現在の実装の出力を比較し、一致しなかった入力のリストを返す。"""
+    mismatches = []
+    for text in corpus:
+        if legacy_convert_halfwidth_to_fullwidth_all(text) != pg._convert_halfwidth_to_fullwidth_all(text):
+            mismatches.append(('全角変換', text))
+        if legacy_normalize_address(text) != current_normalize_address(text):
+            mismatches.append(('住所変換', text))
+        if legacy_normalize_address(text) != pg.normalize_address(text):
+            mismatches.append(('キャッシュ付き住所変換', text))
+    return mismatches
+
+
+def measure(function, corpus):
+    """corpus の全文字列を function で変換し、1秒あたりの処理件数を返す。"""
+    start = time.perf_counter()
+    for text in corpus:
+        function(text)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='住所・氏名の正規化処理を旧実装と比較します。')
+    parser.add_argument('--random', type=int, default=20000, help='一致確認に使うランダム文字列の数 (既定: 20000)')
+    parser.add_argument('--repeat', type=int, default=50000, help='速度計測で変換する文字列数 (既定: 50000)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード (既定: 0)')
+    args = parser.parse_args(argv)
+
+    corpus = ADDRESSES + random_strings(args.random, args.seed)
+    mismatches = check_equivalence(corpus)
+    if mismatches:
+        for kind, text in mismatches[:20]:
+            print(f"一致しません ({kind}): {text!r}")
+        print(f"旧実装と一致しない出力が{len(mismatches)}件あります。")
+        return 1
+    print(f"{len(corpus)}件の文字列で旧実装と出力が一致しました。")
+
+    # 住所録と同じく、同じ住所が繰り返し現れるデータで速度を計測する
+    workload = [ADDRESSES[i % len(ADDRESSES)] for i in range(args.repeat)]
+    pg.normalize_address.cache_clear()
+    results = [
+        ('旧実装', measure(legacy_normalize_address, workload)),
+        ('新実装 (キャッシュなし)', measure(current_normalize_address, workload)),
+        ('新実装 (キャッシュあり)', measure(pg.normalize_address, workload)),
+    ]
+    for label, per_second in results:
+        print(f"{label:<24} {per_second:>12,.0f} 件/秒")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+郵便番号の索引 (postal_index.py) のベンチマーク。
+
+KEN_ALL.CSV と同じ形式・同じ規模 (約12万行) の架空の郵便番号データを生成し、以下を計測する。
+  1. 索引の作成時間と索引ファイルのサイズ
+  2. 索引を開く時間 (メモリマップのため、データの量によらずほぼ一定)
+  3. 1件の検索時間 (キャッシュなし / キャッシュあり / 存在しない郵便番号)
+  4. synthetic_addresses.py の住所録 (既定: 10万行) を照合する時間と、照合結果の件数
+  5. 高層ビルの郵便番号など、判定の決まっている住所 (KEN_ALL_CASES) の照合結果 (異なる場合は終了コード1)
+架空のデータは synthetic_addresses.py の地域に合わせてあるため、住所録の大半は一致し、
+索引に含めなかった郵便番号 (下4桁が9000以上) は「見つかりません」と判定される。
+
+使い方:
+    python benchmarks/bench_postal_index.py --rows 100000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postal_index import (KEN_ALL_ENCODING, POSTAL_COMPLETABLE, POSTAL_OK, POSTAL_STATUS_MESSAGES, POSTAL_TOWN_MISMATCH,
+                          PostalIndex, PostalReport, build_postal_index)
+from synthetic_addresses import generate_rows
+
+# synthetic_addresses.LOCALITIES の地域を、KEN_ALL.CSV と同じく都道府県・市区町村・町域に分けたもの
+KEN_ALL_LOCALITIES = {
+    '100': ('東京都', '千代田区', '千代田'), '154': ('東京都', '世田谷区', '三軒茶屋'),
+    '192': ('東京都', '八王子市', '元本郷町'), '231': ('神奈川県', '横浜市中区', '山下町'),
+    '541': ('大阪府', '大阪市中央区', '本町'), '460': ('愛知県', '名古屋市中区', '栄'),
+    '060': ('北海道', '札幌市中央区', '大通西（１～１９丁目）'), '812': ('福岡県', '福岡市博多区', '博多駅前'),
+    '604': ('京都府', '京都市中京区', '河原町通'), '980': ('宮城県', '仙台市青葉区', '一番町'),
+    '730': ('広島県', '広島市中区', '紙屋町'), '900': ('沖縄県', '那覇市', '久茂地'),
+}
+KEN_ALL_MISSING_FROM = 9000 # 下4桁がこれ以上の郵便番号は索引に含めない
+
+# 実際の KEN_ALL.CSV と同じ表記の、高層ビルとその周辺の郵便番号 (郵便番号, 都道府県, 市区町村, 町域)
+KEN_ALL_BUILDINGS = [
+    ('1600023', '東京都', '新宿区', '西新宿（次のビルを除く）'),
+    ('1630290', '東京都', '新宿区', '西新宿新宿住友ビル（地階・階層不明）'),
+    ('1630201', '東京都', '新宿区', '西新宿新宿住友ビル（１階）'),
+    ('1630238', '東京都', '新宿区', '西新宿新宿住友ビル（３８階）'),
+]
+
+# 照合結果の決まっている住所 (郵便番号, 住所１, 判定)
+KEN_ALL_CASES = [
+    ('1630201', '東京都新宿区西新宿２－６－１新宿住友ビル１階', POSTAL_OK),
+    ('163-0238', '東京都新宿区西新宿2-6-1 新宿住友ビル 38F', POSTAL_OK),
+    ('1630290', '新宿区西新宿新宿住友ビル', POSTAL_COMPLETABLE),
+    ('1630201', '東京都新宿区西新宿２－６－１', POSTAL_TOWN_MISMATCH),
+    ('1630201', '東京都新宿区新宿１－１－１新宿住友ビル１階', POSTAL_TOWN_MISMATCH),
+    ('1600023', '東京都新宿区西新宿１－１－１', POSTAL_OK),
+]
+
+
+def write_ken_all(path):
+    """KEN_ALL.CSV と同じ列構成の架空の郵便番号データを書き出す。Returns the number of rows."""
+    count = 0
+    with open(path, 'w', encoding=KEN_ALL_ENCODING, newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        for prefix, (prefecture, city, town) in sorted(KEN_ALL_LOCALITIES.items()):
+            for suffix in range(KEN_ALL_MISSING_FROM):
+                zip_code = f'{prefix}{suffix:04d}'
+                writer.writerow([13101, zip_code[:5], zip_code, 'ｶﾅ', 'ｶﾅ', 'ｶﾅ', prefecture, city, town,
+                                 0, 0, 0, 0, 0, 0])
+                count += 1
+        for zip_code, prefecture, city, town in KEN_ALL_BUILDINGS:
+            writer.writerow([13104, zip_code[:5], zip_code, 'ｶﾅ', 'ｶﾅ', 'ｶﾅ', prefecture, city, town,
+                             0, 0, 0, 0, 0, 0])
+            count += 1
+    return count
+
+
+def _per_call_us(function, arguments):
+    start = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - start) / len(arguments) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='郵便番号の索引の作成・検索・照合の速度を計測します。')
+    parser.add_argument('--rows', type=int, default=100000, help='照合する住所録の行数 (既定: 100000)')
+    parser.add_argument('--lookups', type=int, default=100000, help='検索時間の計測に使う検索回数 (既定: 100000)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード (既定: 0)')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        ken_all_path = os.path.join(work_dir, 'KEN_ALL.CSV')
+        index_path = os.path.join(work_dir, 'KEN_ALL.CSV.idx')
+        ken_all_rows = write_ken_all(ken_all_path)
+
+        start = time.perf_counter()
+        records = build_postal_index(ken_all_path, index_path)
+        build_seconds = time.perf_counter() - start
+        print(f"索引の作成: {ken_all_rows} 行 → {records} 件、{build_seconds:.2f} 秒、"
+              f"{os.path.getsize(index_path) / 1024:.0f} KB (元のCSV {os.path.getsize(ken_all_path) / 1024:.0f} KB)")
+
+        index = PostalIndex(ken_all_path, index_path)
+        start = time.perf_counter()
+        index.open()
+        print(f"索引を開く: {(time.perf_counter() - start) * 1e3:.3f} ms")
+
+        prefixes = sorted(KEN_ALL_LOCALITIES)
+        hits = [f'{rng.choice(prefixes)}{rng.randrange(KEN_ALL_MISSING_FROM):04d}' for _ in range(args.lookups)]
+        misses = [f'{rng.randrange(10 ** 7):07d}' for _ in range(args.lookups)]
+        print(f"検索 (キャッシュなし): {_per_call_us(index._lookup, hits):.2f} µs/件")
+        print(f"検索 (存在しない番号): {_per_call_us(index._lookup, misses):.2f} µs/件")
+        # 住所録では同じ郵便番号が繰り返し現れるため、キャッシュに収まる数の郵便番号で計測する
+        repeated = [rng.choice(hits[:1000]) for _ in range(args.lookups)]
+        print(f"検索 (キャッシュあり): {_per_call_us(index.lookup, repeated):.2f} µs/件")
+
+        rows = list(generate_rows(args.rows, seed=args.seed))
+        report = PostalReport()
+        start = time.perf_counter()
+        for row_number, row in enumerate(rows, 1):
+            status, entries, suggestion = index.check(row['郵便番号'], row['住所１'])
+            report.add(row_number, row['氏名'], row['郵便番号'], row['住所１'], status, entries, suggestion)
+        check_seconds = time.perf_counter() - start
+        print(f"住所録の照合: {len(rows)} 行、{check_seconds:.3f} 秒 ({check_seconds / len(rows) * 1e6:.2f} µs/行)")
+        print(report.summary())
+
+        failures = 0
+        for zip_code, address, expected in KEN_ALL_CASES:
+            status = index.check(zip_code, address)[0]
+            failures += status != expected
+            print(f"{zip_code} {address}: {POSTAL_STATUS_MESSAGES[status]}"
+                  f"{'' if status == expected else f'  ← {POSTAL_STATUS_MESSAGES[expected]} ではありません'}")
+        index.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
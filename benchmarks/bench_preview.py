@@ -0,0 +1,73 @@
+"""
+プレビュー用の低いDPIと印刷用のDPIで、1枚あたりの描画時間を比較するベンチマーク。
+
+同じ行データを DPI ごとのレンダラー (PostcardRenderer(dpi=...)) で描画し、
+レイアウト・ラスタライズ・圧縮を含めた1枚あたりの時間と画素数を表示する。
+あわせて、文字の配置が DPI によらず同じ位置 (mm) になることを確認する。
+各文字の位置の差が POSITION_TOLERANCE_MM を超えた場合は終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_preview.py --rows 200 --dpi 72 96 300
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postcard_generator import FONT_PATH, TEMPLATE_DPI, PostcardRenderer
+from pdf_writer import encode_page
+from bench_glyph_cache import EXTRA_ROWS
+from bench_memory import SAMPLE_ROWS
+
+# 文字サイズは整数ピクセルに丸めるため、郵便番号のように文字の送り幅で並べる位置は低いDPIで少しずれる
+POSITION_TOLERANCE_MM = 1.0
+
+
+def measure(renderer, rows):
+    """全行を描画・圧縮し、1枚あたりの経過秒を返す。"""
+    start = time.perf_counter()
+    for row in rows:
+        encode_page(renderer.render_row(row))
+    return (time.perf_counter() - start) / len(rows)
+
+
+def max_position_error_mm(renderer, reference, rows):
+    """renderer と reference (印刷用のDPI) の各文字の左上の位置の差の最大値 (mm)。"""
+    scale = reference.layout.pixels_per_mm
+    error = 0.0
+    for row in rows:
+        for glyph, reference_glyph in zip(renderer.layout_row(row), reference.layout_row(row)):
+            for value, reference_value in zip(glyph[2:], reference_glyph[2:]):
+                error = max(error, abs(value / renderer.layout.pixels_per_mm - reference_value / scale))
+    return error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='プレビュー用の低いDPIと印刷用のDPIで描画時間を比較します。')
+    parser.add_argument('--rows', type=int, default=100, help='描画する行数 (既定: 100)')
+    parser.add_argument('--dpi', type=int, nargs='+', default=[72, 96, TEMPLATE_DPI], help=f'比較するDPI (既定: 72 96 {TEMPLATE_DPI})')
+    parser.add_argument('--font', default=FONT_PATH, help='使用するフォントファイル')
+    args = parser.parse_args(argv)
+
+    base_rows = SAMPLE_ROWS + EXTRA_ROWS
+    rows = [base_rows[i % len(base_rows)] for i in range(args.rows)]
+    reference = PostcardRenderer(font_path=args.font)
+
+    failed = False
+    for dpi in args.dpi:
+        renderer = PostcardRenderer(font_path=args.font, dpi=dpi)
+        seconds = measure(renderer, rows)
+        width, height = renderer.template.size
+        error = max_position_error_mm(renderer, reference, base_rows)
+        print(f"DPI {dpi:>4}: {seconds * 1000:7.2f} ms/枚  {width}x{height} ピクセル  文字の位置の差 最大 {error:.2f} mm")
+        failed = failed or error > POSITION_TOLERANCE_MM
+    if failed:
+        print(f"印刷用のDPIと文字の位置が {POSITION_TOLERANCE_MM} mm 以上異なるDPIがあります。")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
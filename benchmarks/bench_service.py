@@ -0,0 +1,182 @@
+"""
+ローカルHTTPサービス (render_service.py) の動作確認とベンチマーク。
+
+空いているポートでサービスを同じプロセス内に起動し、標準ライブラリの http.client で
+複数のクライアントから同時に住所録 (synthetic_addresses.py で生成したCSV、またはJSON) を送って、以下を確認・計測する。
+  1. 返ってきたPDFのページ数が送った行数と一致すること (一致しなければ終了コード1)
+  2. 最初のページが届くまでの時間 (ストリーミングされていること) と、全体の所要時間
+  3. 日本語や改行を含むファイル名 (filename=) を指定しても、PDFと Content-Disposition が正しく返ること
+  4. 待ち行列が一杯の場合に 503 が返ること
+  5. /metrics の内容 (待ち行列の長さ・1秒あたりの枚数・所要時間のパーセンタイル)
+
+使い方:
+    python benchmarks/bench_service.py --jobs 8 --rows 50 --clients 4 --workers 2
+"""
+import argparse
+import csv
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader
+
+from render_service import RenderService, create_server
+from synthetic_addresses import FIELDNAMES, generate_rows
+
+
+def _csv_body(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode('shift_jis'), 'text/csv'
+
+
+def post_render(port, body, content_type, query=''):
+    """
+    /render にPOSTし、応答を少しずつ読み込む。
+    Returns (status, body bytes, seconds until the first byte of the body, total seconds).
+    """
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    connection.request('POST', '/render' + query, body=body, headers={'Content-Type': content_type})
+    response = connection.getresponse()
+    first_byte = None
+    chunks = []
+    while True:
+        data = response.read1(65536)
+        if not data:
+            break
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        chunks.append(data)
+    connection.close()
+    return response.status, b''.join(chunks), first_byte, time.perf_counter() - start
+
+
+def check_filename(port, body, content_type, rows, filename, expected):
+    """
+    filename= を指定してPDFを受け取り、Content-Disposition の filename* が expected になっていることを確認する。
+    Returns True if the PDF and the header are correct.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    try:
+        connection.request('POST', '/render?filename=' + quote(filename), body=body,
+                           headers={'Content-Type': content_type})
+        response = connection.getresponse()
+        disposition = response.getheader('Content-Disposition', '')
+        data = response.read()
+    except http.client.HTTPException as e:
+        print(f"ファイル名 {filename!r}: 応答を受け取れませんでした ({e!r})  ← 不一致")
+        return False
+    finally:
+        connection.close()
+    pages = len(PdfReader(io.BytesIO(data)).pages) if response.status == 200 else 0
+    ok = (response.status == 200 and pages == rows and disposition.isascii()
+          and unquote(disposition.rpartition("filename*=UTF-8''")[2]) == expected)
+    print(f"ファイル名 {filename!r}: {response.status} {pages} ページ  {disposition}{'' if ok else '  ← 不一致'}")
+    return ok
+
+
+def get_json(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    body = json.loads(response.read().decode('utf-8'))
+    connection.close()
+    return body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ローカルHTTPサービスに同時にリクエストを送り、動作と速度を確認します。')
+    parser.add_argument('--jobs', type=int, default=8, help='送るリクエストの数 (既定: 8)')
+    parser.add_argument('--rows', type=int, default=30, help='1リクエストあたりの行数 (既定: 30)')
+    parser.add_argument('--clients', type=int, default=4, help='同時に送るクライアントの数 (既定: 4)')
+    parser.add_argument('--workers', type=int, default=1, help='サービスのワーカープロセス数 (既定: 1)')
+    parser.add_argument('--max-jobs', type=int, default=2, help='サービスが同時に処理するリクエストの数 (既定: 2)')
+    parser.add_argument('--color-mode', default='1', help='ページの色モード (既定: 1)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    service = RenderService({'color_mode': args.color_mode}, workers=args.workers, max_jobs=args.max_jobs,
+                            max_queue=args.jobs)
+    server = create_server(service)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"サービスの起動 (ワーカー {service.workers} 個のフォント読み込みを含む): {time.perf_counter() - start:.2f} 秒")
+    print(json.dumps(get_json(port, '/health'), ensure_ascii=False))
+
+    # 半分はCSV、半分はJSONで送る (一部はベクター出力)
+    requests = []
+    for i in range(args.jobs):
+        rows = list(generate_rows(args.rows, seed=i))
+        if i % 2:
+            requests.append((json.dumps({'rows': rows}, ensure_ascii=False).encode('utf-8'), 'application/json',
+                             '?vector=1' if i % 4 == 3 else ''))
+        else:
+            requests.append(_csv_body(rows) + ('',))
+
+    results = [None] * len(requests)
+    next_index = iter(range(len(requests)))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            results[index] = post_render(port, *requests[index])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for index, (status, body, first_byte, total) in enumerate(results):
+        pages = len(PdfReader(io.BytesIO(body)).pages) if status == 200 else 0
+        ok = status == 200 and pages == args.rows
+        failures += not ok
+        print(f"ジョブ {index:>3}: {status} {requests[index][1]:<17}{requests[index][2]:<10}"
+              f"{pages:>5} ページ  最初のデータ {first_byte * 1000:>8.1f} ms  全体 {total * 1000:>8.1f} ms"
+              f"{'' if ok else '  ← 不一致'}")
+    print(f"合計 {args.jobs * args.rows} 枚 / {elapsed:.2f} 秒 ({args.jobs * args.rows / elapsed:.1f} 枚/秒)")
+
+    # ファイル名はヘッダーに入れる前に、ディレクトリの部分と改行を取り除き、日本語は filename* に入れる
+    body, content_type = _csv_body(list(generate_rows(args.rows)))
+    for filename, expected in (('年賀状.pdf', '年賀状.pdf'), ('../名簿\r\nX-Injected: 1.pdf', '名簿X-Injected: 1.pdf')):
+        failures += not check_filename(port, body, content_type, args.rows, filename, expected)
+
+    # 待ち行列を0にすると、処理中のジョブがある間の新しいリクエストは 503 になる
+    service.max_queue = 0
+    body, content_type = _csv_body(list(generate_rows(args.rows * 4)))
+    blockers = [threading.Thread(target=post_render, args=(port, body, content_type)) for _ in range(service.max_jobs)]
+    for thread in blockers:
+        thread.start()
+    time.sleep(0.5)
+    status = post_render(port, body, content_type)[0]
+    print(f"待ち行列が一杯の場合: {status}{'' if status == 503 else '  ← 503 ではありません'}")
+    failures += status != 503
+    for thread in blockers:
+        thread.join()
+
+    print(json.dumps(get_json(port, '/metrics'), ensure_ascii=False, indent=2))
+    server.shutdown()
+    server.server_close()
+    service.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+起動時間のベンチマーク (PyInstallerで固めた実行ファイルの起動が遅くならないことの確認)。
+
+以下を別プロセスで繰り返し計測し、中央値を表示する。
+  1. `python -X importtime -c "import postcard_generator"` の内訳
+     (postcard_generator が直接読み込むモジュールごとの累計時間と、全体の時間)
+  2. GUIモードで起動してから最初のダイアログ (住所録の選択の案内) が表示されるまでの時間
+  3. ダイアログをすぐに閉じた場合に、レンダラー (テンプレートとフォント) の準備が終わるまでの時間
+GUIの計測では messagebox / filedialog を置き換えるため、ダイアログは実際には表示されない
+(tkinterのルートウィンドウは作成するため、ディスプレイの無い環境では 2. と 3. を省略する)。
+
+起動時に読み込まないはずのモジュール (LAZY_MODULES) が import 時に読み込まれている場合や、
+import の時間が --max-import-ms を超えた場合は、終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_startup.py --repeat 5 --max-import-ms 150
+"""
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import postcard_generator の時点では読み込まず、最初に使う時点 (GUIでは別スレッド) で読み込むモジュール
+LAZY_MODULES = ('PIL', 'chardet', 'tkinter', 'argparse', 'concurrent.futures', 'multiprocessing', 'xlsx_reader')
+
+# GUIモード (run_gui) のダイアログを置き換え、表示した時点の印を標準出力に書く
+GUI_DRIVER = r'''
+import sys
+import tkinter
+from tkinter import filedialog, messagebox
+import postcard_generator
+
+def first_dialog(*args, **kwargs):
+    print('dialog', flush=True)
+
+def renderer_ready(*args, **kwargs):
+    # プレビューの確認は、レンダラーの準備が終わった後に表示される
+    print('ready', flush=True)
+    sys.exit(0)
+
+def failed(title, message, **kwargs):
+    print('error', message.replace('\n', ' '), flush=True)
+    sys.exit(1)
+
+messagebox.showinfo = first_dialog
+messagebox.askyesno = renderer_ready
+messagebox.showerror = failed
+messagebox.showwarning = failed
+filedialog.askopenfilename = lambda **kwargs: 'addresses.csv'
+try:
+    postcard_generator.run_gui()
+except tkinter.TclError:
+    print('no-display', flush=True)
+'''
+
+
+def import_times():
+    """
+    -X importtime の出力を解析する。
+    Returns a list of (module name, self microseconds, cumulative microseconds, nesting level) in output order
+    (a module is listed after the modules it imports).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import postcard_generator'],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        times.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return times
+
+
+def direct_imports(times, module):
+    """module が直接読み込んだモジュールの名前 (インタープリターの起動時に読み込まれたものは含まない)。"""
+    index = next(i for i, entry in enumerate(times) if entry[0] == module)
+    level = times[index][3] + 1
+    names = []
+    for name, _, _, entry_level in reversed(times[:index]):
+        if entry_level < level:
+            break
+        if entry_level == level:
+            names.append(name)
+    return names
+
+
+def gui_startup():
+    """
+    GUIモードを起動し、(最初のダイアログまでの秒数, レンダラーの準備が終わるまでの秒数) を返す。
+    ディスプレイが無い場合は None を返す。
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', GUI_DRIVER], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    marks = {}
+    for line in process.stdout:
+        kind = line.split(' ', 1)[0].strip()
+        marks[kind] = time.perf_counter() - start
+        if kind == 'error':
+            process.wait()
+            raise RuntimeError(f'GUIモードの起動に失敗しました: {line.strip()}')
+    process.wait()
+    if 'no-display' in marks:
+        return None
+    return marks['dialog'], marks['ready']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='import の内訳と、GUIモードで最初のダイアログが表示されるまでの時間を計測します。')
+    parser.add_argument('--repeat', type=int, default=5, help='計測の回数 (既定: 5)')
+    parser.add_argument('--top', type=int, default=12, help='表示するモジュールの数 (既定: 12)')
+    parser.add_argument('--max-import-ms', type=float, help='import postcard_generator の時間の上限 (ミリ秒)。超えると終了コード1')
+    args = parser.parse_args(argv)
+
+    # 実行ファイルと同じく、コンパイル済みのバイトコード (.pyc) から読み込む時間を計測する
+    compileall.compile_dir(REPO_DIR, maxlevels=0, quiet=1)
+    runs = [import_times() for _ in range(args.repeat)]
+    loaded = set.intersection(*({entry[0] for entry in times} for times in runs))
+    cumulative = {name: statistics.median(entry[2] for times in runs for entry in times if entry[0] == name) / 1000
+                  for name in loaded}
+    total = cumulative['postcard_generator']
+
+    # postcard_generator が直接読み込むモジュール (-X importtime の1段下)
+    children = sorted((name for name in direct_imports(runs[0], 'postcard_generator') if name in loaded),
+                      key=cumulative.get, reverse=True)
+    print(f"import postcard_generator の内訳 ({args.repeat} 回の中央値)")
+    print(f"{'モジュール':<32} {'累計(ms)':>10} {'割合':>7}")
+    for name in children[:args.top]:
+        print(f"{name:<32} {cumulative[name]:>10.1f} {cumulative[name] / total:>7.1%}")
+    own = statistics.median(entry[1] for times in runs for entry in times if entry[0] == 'postcard_generator') / 1000
+    print(f"{'(postcard_generator 自身)':<32} {own:>10.1f} {own / total:>7.1%}")
+    print(f"{'合計':<32} {total:>10.1f}")
+
+    failed = False
+    eager = sorted(name for name in loaded
+                   if any(name == module or name.startswith(module + '.') for module in LAZY_MODULES))
+    if eager:
+        print(f"起動時に読み込まないはずのモジュールが読み込まれています: {', '.join(eager)}")
+        failed = True
+    if args.max_import_ms is not None and total > args.max_import_ms:
+        print(f"import の時間が上限 ({args.max_import_ms:g} ms) を超えています")
+        failed = True
+
+    startups = [gui_startup() for _ in range(args.repeat)]
+    if None in startups:
+        print("ディスプレイが無いため、GUIモードの計測は省略しました。")
+    else:
+        dialog = statistics.median(startup[0] for startup in startups)
+        ready = statistics.median(startup[1] for startup in startups)
+        print(f"GUIモード: 最初のダイアログまで {dialog * 1000:.0f} ms / レンダラーの準備の完了まで {ready * 1000:.0f} ms"
+              " (インタープリターの起動を含む)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+スループット・メモリ・出力サイズをまとめて計測するベンチマークスイート。
+
+synthetic_addresses.py で行数とエンコーディングごとに架空の住所録CSVを生成し、
+それぞれ別プロセスで PostcardRenderer.render_csv (CLIと同じ描画経路、画面なし) を実行して、
+以下をJSONに保存する。コミットごとに保存しておけば、--compare で前回の結果と比較できる。
+  * rows_per_sec: 1秒あたりの処理行数 (プロセス起動・フォント読み込みを除いた render_csv の時間から計算)
+  * max_rss_mb: 最大RSS (子プロセス全体)
+  * pdf_bytes: 出力PDFのサイズ
+  * stages: 工程ごとの合計時間 (秒)。--profile と同じ Profiler で計測する
+    (CSV読み込み / 正規化 / レイアウト / テンプレートのコピー / ラスタライズ / 圧縮 / PDF書き出し / PDFの仕上げなど。
+    --workers 2 以上の場合、ワーカープロセスでの時間の合計になる)
+  * counters: 描画した文字数などのカウンター
+
+使い方:
+    python benchmarks/bench_suite.py --sizes 100 1000 10000 --json results.json
+    python benchmarks/bench_suite.py --sizes 1000 --json new.json --compare results.json
+
+os.wait4 を使用するため、Linux / macOS 専用。
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_addresses import write_address_book
+
+# 表に表示する工程 (JSONには Profiler で計測した全ての工程を保存する)
+STAGES = ['read', 'normalize', 'layout', 'template_copy', 'rasterize', 'encode', 'write', 'finalize']
+
+
+def run_child(csv_path, pdf_path, color_mode, workers):
+    """
+    子プロセス側の処理。--profile と同じ Profiler を有効にして render_csv を実行し、
+    工程ごとの時間を含む結果をJSONで標準出力に書く。
+    """
+    import postcard_generator
+    from profiler import Profiler
+
+    profiler = Profiler()
+    start = time.perf_counter()
+    renderer = postcard_generator.PostcardRenderer(color_mode=color_mode, profiler=profiler)
+    setup_seconds = time.perf_counter() - start
+
+    # 1行ごとのログは計測の邪魔になるので捨てる
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            start = time.perf_counter()
+            pages = renderer.render_csv(csv_path, pdf_path, workers=workers)
+            render_seconds = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+
+    print(json.dumps({
+        'pages': pages,
+        'setup_seconds': round(setup_seconds, 4),
+        'render_seconds': round(render_seconds, 4),
+        'stages': {stage: round(seconds, 4) for stage, seconds in profiler.totals.items()},
+        'counters': profiler.counters,
+    }))
+    return 0
+
+
+def measure(row_count, encoding, work_dir, args):
+    """1つの条件を別プロセスで実行し、結果の辞書を返す。"""
+    csv_path = os.path.join(work_dir, f'rows_{row_count}_{encoding}.csv')
+    pdf_path = os.path.join(work_dir, f'rows_{row_count}_{encoding}.pdf')
+    write_address_book(csv_path, row_count, encoding=encoding, seed=args.seed)
+
+    command = [sys.executable, os.path.abspath(__file__), '--child', csv_path, pdf_path,
+               '--color-mode', args.color_mode, '--workers', str(args.workers)]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.PIPE)
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f'{row_count}行 ({encoding}) の生成に失敗しました: {" ".join(command)}')
+    child = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    # ru_maxrss の単位は Linux ではKB、macOS ではバイト
+    max_rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / (1024 * 1024)
+    result = {
+        'rows': row_count,
+        'encoding': encoding,
+        'csv_bytes': os.path.getsize(csv_path),
+        'rows_per_sec': round(row_count / child['render_seconds'], 2) if child['render_seconds'] else None,
+        'max_rss_mb': round(max_rss, 1),
+        'pdf_bytes': os.path.getsize(pdf_path),
+        'wall_seconds': round(elapsed, 3),
+    }
+    result.update(child)
+    os.remove(pdf_path)
+    return result
+
+
+def _metadata(args):
+    """比較用に、計測環境とコミットを記録する。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    import PIL
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'color_mode': args.color_mode,
+        'workers': args.workers,
+        'seed': args.seed,
+    }
+
+
+def _print_comparison(results, baseline_path):
+    """前回の結果ファイルと、同じ条件 (行数・エンコーディング) の rows_per_sec / max_rss_mb を比較する。"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['rows'], r['encoding']): r for r in baseline['results']}
+    print(f"\n比較対象: {baseline_path} (commit {baseline['meta'].get('commit', '')[:10]})")
+    print(f"{'行数':>8} {'エンコーディング':>10} {'行/秒':>16} {'最大RSS(MB)':>18}")
+    for result in results:
+        old = previous.get((result['rows'], result['encoding']))
+        if old is None or not old['rows_per_sec']:
+            continue
+        speedup = result['rows_per_sec'] / old['rows_per_sec']
+        print(f"{result['rows']:>8} {result['encoding']:>10} "
+              f"{old['rows_per_sec']:>7.1f}→{result['rows_per_sec']:<7.1f}({speedup:.2f}x) "
+              f"{old['max_rss_mb']:>7.1f}→{result['max_rss_mb']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='住所録の行数・エンコーディングごとに、処理速度・メモリ・PDFサイズを計測します。')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000],
+                        help='計測する行数 (既定: 100 1000 10000。最大 1000000 程度まで)')
+    parser.add_argument('--encodings', nargs='+', default=['utf-8', 'shift_jis'], help='CSVのエンコーディング (既定: utf-8 shift_jis)')
+    parser.add_argument('--color-mode', default='RGB', help='ページの色モード (既定: RGB)')
+    parser.add_argument('--workers', type=int, default=1, help='並列に描画するプロセス数 (既定: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='住所録を生成する乱数のシード (既定: 0)')
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    parser.add_argument('--compare', metavar='JSON', help='以前に保存した結果と比較する')
+    parser.add_argument('--child', nargs=2, metavar=('CSV', 'PDF'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_child(args.child[0], args.child[1], args.color_mode, args.workers)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'行数':>8} {'エンコーディング':>10} {'行/秒':>8} {'最大RSS(MB)':>12} {'PDF(MB)':>10}  工程別 (秒)")
+        for row_count in args.sizes:
+            for encoding in args.encodings:
+                result = measure(row_count, encoding, work_dir, args)
+                results.append(result)
+                stages = ' '.join(f"{stage}={result['stages'].get(stage, 0.0):.2f}" for stage in STAGES)
+                print(f"{row_count:>8} {encoding:>10} {result['rows_per_sec']:>8.1f} {result['max_rss_mb']:>12.1f} "
+                      f"{result['pdf_bytes'] / (1024 * 1024):>10.2f}  {stages}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'meta': _metadata(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        _print_comparison(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+受け取りフォルダの一括処理 (--watch --once) と、住所録ごとにCLIを起動する場合の所要時間を比較するベンチマーク。
+
+架空の住所録 (synthetic_addresses.py) を一時フォルダに複数書き出し、以下の2通りでPDFにする。
+  1. 住所録ごとに `python -m postcard_generator --csv ... --out ...` を別プロセスで実行する
+     (毎回、インタープリターの起動・フォントの読み込み・ワーカーの起動がかかる)
+  2. `python -m postcard_generator --watch ... --once` を1回だけ実行する
+     (フォントとワーカーの準備は1回で、全ての住所録で共有する)
+2通りのPDFが同じ内容であること、全ての住所録に完了の印 (.done) があることを確認し、異なる場合は終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_watch.py --files 20 --rows 50 --workers 2 --max-jobs 2
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_addresses import write_address_book
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(arguments):
+    """postcard_generator を別プロセスで実行し、経過秒を返す。"""
+    command = [sys.executable, '-m', 'postcard_generator'] + arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'処理に失敗しました: {" ".join(command)}')
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='受け取りフォルダの一括処理と、住所録ごとのCLIの起動の所要時間を比較します。')
+    parser.add_argument('--files', type=int, default=20, help='住所録の数 (既定: 20)')
+    parser.add_argument('--rows', type=int, default=50, help='1つの住所録の行数 (既定: 50)')
+    parser.add_argument('--workers', type=int, default=1, help='ワーカープロセス数 (既定: 1)')
+    parser.add_argument('--max-jobs', type=int, default=2, help='一括処理で同時に処理する住所録の数 (既定: 2)')
+    parser.add_argument('--color-mode', default='1', help='ページの色モード (既定: 1)')
+    args = parser.parse_args(argv)
+
+    options = ['--color-mode', args.color_mode, '--workers', str(args.workers)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir = os.path.join(work_dir, 'in')
+        cli_dir = os.path.join(work_dir, 'cli')
+        watch_dir = os.path.join(work_dir, 'watch')
+        os.makedirs(input_dir)
+        os.makedirs(cli_dir)
+        names = [f'book_{index:03}' for index in range(args.files)]
+        for index, name in enumerate(names):
+            write_address_book(os.path.join(input_dir, name + '.csv'), args.rows, seed=index)
+
+        cli_elapsed = sum(run(['--csv', os.path.join(input_dir, name + '.csv'),
+                               '--out', os.path.join(cli_dir, name + '.pdf')] + options) for name in names)
+        watch_elapsed = run(['--watch', input_dir, '--watch-out', watch_dir, '--once',
+                             '--max-jobs', str(args.max_jobs)] + options)
+
+        # 受け取りフォルダの出力は、拡張子を含めた住所録のファイル名 (book_000.csv.pdf など) になる
+        mismatched = [name for name in names
+                      if not os.path.exists(os.path.join(watch_dir, name + '.csv.done'))
+                      or not filecmp.cmp(os.path.join(cli_dir, name + '.pdf'), os.path.join(watch_dir, name + '.csv.pdf'),
+                                         shallow=False)]
+
+    cards = args.files * args.rows
+    print(f"住所録 {args.files} 件 × {args.rows} 行 (ワーカー {args.workers} 個)")
+    print(f"{'方法':<24} {'時間(秒)':>10} {'1件あたり(秒)':>14} {'枚/秒':>8}")
+    for label, elapsed in (('住所録ごとにCLIを起動', cli_elapsed), (f'--watch --once (同時 {args.max_jobs} 件)', watch_elapsed)):
+        print(f"{label:<24} {elapsed:>10.2f} {elapsed / args.files:>14.3f} {cards / elapsed:>8.1f}")
+    print(f"短縮: {cli_elapsed / watch_elapsed:.1f} 倍")
+    if mismatched:
+        print(f"PDFの内容が一致しない、または完了の印が無い住所録: {', '.join(mismatched)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
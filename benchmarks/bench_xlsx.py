@@ -0,0 +1,69 @@
+"""
+Excelブック (.xlsx) の住所録を直接読み込む場合と、同じ内容のCSVを読み込む場合の時間とピークメモリ (最大RSS) を比較するベンチマーク。
+
+行数ごとに架空の住所録 (synthetic_addresses.py) をCSVとExcelブックの両方で一時フォルダに書き出し、
+別プロセスで `python -m postcard_generator --csv ... --fit-report ...` (全行を読み込み、描画はしない) を実行する。
+ブックはシートのXMLを1行ずつ解析するため、行数を増やしても最大RSSは共有文字列の分しか増えない。
+あわせて、CSVとブックで同じレポートになる (同じ行データとして読み込まれる) ことを確認し、異なる場合は終了コード1で終了する。
+
+使い方:
+    python benchmarks/bench_xlsx.py 10000 100000 300000
+
+os.wait4 を使用するため、Linux / macOS 専用。
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_addresses import write_address_book, write_address_book_xlsx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(path, report_path):
+    """全行の読み込み (はみ出しの確認) を別プロセスで実行し、(最大RSS[MB], 経過秒) を返す。"""
+    command = [sys.executable, '-m', 'postcard_generator', '--csv', path, '--fit-report', report_path]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f'読み込みに失敗しました: {" ".join(command)}')
+    # ru_maxrss の単位は Linux ではKB、macOS ではバイト
+    max_rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / (1024 * 1024)
+    return max_rss, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Excelブックと CSV の住所録の読み込みの時間とピークメモリを比較します。')
+    parser.add_argument('row_counts', nargs='*', type=int, default=[1000, 10000, 100000], help='計測する行数 (既定: 1000 10000 100000)')
+    args = parser.parse_args(argv)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'行数':>8} {'形式':>6} {'ファイル(MB)':>12} {'最大RSS(MB)':>12} {'時間(秒)':>10}")
+        for row_count in args.row_counts:
+            paths = {
+                'csv': os.path.join(work_dir, f'rows_{row_count}.csv'),
+                'xlsx': os.path.join(work_dir, f'rows_{row_count}.xlsx'),
+            }
+            write_address_book(paths['csv'], row_count)
+            write_address_book_xlsx(paths['xlsx'], row_count)
+            reports = {}
+            for kind, path in paths.items():
+                reports[kind] = path + '.fit.csv'
+                max_rss, elapsed = measure(path, reports[kind])
+                size = os.path.getsize(path) / (1024 * 1024)
+                print(f"{row_count:>8} {kind:>6} {size:>12.2f} {max_rss:>12.1f} {elapsed:>10.2f}")
+            if not filecmp.cmp(reports['csv'], reports['xlsx'], shallow=False):
+                print(f"{row_count} 行: CSVとExcelブックで、はみ出しのレポートが異なります。")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+ベンチマーク用の架空の住所録CSVを生成する。
+
+実際の住所録に近い内容になるよう、以下を一定の割合で混ぜる (割合は引数で変更できる)。
+  * 連名 (氏名２・敬称２あり。氏名２は名前のみの場合と名字付きの場合がある)
+  * 長い建物名・部屋番号を含む住所２
+  * 半角で入力された氏名 (半角カタカナ)・住所 (半角英数字・ハイフン)
+  * ハイフンの有無が混在した郵便番号、会社宛て (御中)
+  * 同じ世帯の重複行
+出力は Shift_JIS でも書けるよう、JIS X 0208 の範囲の文字だけを使う。
+乱数のシードを固定しているため、同じ引数からは常に同じCSVが生成される。
+出力名の拡張子が .xlsx の場合は、同じ内容のExcelブックを書き出す (write_address_book_xlsx)。
+
+使い方:
+    python benchmarks/synthetic_addresses.py 10000 addresses.csv --encoding shift_jis
+    python benchmarks/synthetic_addresses.py 100000 addresses.xlsx
+"""
+import argparse
+import csv
+import random
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+FIELDNAMES = ['氏名', '氏名２', '郵便番号', '住所１', '住所２', '敬称', '敬称２']
+
+SURNAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田',
+            '佐々木', '山口', '松本', '井上', '木村', '林', '斎藤', '清水', '長谷川', '五十嵐', '勅使河原', '東']
+GIVEN_NAMES = ['太郎', '花子', '一郎', '陽子', '健', '愛', '翔太', '美咲', '大輔', '由美子', '誠', 'さくら',
+               '拓海', '結衣', '浩二', '真由美', '悠真', '陽菜', '修', '恵']
+HALFWIDTH_SURNAMES = ['ﾔﾏﾀﾞ', 'ｽｽﾞｷ', 'ﾀﾅｶ', 'ｻﾄｳ', 'ｺﾊﾞﾔｼ']
+HALFWIDTH_GIVEN_NAMES = ['ﾀﾛｳ', 'ﾊﾅｺ', 'ｹﾝ', 'ﾕｲ', 'ﾋﾛｼ']
+COMPANIES = ['株式会社山田商事', '鈴木商店', '有限会社田中工務店', 'ABC株式会社 総務部', '合同会社みらい企画']
+
+# (都道府県, 市区町村, 郵便番号の先頭3桁)
+LOCALITIES = [
+    ('東京都', '千代田区千代田', '100'), ('東京都', '世田谷区三軒茶屋', '154'), ('東京都', '八王子市元本郷町', '192'),
+    ('神奈川県', '横浜市中区山下町', '231'), ('大阪府', '大阪市中央区本町', '541'), ('愛知県', '名古屋市中区栄', '460'),
+    ('北海道', '札幌市中央区大通西', '060'), ('福岡県', '福岡市博多区博多駅前', '812'), ('京都府', '京都市中京区河原町通', '604'),
+    ('宮城県', '仙台市青葉区一番町', '980'), ('広島県', '広島市中区紙屋町', '730'), ('沖縄県', '那覇市久茂地', '900'),
+]
+BUILDINGS = ['コーポ', 'メゾン', 'ハイツ', 'グランドメゾン', 'パークハウス', 'レジデンス', 'ビル', 'タワー']
+LONG_BUILDING_WORDS = ['グランフォーレ', 'ザ・パークハウス', '中央公園前', 'ステーションフロント', 'イーストウイング',
+                       'プレミアムレジデンス', '北棟']
+
+
+def _zip_code(rng, prefix):
+    digits = prefix + f'{rng.randrange(10000):04d}'
+    roll = rng.random()
+    if roll < 0.6:
+        return f'{digits[:3]}-{digits[3:]}'
+    if roll < 0.95:
+        return digits
+    return f'〒{digits[:3]}ー{digits[3:]}'
+
+
+def _block_number(rng, halfwidth):
+    numbers = [str(rng.randint(1, 9)), str(rng.randint(1, 30)), str(rng.randint(1, 40))][:rng.choice([2, 3, 3])]
+    if halfwidth:
+        return '-'.join(numbers)
+    # 全角数字と長音記号 (ハイフンの代わりによく入力される) で入力された住所
+    return 'ー'.join(numbers).translate(str.maketrans('0123456789', '０１２３４５６７８９'))
+
+
+def _building(rng, long_building_ratio):
+    if rng.random() < long_building_ratio:
+        words = rng.sample(LONG_BUILDING_WORDS, 3)
+        return ''.join(words) + f'{rng.randint(1, 45)}{rng.randint(1, 20):02d}号室'
+    if rng.random() < 0.5:
+        return ''
+    return f'{rng.choice(SURNAMES)}{rng.choice(BUILDINGS)}{rng.randint(1, 12)}{rng.randint(1, 9):02d}'
+
+
+def generate_rows(count, seed=0, renmei_ratio=0.25, halfwidth_ratio=0.15, long_building_ratio=0.2,
+                  company_ratio=0.05, duplicate_ratio=0.02):
+    """
+    架空の住所録の行 (辞書) を count 件生成するジェネレーター。
+    各 *_ratio は、その種類の行が出現する割合 (0.0〜1.0)。
+    """
+    rng = random.Random(seed)
+    previous = None
+    for _ in range(count):
+        if previous is not None and rng.random() < duplicate_ratio:
+            yield previous
+            continue
+
+        halfwidth = rng.random() < halfwidth_ratio
+        prefecture, city, zip_prefix = rng.choice(LOCALITIES)
+        row = dict.fromkeys(FIELDNAMES, '')
+        row['郵便番号'] = _zip_code(rng, zip_prefix)
+        row['住所１'] = f'{prefecture}{city}{_block_number(rng, halfwidth)}'
+        row['住所２'] = _building(rng, long_building_ratio)
+        if halfwidth and row['住所２']:
+            row['住所２'] += f' {rng.randint(1, 9)}F'
+
+        if rng.random() < company_ratio:
+            row['氏名'] = rng.choice(COMPANIES)
+            row['敬称'] = '御中'
+        elif halfwidth:
+            surname = rng.choice(HALFWIDTH_SURNAMES)
+            row['氏名'] = f'{surname} {rng.choice(HALFWIDTH_GIVEN_NAMES)}'
+            row['敬称'] = '様'
+        else:
+            surname = rng.choice(SURNAMES)
+            row['氏名'] = f'{surname}{rng.choice([" ", "　", "  "])}{rng.choice(GIVEN_NAMES)}'
+            row['敬称'] = rng.choice(['様', '様', '様', '先生', ''])
+            if rng.random() < renmei_ratio:
+                # 連名: 名前のみ (同じ名字) か、名字付き (別の名字) のどちらか
+                if rng.random() < 0.7:
+                    row['氏名２'] = rng.choice(GIVEN_NAMES)
+                else:
+                    row['氏名２'] = f'{rng.choice(SURNAMES)} {rng.choice(GIVEN_NAMES)}'
+                row['敬称２'] = rng.choice(['様', ''])
+
+        previous = row
+        yield row
+
+
+def write_address_book(path, count, encoding='utf-8', seed=0, **ratios):
+    """generate_rows で生成した count 行の住所録を、指定したエンコーディングのCSVとして書き出す。"""
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(generate_rows(count, seed, **ratios))
+
+
+_XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XLSX_PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+# 書式1: 郵便番号の表示形式「000-0000」(数値として入力された郵便番号の先頭の0を表示する)
+_XLSX_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><styleSheet xmlns="{_XLSX_MAIN_NS}">'
+    '<numFmts count="1"><numFmt numFmtId="176" formatCode="000\\-0000"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Yu Gothic"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="176" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+def _xlsx_column(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def write_address_book_xlsx(path, count, seed=0, sheet_name='住所録', **ratios):
+    """
+    generate_rows で生成した count 行の住所録を、Excelブック (.xlsx) として書き出す。
+    Excelで保存したブックと同じく、文字列は共有文字列 (sharedStrings.xml) に格納し、
+    ハイフンの無い7桁の郵便番号は数値 (表示形式「000-0000」) として格納する。
+    シートのXMLは1行ずつZIPに書き込む (行をメモリに溜めない)。
+    """
+    strings = {}
+
+    def string_index(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    def cells(row_number, values):
+        parts = [f'<row r="{row_number}">']
+        for column, value in enumerate(values):
+            if not value:
+                continue
+            ref = f'{_xlsx_column(column)}{row_number}'
+            if column == zip_column and row_number > 1 and value.isdigit() and len(value) == 7:
+                parts.append(f'<c r="{ref}" s="1"><v>{int(value)}</v></c>')
+            else:
+                parts.append(f'<c r="{ref}" t="s"><v>{string_index(value)}</v></c>')
+        parts.append('</row>')
+        return ''.join(parts)
+
+    zip_column = FIELDNAMES.index('郵便番号')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as book:
+        book.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        book.writestr('_rels/.rels', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_XLSX_PACKAGE_REL_NS}">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'))
+        book.writestr('xl/workbook.xml', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{_XLSX_MAIN_NS}" xmlns:r="{_XLSX_REL_NS}">'
+            f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        book.writestr('xl/_rels/workbook.xml.rels', (
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_XLSX_PACKAGE_REL_NS}">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+            '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+            '</Relationships>'))
+        book.writestr('xl/styles.xml', _XLSX_STYLES)
+        with book.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{_XLSX_MAIN_NS}"><sheetData>'.encode('utf-8'))
+            sheet.write(cells(1, FIELDNAMES).encode('utf-8'))
+            for row_number, row in enumerate(generate_rows(count, seed, **ratios), 2):
+                sheet.write(cells(row_number, [escape(row[name]) for name in FIELDNAMES]).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+        with book.open('xl/sharedStrings.xml', 'w', force_zip64=True) as shared:
+            shared.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><sst xmlns="{_XLSX_MAIN_NS}" uniqueCount="{len(strings)}">'.encode('utf-8'))
+            for text in strings:
+                space = ' xml:space="preserve"' if text != text.strip() else ''
+                shared.write(f'<si><t{space}>{text}</t></si>'.encode('utf-8'))
+            shared.write(b'</sst>')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ベンチマーク用の架空の住所録CSVを生成します。')
+    parser.add_argument('rows', type=int, help='生成する行数')
+    parser.add_argument('out', help='出力するCSVファイルのパス (拡張子が .xlsx の場合はExcelブック)')
+    parser.add_argument('--encoding', default='utf-8', help='CSVのエンコーディング (utf-8 / shift_jis など、既定: utf-8)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード (既定: 0)')
+    args = parser.parse_args(argv)
+    if args.out.lower().endswith('.xlsx'):
+        write_address_book_xlsx(args.out, args.rows, args.seed)
+    else:
+        write_address_book(args.out, args.rows, args.encoding, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+ハガキの描画結果を、保存しておいた正解のページ画像 (ゴールデン) とピクセル単位で比較する回帰テスト。
+
+corpus.csv の行 (連名・敬称２・半角カタカナ・「３階」「１０２号室」のように漢数字にしない住所・不正な郵便番号・
+はみ出す住所など) を、CSVの読み込みからレイアウト・ラスタライズまで実際の処理 (CsvRowReader と
+PostcardRenderer.render_row) で描画し、CONFIGS の設定 (色モード・グリフキャッシュ・自動調整・固定レイヤー・プレビューのDPI)
+ごとに正解画像と比較する。比較は NumPy で画像全体を一度に行い、一致しないページは差分画像
+(正解を薄く表示し、増えた画素を赤、消えた画素を青で示す) と実際のページを --diff-dir に書き出す。
+
+正解画像はフォントとFreeTypeのバージョンごとに pages/ の下に保存する (文字の形が変わるため)。
+最適化などの変更を始める前に --update で記録し、変更後に引数なしで実行して一致することを確かめる。
+一致しないページがあれば終了コード1、正解画像が無ければ終了コード2で終了する。NumPyが必要。
+
+使い方:
+    python golden/check_golden.py --update   # 正解画像を記録する (変更前の状態で実行する)
+    python golden/check_golden.py            # 正解画像と比較する
+"""
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("正解画像との比較には NumPy が必要です (pip install numpy)")
+from PIL import Image, features
+
+from postcard_generator import FONT_PATH, PREVIEW_DPI, CsvRowReader, PostcardRenderer, StaticLayer
+
+GOLDEN_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(GOLDEN_DIR, 'corpus.csv')
+PAGES_DIR = os.path.join(GOLDEN_DIR, 'pages')
+DIFF_DIR = os.path.join(GOLDEN_DIR, 'diff')
+
+# (設定の名前, PostcardRenderer の引数, 比較する正解画像の名前)。
+# 正解画像の名前が同じ設定 (グリフキャッシュの有無など) は、同じページを描画しなければならない
+CONFIGS = [
+    ('rgb', {}, 'rgb'),
+    ('no_glyph_cache', {'glyph_cache_size': 0}, 'rgb'),
+    ('gray', {'color_mode': 'L'}, 'gray'),
+    ('mono', {'color_mode': '1'}, 'mono'),
+    ('auto_fit', {'auto_fit': True}, 'auto_fit'),
+    ('static_layer', {'static_layer': StaticLayer(zip_boxes=True, sender_name='差出 太郎', sender_address='東京都新宿区西新宿2-8-1',
+                                                  sender_zip_code='163-8001')}, 'static_layer'),
+    ('preview', {'dpi': PREVIEW_DPI}, 'preview'),
+]
+
+DIFF_ADDED_COLOR = (220, 0, 0) # 正解より濃くなった画素 (増えたインク)
+DIFF_REMOVED_COLOR = (0, 90, 255) # 正解より薄くなった画素 (消えたインク・色の変化)
+
+
+def golden_key(font_path):
+    """正解画像を保存するフォルダの名前 (フォントの内容とFreeTypeのバージョンごとに分ける)。"""
+    with open(font_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(font_path))[0]
+    return f"{stem}-{digest}-freetype{features.version('freetype2')}"
+
+
+def load_corpus(path=CORPUS_PATH):
+    with contextlib.redirect_stdout(io.StringIO()), CsvRowReader(path) as reader:
+        return list(reader)
+
+
+def _pixels(image):
+    """比較用の画素の配列 (uint8)。白黒2値の画像は 0/255 にする。"""
+    if image.mode == '1':
+        image = image.convert('L')
+    return np.asarray(image)
+
+
+def compare_pages(actual, golden, tolerance=0):
+    """
+    2枚のページを比較し、値の差が tolerance を超える画素を True とした配列を返す。
+    大きさや色モードが異なる場合は None を返す。
+    """
+    if actual.size != golden.size or actual.mode != golden.mode:
+        return None
+    actual_pixels = _pixels(actual)
+    golden_pixels = _pixels(golden)
+    # ほとんどのページは完全に一致するため、まず配列全体を一度に比較する
+    if np.array_equal(actual_pixels, golden_pixels):
+        return np.zeros(actual_pixels.shape[:2], dtype=bool)
+    delta = np.abs(actual_pixels.astype(np.int16) - golden_pixels)
+    if delta.ndim == 3:
+        # max(axis=2) より、チャンネルごとのビューの最大値の方が速い
+        delta = np.maximum.reduce([delta[:, :, channel] for channel in range(delta.shape[2])])
+    return delta > tolerance
+
+
+def diff_image(actual, golden, mask):
+    """正解を薄く表示し、mask の画素のうち濃くなったものを赤、薄くなったものを青で示した差分画像。"""
+    golden_gray = _pixels(golden.convert('L')).astype(np.int16)
+    actual_gray = _pixels(actual.convert('L')).astype(np.int16)
+    faded = (255 - (255 - golden_gray) // 4).astype(np.uint8)
+    out = np.repeat(faded[:, :, None], 3, axis=2)
+    out[mask & (actual_gray < golden_gray)] = DIFF_ADDED_COLOR
+    out[mask & (actual_gray >= golden_gray)] = DIFF_REMOVED_COLOR
+    return Image.fromarray(out, 'RGB')
+
+
+def _bounding_box(mask):
+    ys, xs = np.nonzero(mask)
+    return int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())
+
+
+def render_pages(renderer_options, font_path, rows):
+    """設定ごとのレンダラーで全ての行を描画したページのリスト。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        renderer = PostcardRenderer(font_path=font_path, **renderer_options)
+    return [renderer.render_row(row) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ハガキの描画結果を正解画像と比較します。')
+    parser.add_argument('--update', action='store_true', help='現在の描画結果を正解画像として記録する')
+    parser.add_argument('--font', default=FONT_PATH, help='使用するフォントファイル')
+    parser.add_argument('--config', action='append', choices=[name for name, _, _ in CONFIGS],
+                        help='比較する設定 (複数指定可、既定: 全て)')
+    parser.add_argument('--tolerance', type=int, default=0, help='同じとみなす画素の値の差 (既定: 0、完全に一致)')
+    parser.add_argument('--max-pixels', type=int, default=0, help='1ページで異なってもよい画素の数 (既定: 0)')
+    parser.add_argument('--diff-dir', default=DIFF_DIR, help=f'差分画像の出力先 (既定: {os.path.relpath(DIFF_DIR)})')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = load_corpus()
+    golden_dir = os.path.join(PAGES_DIR, golden_key(args.font))
+    if not args.update and not os.path.isdir(golden_dir):
+        print(f"このフォントとFreeTypeの正解画像がありません: {golden_dir}")
+        print("変更前の状態で --update を指定して実行し、正解画像を記録してください。")
+        return 2
+    for old in glob.glob(os.path.join(args.diff_dir, '*.png')):
+        os.remove(old)
+
+    recorded = {} # この実行で記録した正解画像 (同じ正解画像を使う設定は、記録したページと比較する)
+    compared = failed = 0
+    for name, options, golden_name in CONFIGS:
+        if args.config and name not in args.config:
+            continue
+        pages = render_pages(options, args.font, rows)
+        page_dir = os.path.join(golden_dir, golden_name)
+        if args.update and golden_name not in recorded:
+            os.makedirs(page_dir, exist_ok=True)
+            for old in glob.glob(os.path.join(page_dir, '*.png')):
+                os.remove(old)
+            for number, page in enumerate(pages, 1):
+                page.save(os.path.join(page_dir, f'{number:02d}.png'))
+            recorded[golden_name] = pages
+            print(f"{name}: {len(pages)} 枚の正解画像を記録しました ({os.path.relpath(page_dir)})")
+            continue
+
+        golden_count = len(glob.glob(os.path.join(page_dir, '*.png')))
+        if golden_name not in recorded and golden_count != len(pages):
+            print(f"{name}: 正解画像の枚数 ({golden_count}) が corpus.csv の行数 ({len(pages)}) と異なります。--update で記録し直してください。")
+            failed += 1
+            continue
+        mismatched = 0
+        for number, (row, page) in enumerate(zip(rows, pages), 1):
+            if golden_name in recorded:
+                golden = recorded[golden_name][number - 1]
+            else:
+                golden = Image.open(os.path.join(page_dir, f'{number:02d}.png'))
+                golden.load()
+            compared += 1
+            mask = compare_pages(page, golden, args.tolerance)
+            if mask is not None and int(mask.sum()) <= args.max_pixels:
+                continue
+            mismatched += 1
+            os.makedirs(args.diff_dir, exist_ok=True)
+            prefix = os.path.join(args.diff_dir, f'{name}_{number:02d}')
+            page.save(prefix + '_actual.png')
+            if mask is None:
+                print(f"  {name} {number:02d} ({row.get('説明', '')}): 大きさか色モードが異なります "
+                      f"({page.size} {page.mode} / 正解 {golden.size} {golden.mode})")
+                continue
+            diff_image(page, golden, mask).save(prefix + '_diff.png')
+            print(f"  {name} {number:02d} ({row.get('説明', '')}): {int(mask.sum())} 画素が異なります "
+                  f"(範囲 {_bounding_box(mask)}) → {os.path.relpath(prefix)}_diff.png")
+        failed += mismatched
+        print(f"{name}: {len(pages) - mismatched}/{len(pages)} 枚が一致しました。")
+
+    elapsed = time.perf_counter() - start
+    if failed:
+        print(f"\n正解画像と一致しないページが {failed} 枚あります ({compared} 枚を比較、{elapsed:.2f} 秒)。")
+        return 1
+    print(f"\n全てのページが正解画像と一致しました ({compared} 枚を比較、{elapsed:.2f} 秒)。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
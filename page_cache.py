@@ -0,0 +1,133 @@
+"""
+圧縮済みのページ (EncodedPage) をディスクに保存し、次回以降の実行で再利用するページキャッシュ。
+
+住所録の一部だけを修正して再生成する場合、変更のない行は前回と全く同じページになる。
+ページは内容から計算したキー (ハッシュ値) で保存するため、行の順番が変わったり
+行が追加・削除されたりしても、変更のない行はラスタライズも圧縮もせずに再利用できる。
+キーの計算方法はキャッシュを使う側 (PostcardRenderer) が決める。
+
+ディレクトリの合計サイズには上限があり、超えた場合は最後に使われた時刻
+(ファイルの更新時刻) が古いものから削除する (LRU)。
+"""
+import json
+import os
+import tempfile
+
+from pdf_writer import EncodedPage
+
+PAGE_CACHE_DEFAULT_MAX_MB = 2048 # キャッシュディレクトリの既定の上限サイズ (MB)
+PAGE_CACHE_SUFFIX = '.page'
+
+
+class PageCache:
+    """
+    キーごとに1ファイルとしてページを保存するディスクキャッシュ。
+    ファイルは先頭1行がページ情報のJSON、その後に圧縮済みの画像データが続く形式。
+    hits / misses にこのインスタンスでのヒット数・ミス数を記録する。
+    """
+
+    def __init__(self, cache_dir, max_bytes=PAGE_CACHE_DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._scan())
+
+    def _path(self, key):
+        # 1つのディレクトリにファイルが集中しないよう、キーの先頭2文字でサブディレクトリに分ける
+        return os.path.join(self.cache_dir, key[:2], key + PAGE_CACHE_SUFFIX)
+
+    def _scan(self):
+        """キャッシュディレクトリ内の (パス, 最終使用時刻, サイズ) を列挙する。"""
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir():
+                continue
+            for page_entry in os.scandir(entry.path):
+                if page_entry.name.endswith(PAGE_CACHE_SUFFIX):
+                    stat = page_entry.stat()
+                    yield page_entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """
+        キーに対応するページを読み込む。ヒットした場合は最終使用時刻を更新する。
+        Returns the EncodedPage, or None if the key is not cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                data = f.read()
+        except (OSError, ValueError):
+            # 存在しないか、書き込み途中で壊れたファイルはミスとして扱う
+            self.misses += 1
+            return None
+
+        if len(data) != header['size']:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return EncodedPage(header['width'], header['height'], header['color_space'], header['bits'],
+                           header['filter'], data, header['decode_parms'])
+
+    def put(self, key, page):
+        """ページを保存する。上限サイズを超えた場合は古いページを削除する。"""
+        path = self._path(key)
+        header = {
+            'width': page.width, 'height': page.height, 'color_space': page.color_space, 'bits': page.bits,
+            'filter': page.filter, 'decode_parms': page.decode_parms, 'size': len(page.data),
+        }
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # 途中で中断されても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(header).encode('ascii') + b'\n')
+                f.write(page.data)
+                size = f.tell()
+            # 同じキーを保存し直す場合 (削除された後の再描画や、同時に実行している別のジョブ) は、
+            # 置き換える前のファイルの分を合計から引き、二重に数えないようにする
+            try:
+                replaced_size = os.path.getsize(path)
+            except OSError:
+                replaced_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.total_bytes += size - replaced_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """最終使用時刻が古いページから削除し、合計サイズを上限の9割以下にする。"""
+        entries = sorted(self._scan(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self.total_bytes = total
+
+    def summary(self):
+        """ヒット数・ミス数をまとめた文字列を返す。"""
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        text = f"ページキャッシュ: ヒット {self.hits} 枚 / ミス {self.misses} 枚 (ヒット率 {rate:.1f}%)"
+        if self.evictions:
+            text += f"、古いページを {self.evictions} 枚削除"
+        return text
@@ -0,0 +1,736 @@
+"""
+ハガキ画像を1ページずつPDFファイルへ書き出すストリーミングライター。
+
+Pillowの save(save_all=True) は全ページの画像をメモリ上に保持してから書き出すため、
+ページ数に比例してメモリを消費する。このライターは各ページを描画直後に圧縮して
+ファイルへ書き出し、クローズ時にページツリーと相互参照表 (xref) を追記する。
+保持するのはオブジェクトのオフセットとページ番号だけなので、
+ページ数が増えてもメモリ使用量はほぼ一定になる。
+同じ理由で、書き出しの途中の状態 (checkpoint) も小さく、中断した処理はその時点から再開 (resume) できる。
+
+ベクター出力では、各文字をPDFのテキストとして配置し、使用したグリフだけを含む
+サブセットフォントを文書全体で一度だけ埋め込む (EmbeddedFont, fontToolsが必要)。
+"""
+import hashlib
+import io
+import math
+import os
+import zlib
+from array import array
+from collections import namedtuple
+
+# 圧縮済みのページ画像。ワーカープロセスから親プロセスへ渡すこともできる。
+# color_space: 'DeviceRGB' / 'DeviceGray'
+# filter: 'DCTDecode' (JPEG) / 'FlateDecode' / 'CCITTFaxDecode' など、PDFのストリームフィルタ名
+# decode_parms: フィルタに渡すパラメータ (PDFの辞書の文字列、不要な場合はNone)
+EncodedPage = namedtuple(
+    'EncodedPage', ['width', 'height', 'color_space', 'bits', 'filter', 'data', 'decode_parms'],
+    defaults=[None]
+)
+
+# 面付け (ImposedPdfWriter) の設定
+MM_TO_PT = 72.0 / 25.4
+A4_SIZE_MM = (210, 297) # (幅, 高さ)
+CROP_MARK_LENGTH_MM = 5 # トンボの線の長さ
+CROP_MARK_OFFSET_MM = 1 # 裁ち線からトンボまでの間隔
+MIN_CROP_MARK_LENGTH_MM = 1 # 余白がこれより狭い辺にはトンボを描かない
+CROP_MARK_LINE_WIDTH_PT = 0.25
+
+# 分割出力 (ShardedPdfWriter) でサイズの上限を判定するときに、クローズ時に追記する
+# ページツリーと相互参照表の分として見込むバイト数 (固定分 + ハガキ1枚あたり)
+SHARD_CLOSE_RESERVE_BYTES = 4096
+SHARD_CLOSE_RESERVE_PER_CARD = 96
+
+
+def encode_page(image):
+    """
+    PIL画像をPDFに埋め込める形式に圧縮し、EncodedPage を返す。
+    - 'RGB': Pillowのsave(format='PDF')と同じくJPEGの既定品質で圧縮する
+    - 'L'  : グレースケールのままFlate (zlib) で可逆圧縮する
+    - '1'  : 1ピクセル1ビットのまま、CCITT G4 (libtiffが無い場合はFlate) で圧縮する
+    """
+    width, height = image.size
+    if image.mode == '1':
+        return _encode_bilevel(image)
+    if image.mode == 'L':
+        return EncodedPage(width, height, 'DeviceGray', 8, 'FlateDecode', zlib.compress(image.tobytes()))
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return EncodedPage(width, height, 'DeviceRGB', 8, 'DCTDecode', buffer.getvalue())
+
+
+def _encode_bilevel(image):
+    """白黒2値の画像をFAX用のCCITT G4で圧縮する。libtiffが使えない場合はFlateで圧縮する。"""
+    from PIL import Image, features
+
+    width, height = image.size
+    if not features.check('libtiff'):
+        # PILの '1' モードは1ビット=白なので、DeviceGray の1ビット画像としてそのまま使える
+        return EncodedPage(width, height, 'DeviceGray', 1, 'FlateDecode', zlib.compress(image.tobytes()))
+
+    # 1つのストリップにまとめたG4圧縮のTIFFを作成し、そのストリップのデータだけを取り出す
+    buffer = io.BytesIO()
+    image.save(buffer, 'TIFF', compression='group4', strip_size=math.ceil(width / 8) * height)
+    buffer.seek(0)
+    with Image.open(buffer) as tiff:
+        offset = tiff.tag_v2[273][0] # StripOffsets
+        length = tiff.tag_v2[279][0] # StripByteCounts
+    data = buffer.getvalue()[offset:offset + length]
+    decode_parms = f'<< /K -1 /Columns {width} /Rows {height} /BlackIs1 true >>'
+    return EncodedPage(width, height, 'DeviceGray', 1, 'CCITTFaxDecode', data, decode_parms)
+
+
+class StreamingPdfWriter:
+    """
+    ページを追加するたびにファイルへ書き出すPDFライター。
+    with文で使用するか、最後に必ず close() を呼び出すこと。
+    最初のページが追加されるまでファイルは作成しない。
+    path にはファイルのパスの代わりに、書き込み可能なバイナリのストリーム (HTTPのレスポンスなど) も指定できる。
+    ストリームは close() でも閉じない。
+    """
+
+    # オブジェクト番号1はカタログ、2はページツリーとして予約しておき、
+    # 各ページは親 (2 0 R) を参照できるようにする。
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, path, resolution=300):
+        self.path = path
+        self.resolution = resolution
+        self._fp = None
+        self._offset = 0
+        self._object_offsets = array('q', [0, 0, 0]) # 0番は未使用、1と2は予約
+        self._page_ids = array('q')
+        self._fonts = []
+
+    @property
+    def page_count(self):
+        """書き出し済みのページ数。"""
+        return len(self._page_ids)
+
+    @property
+    def card_count(self):
+        """書き出し済みのハガキの枚数。このライターでは1ページが1枚。"""
+        return len(self._page_ids)
+
+    @property
+    def bytes_written(self):
+        """ここまでに書き出したバイト数 (クローズ時に追記するページツリーなどは含まない)。"""
+        return self._offset
+
+    @property
+    def paths(self):
+        """書き出したPDFファイルのパスのリスト。"""
+        return [self.path] if self._offset else []
+
+    def card_writer(self, size_hint=0):
+        """
+        次のハガキを書き出すライターを返す。フォントや背景画像はこのライターに登録する。
+        分割出力 (ShardedPdfWriter) では、ファイルが切り替わるとフォントなども登録し直す必要がある。
+        """
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._offset += len(data)
+
+    def _open(self):
+        self._fp = self.path if hasattr(self.path, 'write') else open(self.path, 'wb')
+        # バイナリを含むことを示すコメント行もヘッダーに付ける
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _new_object_id(self):
+        self._object_offsets.append(0)
+        return len(self._object_offsets) - 1
+
+    def _write_object(self, object_id, dictionary, stream=None):
+        """オブジェクトを書き出し、そのオフセットを記録する。"""
+        self._object_offsets[object_id] = self._offset
+        if stream is None:
+            self._write(b'%d 0 obj\n%s\nendobj\n' % (object_id, dictionary.encode('ascii')))
+        else:
+            self._write(b'%d 0 obj\n<< %s /Length %d >>\nstream\n' % (object_id, dictionary.encode('ascii'), len(stream)))
+            self._write(stream)
+            self._write(b'\nendstream\nendobj\n')
+
+    def add_page(self, image):
+        """PIL画像を1ページとして圧縮し、書き出す。"""
+        self.add_encoded_page(encode_page(image))
+
+    def add_image(self, page):
+        """
+        圧縮済みの画像 (EncodedPage) を画像オブジェクトとして書き出し、そのオブジェクト番号を返す。
+        複数のページから共通の背景画像として参照できる。
+        """
+        if self._fp is None:
+            self._open()
+        image_id = self._new_object_id()
+        self._write_object(
+            image_id,
+            f'/Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} '
+            f'/ColorSpace /{page.color_space} /BitsPerComponent {page.bits} /Filter /{page.filter}'
+            + (f' /DecodeParms {page.decode_parms}' if page.decode_parms else ''),
+            page.data
+        )
+        return image_id
+
+    def add_encoded_page(self, page):
+        """圧縮済みのページ (EncodedPage) を1ページとして書き出す。"""
+        image_id = self.add_image(page)
+
+        # ページサイズはポイント (1/72インチ) 単位
+        width_pt = page.width * 72.0 / self.resolution
+        height_pt = page.height * 72.0 / self.resolution
+
+        content = f'q {width_pt:.4f} 0 0 {height_pt:.4f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        procset = '/ImageC' if page.color_space == 'DeviceRGB' else '/ImageB'
+        self._write_page(
+            width_pt, height_pt, content,
+            f'<< /XObject << /Im0 {image_id} 0 R >> /ProcSet [/PDF {procset}] >>'
+        )
+
+    def embed_font(self, path):
+        """
+        ベクター出力用のフォントを登録し、EmbeddedFont を返す。
+        フォント本体は close() の時点で、使用したグリフだけのサブセットとして一度だけ書き出す。
+        """
+        font = EmbeddedFont(path, self._new_object_id())
+        self._fonts.append(font)
+        return font
+
+    def add_text_page(self, width_px, height_px, glyphs, font, color=(0, 0, 0), background_id=None):
+        """
+        文字をPDFのテキストとして配置した1ページを書き出す。
+        glyphs には (フォントサイズ[px], X座標[px], ベースラインのY座標[px], 文字) を並べる。
+        座標はページ左上を原点とするピクセル単位で、resolution を基準にポイントへ変換する。
+        background_id に add_image() の戻り値を指定すると、その画像をページ全体に敷く。
+        """
+        width_pt, height_pt, content, resources = self._text_content(width_px, height_px, glyphs, font, color, background_id)
+        self._write_page(width_pt, height_pt, content, resources, content_filter='FlateDecode')
+
+    def add_text_form(self, width_px, height_px, glyphs, font, color=(0, 0, 0), background_id=None):
+        """
+        add_text_page と同じ内容を、ページではなくフォームXObjectとして書き出し、そのオブジェクト番号を返す。
+        面付け (ImposedPdfWriter) で、1枚の用紙に複数のハガキを配置するために使う。
+        """
+        width_pt, height_pt, content, resources = self._text_content(width_px, height_px, glyphs, font, color, background_id)
+        form_id = self._new_object_id()
+        self._write_object(
+            form_id,
+            f'/Type /XObject /Subtype /Form /BBox [0 0 {width_pt:.4f} {height_pt:.4f}] '
+            f'/Resources {resources} /Filter /FlateDecode',
+            content
+        )
+        return form_id
+
+    def _text_content(self, width_px, height_px, glyphs, font, color, background_id):
+        """テキストのページ (またはフォーム) の (幅[pt], 高さ[pt], 圧縮済みのコンテンツ, リソース辞書) を作る。"""
+        if self._fp is None:
+            self._open()
+
+        scale = 72.0 / self.resolution
+        width_pt = width_px * scale
+        height_pt = height_px * scale
+
+        operations = []
+        if background_id is not None:
+            operations.append(f'q {width_pt:.4f} 0 0 {height_pt:.4f} 0 0 cm /Bg Do Q')
+        operations.append('BT {:.4f} {:.4f} {:.4f} rg'.format(*(c / 255 for c in color)))
+        current_size = None
+        for size_px, x_px, baseline_px, char in glyphs:
+            if size_px != current_size:
+                operations.append(f'/F0 {size_px * scale:.4f} Tf')
+                current_size = size_px
+            operations.append(f'1 0 0 1 {x_px * scale:.4f} {height_pt - baseline_px * scale:.4f} Tm <{font.glyph_code(char):04X}> Tj')
+        operations.append('ET')
+        content = zlib.compress('\n'.join(operations).encode('ascii'))
+
+        resources = f'<< /Font << /F0 {font.object_id} 0 R >>'
+        if background_id is not None:
+            resources += f' /XObject << /Bg {background_id} 0 R >> /ProcSet [/PDF /Text /ImageC] >>'
+        else:
+            resources += ' /ProcSet [/PDF /Text] >>'
+        return width_pt, height_pt, content, resources
+
+    def _write_page(self, width_pt, height_pt, content, resources, content_filter=None):
+        """コンテンツストリームとページオブジェクトを書き出す。"""
+        contents_id = self._new_object_id()
+        self._write_object(contents_id, f'/Filter /{content_filter}' if content_filter else '', content)
+
+        page_id = self._new_object_id()
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {width_pt:.4f} {height_pt:.4f}] '
+            f'/Resources {resources} /Contents {contents_id} 0 R >>'
+        )
+        self._page_ids.append(page_id)
+
+    def checkpoint(self):
+        """
+        ここまでに書き出した内容をディスクに書き込み、resume() で書き出しを再開するための状態 (JSONにできる辞書) を返す。
+        ファイルのパスに書き出す場合だけ使える。ベクター出力のフォントは close() の時点で書き出すため、再開できない。
+        """
+        if self._fonts:
+            raise ValueError("ベクター出力のPDFは、途中から再開できません。")
+        if self._fp is not None:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+        return {'offset': self._offset, 'object_offsets': self._object_offsets.tolist(), 'page_ids': self._page_ids.tolist()}
+
+    def resume(self, state):
+        """
+        checkpoint() の状態から書き出しを再開する。
+        ファイルはその時点の長さに切り詰めるため、その後に書き出したページや相互参照表は取り除かれる。
+        """
+        offset = state['offset']
+        if not offset:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except (OSError, TypeError):
+            size = -1
+        if size < offset:
+            raise ValueError(f"途中まで書き出したPDFファイルが見つからないか、チェックポイントの時点より短いため再開できません: {self.path}")
+        self._fp = open(self.path, 'r+b')
+        self._fp.truncate(offset)
+        self._fp.seek(offset)
+        self._offset = offset
+        self._object_offsets = array('q', state['object_offsets'])
+        self._page_ids = array('q', state['page_ids'])
+
+    def close(self):
+        """ページツリーと相互参照表を書き出してファイルを閉じる。"""
+        if self._fp is None:
+            return
+        try:
+            for font in self._fonts:
+                font.write(self)
+
+            kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+            self._write_object(self.PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>')
+            self._write_object(self.CATALOG_ID, f'<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>')
+
+            xref_offset = self._offset
+            object_count = len(self._object_offsets)
+            self._write(b'xref\n0 %d\n0000000000 65535 f \n' % object_count)
+            for object_id in range(1, object_count):
+                self._write(b'%010d 00000 n \n' % self._object_offsets[object_id])
+            self._write(
+                b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                % (object_count, self.CATALOG_ID, xref_offset)
+            )
+        finally:
+            if self._fp is not self.path:
+                self._fp.close()
+            self._fp = None
+
+
+class ImposedPdfWriter:
+    """
+    複数のハガキを1枚の用紙 (A4など) に面付けして書き出すライター。
+    ハガキは画像 (またはフォームXObject) としてすぐに書き出し、用紙が埋まった時点で
+    それらを並べたページとトンボ (裁ち落としの位置を示す線) を書き出す。
+    保持するのは配置待ちのオブジェクト番号だけなので、面付けしてもメモリ使用量は増えない。
+    """
+
+    def __init__(self, writer, cards_per_sheet, sheet_size_mm=A4_SIZE_MM):
+        self.writer = writer
+        self.cards_per_sheet = cards_per_sheet
+        self.sheet_size_mm = sheet_size_mm
+        self.card_count = 0
+        self._pending = [] # (XObjectの番号, 画像ならTrue)
+        self._layout = None
+        self._card_size_pt = None
+
+    @property
+    def page_count(self):
+        return self.writer.page_count
+
+    @property
+    def bytes_written(self):
+        return self.writer.bytes_written
+
+    @property
+    def paths(self):
+        return self.writer.paths
+
+    def card_writer(self, size_hint=0):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_image(self, page):
+        return self.writer.add_image(page)
+
+    def embed_font(self, path):
+        return self.writer.embed_font(path)
+
+    def add_page(self, image):
+        self.add_encoded_page(encode_page(image))
+
+    def add_encoded_page(self, page):
+        """圧縮済みのページ (EncodedPage) を1枚のハガキとして配置する。"""
+        scale = 72.0 / self.writer.resolution
+        self._add_card(self.writer.add_image(page), True, (page.width * scale, page.height * scale))
+
+    def add_text_page(self, width_px, height_px, glyphs, font, color=(0, 0, 0), background_id=None):
+        """StreamingPdfWriter.add_text_page と同じ引数のテキストのハガキを配置する。"""
+        form_id = self.writer.add_text_form(width_px, height_px, glyphs, font, color, background_id)
+        scale = 72.0 / self.writer.resolution
+        self._add_card(form_id, False, (width_px * scale, height_px * scale))
+
+    def _add_card(self, xobject_id, is_image, card_size_pt):
+        if self._layout is None:
+            self._card_size_pt = card_size_pt
+            self._layout = impose_layout(card_size_pt, self.cards_per_sheet, self.sheet_size_mm)
+        self._pending.append((xobject_id, is_image))
+        self.card_count += 1
+        if len(self._pending) >= self.cards_per_sheet:
+            self._write_sheet()
+
+    def _write_sheet(self):
+        """配置待ちのハガキを1枚の用紙に並べて書き出す。"""
+        sheet_width, sheet_height, positions, marks = self._layout
+        card_width, card_height = self._card_size_pt
+        operations = []
+        xobjects = []
+        for i, ((xobject_id, is_image), (x, y)) in enumerate(zip(self._pending, positions)):
+            if is_image:
+                # 画像は1x1の正方形なので、ハガキの大きさに拡大する
+                operations.append(f'q {card_width:.4f} 0 0 {card_height:.4f} {x:.4f} {y:.4f} cm /C{i} Do Q')
+            else:
+                operations.append(f'q 1 0 0 1 {x:.4f} {y:.4f} cm /C{i} Do Q')
+            xobjects.append(f'/C{i} {xobject_id} 0 R')
+
+        operations.append(f'q 0 G {CROP_MARK_LINE_WIDTH_PT} w')
+        for x1, y1, x2, y2 in marks:
+            operations.append(f'{x1:.4f} {y1:.4f} m {x2:.4f} {y2:.4f} l S')
+        operations.append('Q')
+
+        resources = f'<< /XObject << {" ".join(xobjects)} >> /ProcSet [/PDF /Text /ImageC /ImageB] >>'
+        self.writer._write_page(sheet_width, sheet_height, '\n'.join(operations).encode('ascii'), resources)
+        self._pending = []
+
+    def checkpoint(self):
+        """StreamingPdfWriter.checkpoint と同じ。配置待ちのハガキ (書き出し済みのXObject) の番号も含める。"""
+        return {'document': self.writer.checkpoint(), 'card_count': self.card_count,
+                'pending': self._pending, 'card_size_pt': self._card_size_pt}
+
+    def resume(self, state):
+        self.writer.resume(state['document'])
+        self.card_count = state['card_count']
+        self._pending = [tuple(card) for card in state['pending']]
+        if state['card_size_pt'] is not None:
+            self._card_size_pt = tuple(state['card_size_pt'])
+            self._layout = impose_layout(self._card_size_pt, self.cards_per_sheet, self.sheet_size_mm)
+
+    def close(self):
+        """最後の用紙 (ハガキが足りない場合も) を書き出してファイルを閉じる。"""
+        if self._pending:
+            self._write_sheet()
+        self.writer.close()
+
+
+def impose_layout(card_size_pt, cards_per_sheet, sheet_size_mm=A4_SIZE_MM):
+    """
+    用紙にハガキを cards_per_sheet 枚並べる配置を求める。
+    用紙の縦向き・横向きと列数・行数の組み合わせのうち、余白 (トンボを描く場所) が最も広くなるものを選び、
+    ハガキは隙間なく並べて用紙の中央に置く。
+    Returns (sheet width, sheet height, [(x, y) of each card's lower-left corner], [crop mark lines]) in points.
+    """
+    card_width, card_height = card_size_pt
+    best = None
+    for width_mm, height_mm in (sheet_size_mm, sheet_size_mm[::-1]):
+        sheet_width, sheet_height = width_mm * MM_TO_PT, height_mm * MM_TO_PT
+        for columns in range(1, cards_per_sheet + 1):
+            if cards_per_sheet % columns:
+                continue
+            rows = cards_per_sheet // columns
+            margin_x = (sheet_width - columns * card_width) / 2
+            margin_y = (sheet_height - rows * card_height) / 2
+            if margin_x < 0 or margin_y < 0:
+                continue
+            if best is None or min(margin_x, margin_y) > best[0]:
+                best = (min(margin_x, margin_y), sheet_width, sheet_height, columns, rows, margin_x, margin_y)
+    if best is None:
+        raise ValueError(f"{cards_per_sheet} 枚のハガキを {sheet_size_mm[0]}x{sheet_size_mm[1]}mm の用紙に配置できません。")
+
+    _, sheet_width, sheet_height, columns, rows, margin_x, margin_y = best
+    # 左上から右へ、上の段から下の段へ並べる (PDFの座標は左下が原点)
+    positions = [
+        (margin_x + column * card_width, sheet_height - margin_y - (row + 1) * card_height)
+        for row in range(rows) for column in range(columns)
+    ]
+
+    # トンボ: 各裁ち線の延長上、余白の中に短い線を引く (余白が狭すぎる辺には引かない)
+    offset = CROP_MARK_OFFSET_MM * MM_TO_PT
+    marks = []
+    length_x = min(CROP_MARK_LENGTH_MM * MM_TO_PT, margin_x - offset)
+    length_y = min(CROP_MARK_LENGTH_MM * MM_TO_PT, margin_y - offset)
+    top = sheet_height - margin_y
+    right = sheet_width - margin_x
+    if length_y >= MIN_CROP_MARK_LENGTH_MM * MM_TO_PT:
+        for column in range(columns + 1):
+            x = margin_x + column * card_width
+            marks.append((x, top + offset, x, top + offset + length_y))
+            marks.append((x, margin_y - offset, x, margin_y - offset - length_y))
+    if length_x >= MIN_CROP_MARK_LENGTH_MM * MM_TO_PT:
+        for row in range(rows + 1):
+            y = margin_y + row * card_height
+            marks.append((margin_x - offset, y, margin_x - offset - length_x, y))
+            marks.append((right + offset, y, right + offset + length_x, y))
+    return sheet_width, sheet_height, positions, marks
+
+
+class ShardedPdfWriter:
+    """
+    ハガキを一定の枚数またはファイルサイズごとに別のPDFファイルへ分けて書き出すライター。
+    ファイル名は「元のファイル名_001.pdf」「元のファイル名_002.pdf」… となる。
+    ベクター出力ではフォントをファイルを閉じる時点で埋め込むため、サイズの上限は目安になる。
+    各ファイルは上限に達した時点で閉じるため、残りを処理している間にも印刷やアップロードに使える。
+    document_factory(パス) には StreamingPdfWriter または ImposedPdfWriter を作る関数を指定する。
+    """
+
+    def __init__(self, path, document_factory, max_cards=None, max_bytes=None):
+        self.base, ext = os.path.splitext(path)
+        self.ext = ext or '.pdf'
+        self.document_factory = document_factory
+        self.max_cards = max_cards
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.card_count = 0
+        self.page_count = 0
+        self._current = None
+        self._last_card_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def bytes_written(self):
+        return self._current.bytes_written if self._current is not None else 0
+
+    def card_writer(self, size_hint=0):
+        """
+        次のハガキを書き出すファイルのライターを返す。
+        枚数の上限に達しているか、size_hint バイトのハガキを追加するとサイズの上限を超える場合は、
+        現在のファイルを閉じて次のファイルを開始する。size_hint を省略した場合は直前のハガキの大きさで見積もる。
+        """
+        current = self._current
+        if current is not None and current.card_count > 0:
+            size = size_hint or self._last_card_bytes
+            reserve = SHARD_CLOSE_RESERVE_BYTES + SHARD_CLOSE_RESERVE_PER_CARD * (current.card_count + 1)
+            if ((self.max_cards and current.card_count >= self.max_cards)
+                    or (self.max_bytes and current.bytes_written + size + reserve > self.max_bytes)):
+                self._close_current()
+                current = None
+        if current is None:
+            path = f'{self.base}_{len(self.paths) + 1:03d}{self.ext}'
+            self.paths.append(path)
+            current = self._current = self.document_factory(path)
+        return current
+
+    def add_page(self, image):
+        self.add_encoded_page(encode_page(image))
+
+    def add_encoded_page(self, page):
+        """圧縮済みのページ (EncodedPage) を1枚のハガキとして書き出す。"""
+        writer = self.card_writer(len(page.data))
+        before = writer.bytes_written
+        writer.add_encoded_page(page)
+        self._card_written(writer, before)
+
+    def add_text_page(self, *args, **kwargs):
+        """
+        テキストのハガキを書き出す。フォントと背景画像は card_writer() で取得したライターに
+        登録したものを指定すること (ファイルごとに登録し直す必要がある)。
+        """
+        writer = self._current
+        before = writer.bytes_written
+        writer.add_text_page(*args, **kwargs)
+        self._card_written(writer, before)
+
+    def _card_written(self, writer, before):
+        self.card_count += 1
+        self._last_card_bytes = writer.bytes_written - before
+
+    def checkpoint(self):
+        """StreamingPdfWriter.checkpoint と同じ。閉じたファイルはそのまま残し、書き出し中のファイルの状態を含める。"""
+        return {'paths': self.paths, 'card_count': self.card_count, 'page_count': self.page_count,
+                'last_card_bytes': self._last_card_bytes,
+                'current': self._current.checkpoint() if self._current is not None else None}
+
+    def resume(self, state):
+        self.paths = list(state['paths'])
+        self.card_count = state['card_count']
+        self.page_count = state['page_count']
+        self._last_card_bytes = state['last_card_bytes']
+        if state['current'] is not None:
+            self._current = self.document_factory(self.paths[-1])
+            self._current.resume(state['current'])
+
+    def _close_current(self):
+        self._current.close()
+        self.page_count += self._current.page_count
+        self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._close_current()
+
+
+class EmbeddedFont:
+    """
+    PDFに埋め込むTrueTypeフォント (Type0 / CIDFontType2, Identity-H)。
+    ページに書き出す文字コードには元フォントのグリフ番号 (GID) をそのまま使い、
+    使用したグリフの一覧を記録しておく。close時にそのグリフだけを含むサブセットを作成し、
+    CIDToGIDMap で元のGIDからサブセット後のGIDへ対応付ける。
+    これにより、ページを書き出した後でもサブセットの内容を確定できる。
+    """
+
+    def __init__(self, path, object_id):
+        try:
+            from fontTools.ttLib import TTFont
+        except ImportError as e:
+            raise ImportError("ベクター出力には fontTools が必要です (pip install fonttools)") from e
+
+        self.path = path
+        self.object_id = object_id
+        self._ttfont = TTFont(path, lazy=True)
+        if 'glyf' not in self._ttfont:
+            raise ValueError(f"ベクター出力はTrueTypeアウトラインのフォントのみ対応しています: {path}")
+        self._cmap = self._ttfont.getBestCmap()
+        self._codes = {} # 文字 -> GID
+        self._used = {} # GID -> 文字 (ToUnicode用)
+
+    def glyph_code(self, char):
+        """文字に対応するGIDを返し、使用したグリフとして記録する。"""
+        gid = self._codes.get(char)
+        if gid is None:
+            glyph_name = self._cmap.get(ord(char))
+            gid = self._ttfont.getGlyphID(glyph_name) if glyph_name else 0
+            self._codes[char] = gid
+            self._used.setdefault(gid, char)
+        return gid
+
+    def _subset(self):
+        """使用したグリフだけを含むサブセットを作成し、(フォントデータ, {元GID: 新GID}) を返す。"""
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+
+        font = TTFont(self.path)
+        glyph_order = font.getGlyphOrder()
+        options = subset.Options()
+        options.notdef_outline = True
+        options.hinting = False
+        options.layout_features = []
+        options.name_IDs = ['*']
+        options.drop_tables += ['GSUB', 'GPOS', 'GDEF', 'BASE', 'vhea', 'vmtx', 'DSIG']
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(gids=sorted(self._used))
+        subsetter.subset(font)
+
+        gid_map = {gid: font.getGlyphID(glyph_order[gid]) for gid in self._used}
+        buffer = io.BytesIO()
+        font.save(buffer)
+        return buffer.getvalue(), gid_map
+
+    def write(self, writer):
+        """フォント関連のオブジェクト一式をPDFへ書き出す。"""
+        font_data, gid_map = self._subset()
+
+        units_per_em = self._ttfont['head'].unitsPerEm
+        def scale(value):
+            return round(value * 1000 / units_per_em)
+
+        # サブセットフォント名には6文字の大文字タグを付ける (PDFの仕様)
+        digest = hashlib.sha256(repr(sorted(self._used)).encode('ascii')).digest()
+        tag = ''.join(chr(ord('A') + b % 26) for b in digest[:6])
+        base_name = (self._ttfont['name'].getDebugName(6) or 'Font').replace(' ', '')
+        font_name = f'{tag}+{base_name}'
+
+        head = self._ttfont['head']
+        hhea = self._ttfont['hhea']
+        os2 = self._ttfont['OS/2'] if 'OS/2' in self._ttfont else None
+        cap_height = getattr(os2, 'sCapHeight', 0) or hhea.ascent
+        hmtx = self._ttfont['hmtx']
+        glyph_order = self._ttfont.getGlyphOrder()
+
+        font_file_id = writer._new_object_id()
+        compressed = zlib.compress(font_data)
+        writer._write_object(font_file_id, f'/Filter /FlateDecode /Length1 {len(font_data)}', compressed)
+
+        # 元のGID (=CID) からサブセット後のGIDへの対応表
+        max_cid = max(gid_map) if gid_map else 0
+        cid_to_gid = bytearray(2 * (max_cid + 1))
+        for cid, gid in gid_map.items():
+            cid_to_gid[2 * cid:2 * cid + 2] = gid.to_bytes(2, 'big')
+        cid_to_gid_id = writer._new_object_id()
+        writer._write_object(cid_to_gid_id, '/Filter /FlateDecode', zlib.compress(bytes(cid_to_gid)))
+
+        descriptor_id = writer._new_object_id()
+        writer._write_object(
+            descriptor_id,
+            f'<< /Type /FontDescriptor /FontName /{font_name} /Flags 4 '
+            f'/FontBBox [{scale(head.xMin)} {scale(head.yMin)} {scale(head.xMax)} {scale(head.yMax)}] '
+            f'/ItalicAngle 0 /Ascent {scale(hhea.ascent)} /Descent {scale(hhea.descent)} '
+            f'/CapHeight {scale(cap_height)} /StemV 80 /FontFile2 {font_file_id} 0 R >>'
+        )
+
+        widths = ' '.join(f'{gid} [{scale(hmtx[glyph_order[gid]][0])}]' for gid in sorted(self._used))
+        cid_font_id = writer._new_object_id()
+        writer._write_object(
+            cid_font_id,
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{font_name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {descriptor_id} 0 R /W [{widths}] /CIDToGIDMap {cid_to_gid_id} 0 R >>'
+        )
+
+        to_unicode_id = writer._new_object_id()
+        writer._write_object(to_unicode_id, '/Filter /FlateDecode', zlib.compress(self._to_unicode_cmap()))
+
+        writer._write_object(
+            self.object_id,
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{font_name} /Encoding /Identity-H '
+            f'/DescendantFonts [{cid_font_id} 0 R] /ToUnicode {to_unicode_id} 0 R >>'
+        )
+
+    def _to_unicode_cmap(self):
+        """テキストのコピーや検索ができるように、GIDから文字への対応表 (ToUnicode CMap) を作成する。"""
+        lines = [
+            '/CIDInit /ProcSet findresource begin',
+            '12 dict begin',
+            'begincmap',
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+            '/CMapName /Adobe-Identity-UCS def',
+            '/CMapType 2 def',
+            '1 begincodespacerange',
+            '<0000> <FFFF>',
+            'endcodespacerange',
+        ]
+        entries = sorted(self._used.items())
+        # bfchar は1ブロック100件までという制限がある
+        for i in range(0, len(entries), 100):
+            block = entries[i:i + 100]
+            lines.append(f'{len(block)} beginbfchar')
+            for gid, char in block:
+                lines.append(f'<{gid:04X}> <{char.encode("utf-16-be").hex().upper()}>')
+            lines.append('endbfchar')
+        lines += ['endcmap', 'CMapName currentdict /CMap defineresource pop', 'end', 'end']
+        return '\n'.join(lines).encode('ascii')
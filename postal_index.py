@@ -0,0 +1,352 @@
+"""
+日本郵便の郵便番号データ (KEN_ALL.CSV) から作る、オフラインの郵便番号索引。
+
+KEN_ALL.CSV (約12万行、Shift_JIS) を一度だけ読み込み、郵便番号順に並べた固定長のレコードと
+住所の文字列からなる索引ファイルを作る。索引はメモリマップで開くため、起動時に全体を読み込まず、
+検索は二分探索 (数マイクロ秒) で行う。KEN_ALL.CSV の方が新しい場合は索引を作り直す。
+
+索引ファイルの形式 (整数は全て4バイト、作成したマシンのバイトオーダー):
+  ヘッダー: マジック (4バイト) / バイトオーダーの確認用の値 / バージョン / レコード数
+  郵便番号: 郵便番号を整数にしたものを昇順に並べた配列 (レコード数)
+  オフセット: 各レコードの文字列の開始位置の配列 (レコード数 + 1)
+  文字列: 「都道府県\t市区町村\t町域\tビル名」 (UTF-8、照合用に正規化済み。ビル名は高層ビルの郵便番号の場合だけ)
+郵便番号の配列はメモリマップをそのまま整数の配列として扱い、bisect (C実装) で二分探索する。
+
+郵便番号データ: https://www.post.japanpost.jp/zipcode/download.html
+"""
+from array import array
+import bisect
+import csv
+import functools
+import mmap
+import os
+import re
+import struct
+import unicodedata
+
+POSTAL_INDEX_MAGIC = b'PCZX'
+POSTAL_INDEX_VERSION = 2
+POSTAL_INDEX_SUFFIX = '.idx'
+POSTAL_INDEX_BYTE_ORDER_MARK = 0x01020304
+_HEADER = struct.Struct('=4sIII')
+KEN_ALL_ENCODING = 'cp932'
+POSTAL_LOOKUP_CACHE_SIZE = 4096
+
+# KEN_ALL.CSV の列
+_COL_ZIP = 2
+_COL_PREFECTURE = 6
+_COL_CITY = 7
+_COL_TOWN = 8
+
+# 町域のうち、住所の照合に使えないもの
+_TOWN_PLACEHOLDERS = ('以下に掲載がない場合',)
+_TOWN_PLACEHOLDER_SUFFIXES = ('の次に番地がくる場合', '一円')
+_TOWN_PARENTHESES_PATTERN = re.compile(r'（.*?）|\(.*?\)')
+# 高層ビルの郵便番号の町域 (「西新宿新宿住友ビル（１階）」「西新宿新宿住友ビル（地階・階層不明）」など)
+_BUILDING_FLOOR_PATTERN = re.compile(r'（(?:地階・階層不明|[０-９]+階)）$')
+
+# 照合の結果
+POSTAL_OK = 'ok'
+POSTAL_INVALID = 'invalid' # 7桁の数字ではない
+POSTAL_UNKNOWN = 'unknown' # 索引に存在しない郵便番号
+POSTAL_MISMATCH = 'mismatch' # 住所の都道府県・市区町村が郵便番号と一致しない
+POSTAL_TOWN_MISMATCH = 'town_mismatch' # 市区町村は一致するが、町域が一致しない
+POSTAL_COMPLETABLE = 'completable' # 一致するが、都道府県 (または住所全体) が省略されている
+
+POSTAL_STATUS_MESSAGES = {
+    POSTAL_OK: '一致',
+    POSTAL_INVALID: '郵便番号が7桁の数字ではありません',
+    POSTAL_UNKNOWN: '郵便番号が見つかりません',
+    POSTAL_MISMATCH: '住所と郵便番号が一致しません',
+    POSTAL_TOWN_MISMATCH: '町域が郵便番号と一致しません',
+    POSTAL_COMPLETABLE: '都道府県・市区町村を補完できます',
+}
+
+
+def _normalize(text):
+    """照合用に全角・半角を揃え、空白を取り除く。"""
+    return ''.join(unicodedata.normalize('NFKC', text).split())
+
+
+def _clean_town(town):
+    """町域から括弧書き (丁目の範囲や「次のビルを除く」など) と、照合に使えない表記を取り除く。"""
+    if town in _TOWN_PLACEHOLDERS or town.endswith(_TOWN_PLACEHOLDER_SUFFIXES):
+        return ''
+    return _TOWN_PARENTHESES_PATTERN.sub('', town)
+
+
+def _split_buildings(entries):
+    """
+    高層ビルの郵便番号の町域を、町域の部分とビル名に分ける。
+    町域の部分は、同じ市区町村のビル以外の町域のうち、先頭が一致する最も長いもの
+    (「西新宿新宿住友ビル」なら「西新宿（次のビルを除く）」の「西新宿」) とする。
+    Yields (zip code, prefecture, city, town, building) — building is '' except for buildings
+    whose town part could be found.
+    """
+    towns = {}
+    for zip_code, prefecture, city, town in entries:
+        if not _BUILDING_FLOOR_PATTERN.search(town):
+            towns.setdefault((prefecture, city), set()).add(_clean_town(town))
+    for zip_code, prefecture, city, town in entries:
+        is_building = _BUILDING_FLOOR_PATTERN.search(town)
+        town = _clean_town(town)
+        building = ''
+        if is_building:
+            base = max((candidate for candidate in towns.get((prefecture, city), ())
+                        if candidate and len(candidate) < len(town) and town.startswith(candidate)),
+                       key=len, default='')
+            if base:
+                town, building = base, town[len(base):]
+        yield zip_code, prefecture, city, town, building
+
+
+def _read_ken_all(ken_all_path):
+    """
+    KEN_ALL.CSV から (郵便番号, 都道府県, 市区町村, 町域, ビル名) を読み込む。
+    町域が長く複数行に分かれている行 (括弧が閉じていない行) は1つにまとめる。
+    """
+    entries = set()
+    pending = None
+    with open(ken_all_path, encoding=KEN_ALL_ENCODING, newline='') as f:
+        for columns in csv.reader(f):
+            if len(columns) <= _COL_TOWN:
+                continue
+            zip_code, prefecture, city, town = (columns[_COL_ZIP], columns[_COL_PREFECTURE],
+                                                columns[_COL_CITY], columns[_COL_TOWN])
+            if pending is not None:
+                if pending[0] == zip_code:
+                    town = pending[3] + town
+                else:
+                    entries.add(pending)
+                pending = None
+            if town.count('（') > town.count('）'):
+                pending = (zip_code, prefecture, city, town)
+                continue
+            entries.add((zip_code, prefecture, city, town))
+    if pending is not None:
+        entries.add(pending)
+
+    for zip_code, prefecture, city, town, building in _split_buildings(entries):
+        if len(zip_code) == 7 and zip_code.isdigit():
+            yield int(zip_code), _normalize(prefecture), _normalize(city), _normalize(town), _normalize(building)
+
+
+def build_postal_index(ken_all_path, index_path):
+    """KEN_ALL.CSV から索引ファイルを作る。Returns the number of records."""
+    records = sorted(set(_read_ken_all(ken_all_path)))
+    zip_numbers = array('I')
+    offsets = array('I')
+    strings = bytearray()
+    for zip_number, prefecture, city, town, building in records:
+        zip_numbers.append(zip_number)
+        offsets.append(len(strings))
+        strings += f'{prefecture}\t{city}\t{town}\t{building}'.encode('utf-8')
+    offsets.append(len(strings))
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(POSTAL_INDEX_MAGIC, POSTAL_INDEX_BYTE_ORDER_MARK, POSTAL_INDEX_VERSION, len(records)))
+        zip_numbers.tofile(f)
+        offsets.tofile(f)
+        f.write(strings)
+    os.replace(tmp_path, index_path)
+    return len(records)
+
+
+class PostalIndex:
+    """
+    郵便番号の索引。ファイルは最初の検索時にメモリマップで開く (索引が無いか古い場合はここで作る)。
+    ken_all_path には KEN_ALL.CSV を、index_path には索引ファイルの保存先を指定する
+    (省略時は KEN_ALL.CSV と同じフォルダに「KEN_ALL.CSV.idx」として保存する)。
+    """
+
+    def __init__(self, ken_all_path=None, index_path=None):
+        if ken_all_path is None and index_path is None:
+            raise ValueError("KEN_ALL.CSV か索引ファイルのどちらかを指定してください。")
+        self.ken_all_path = ken_all_path
+        self.index_path = index_path or ken_all_path + POSTAL_INDEX_SUFFIX
+        self._file = None
+        self._map = None
+        self._zips = None
+        self._offsets = None
+        self._strings_offset = 0
+        self.lookup = functools.lru_cache(maxsize=POSTAL_LOOKUP_CACHE_SIZE)(self._lookup)
+
+    def _needs_build(self):
+        if not os.path.exists(self.index_path):
+            return True
+        if self.ken_all_path is None:
+            return False
+        if os.path.getmtime(self.ken_all_path) > os.path.getmtime(self.index_path):
+            return True
+        with open(self.index_path, 'rb') as f:
+            return not self._is_valid_header(f.read(_HEADER.size))
+
+    @staticmethod
+    def _is_valid_header(data):
+        if len(data) < _HEADER.size:
+            return False
+        magic, byte_order_mark, version, _ = _HEADER.unpack_from(data, 0)
+        # 別のバイトオーダーのマシンで作った索引も作り直す
+        return (magic == POSTAL_INDEX_MAGIC and byte_order_mark == POSTAL_INDEX_BYTE_ORDER_MARK
+                and version == POSTAL_INDEX_VERSION)
+
+    def open(self):
+        """索引を開く (必要なら先に作る)。"""
+        if self._map is not None:
+            return
+        if self._needs_build():
+            print(f"郵便番号の索引を作成しています: {self.index_path}")
+            count = build_postal_index(self.ken_all_path, self.index_path)
+            print(f"郵便番号の索引を作成しました ({count} 件)。")
+        self._file = open(self.index_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self._is_valid_header(self._map):
+            self.close()
+            raise ValueError(f"郵便番号の索引ファイルの形式が正しくありません: {self.index_path}")
+        count = _HEADER.unpack_from(self._map, 0)[3]
+        view = memoryview(self._map)
+        zips_end = _HEADER.size + count * 4
+        self._zips = view[_HEADER.size:zips_end].cast('I')
+        self._offsets = view[zips_end:zips_end + (count + 1) * 4].cast('I')
+        self._strings_offset = zips_end + (count + 1) * 4
+
+    def close(self):
+        if self._map is not None:
+            # メモリマップを閉じる前に、参照しているメモリビューを解放する
+            self._zips.release()
+            self._offsets.release()
+            self._zips = self._offsets = None
+            self.lookup.cache_clear()
+            self._map.close()
+            self._file.close()
+            self._map = None
+            self._file = None
+
+    def __len__(self):
+        self.open()
+        return len(self._zips)
+
+    def _lookup(self, zip_code):
+        """
+        7桁の郵便番号 (数字の文字列) に対応する住所を検索する。
+        Returns a tuple of (prefecture, city, town, building) entries (empty if not found).
+        """
+        self.open()
+        target = int(zip_code)
+        zips = self._zips
+        low = bisect.bisect_left(zips, target)
+        high = bisect.bisect_right(zips, target, low)
+        if low == high:
+            return ()
+        offsets = self._offsets
+        base = self._strings_offset
+        data = self._map
+        return tuple(tuple(data[base + offsets[i]:base + offsets[i + 1]].decode('utf-8').split('\t'))
+                     for i in range(low, high))
+
+    def check(self, zip_code_raw, address):
+        """
+        郵便番号と住所１を照合する。
+        Returns (status, entries, suggestion) — status is one of the POSTAL_* constants,
+        entries are the (prefecture, city, town, building) for the zip, and suggestion is a completed
+        address (or '' if there is nothing to complete).
+        """
+        zip_code = re.sub(r'[^0-9]', '', unicodedata.normalize('NFKC', zip_code_raw))
+        if len(zip_code) != 7:
+            return POSTAL_INVALID, (), ''
+        entries = self.lookup(zip_code)
+        if not entries:
+            return POSTAL_UNKNOWN, (), ''
+
+        normalized = _normalize(address)
+        if not normalized:
+            # 住所が空の場合は、町域が1つに決まれば住所全体を補完候補にする
+            suggestion = ''.join(entries[0]) if len(entries) == 1 else ''.join(entries[0][:2])
+            return POSTAL_COMPLETABLE, entries, suggestion
+
+        # 索引の文字列は作成時に正規化済み
+        best = POSTAL_MISMATCH
+        for prefecture, city, town, building in entries:
+            rest = normalized
+            has_prefecture = rest.startswith(prefecture)
+            if has_prefecture:
+                rest = rest[len(prefecture):]
+            if rest.startswith(city):
+                rest = rest[len(city):]
+            else:
+                # 「〇〇郡」は省略されることが多いため、郡名を除いた町村名でも照合する
+                county_end = city.find('郡') + 1
+                if county_end <= 1 or not rest.startswith(city[county_end:]):
+                    continue
+                rest = rest[len(city) - county_end:]
+            if town and not rest.startswith(town):
+                best = POSTAL_TOWN_MISMATCH
+                continue
+            # 高層ビルの郵便番号は、町域の後 (番地の後) にビル名が書かれていれば一致とする
+            if building and building not in rest[len(town):]:
+                best = POSTAL_TOWN_MISMATCH
+                continue
+            if not has_prefecture:
+                # 都道府県が省略されている
+                return POSTAL_COMPLETABLE, entries, prefecture + address.strip()
+            return POSTAL_OK, entries, ''
+        return best, entries, ''
+
+
+class PostalReport:
+    """
+    郵便番号の照合結果のうち、一致しなかった行をCSVに書き出すレポート。
+    path が None の場合はファイルに書かず、件数だけを数える。
+    counts に照合結果ごとの件数、completed に住所を補完した行数を記録する。
+    """
+
+    FIELDNAMES = ['行', '氏名', '郵便番号', '住所１', '判定', '郵便番号の住所', '補完候補']
+
+    def __init__(self, path=None):
+        self.path = path
+        self.counts = {}
+        self.completed = 0
+        self._file = None
+        self._writer = None
+        if path is not None:
+            # Excelで開いても文字化けしないよう、BOM付きのUTF-8で書き出す
+            self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.FIELDNAMES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, row_number, name, zip_code, address, status, entries, suggestion):
+        """1行の照合結果を記録する。一致した行 (POSTAL_OK) は件数だけを数える。"""
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status == POSTAL_OK or self._writer is None:
+            return
+        expected = ' / '.join(''.join(entry) for entry in entries)
+        self._writer.writerow([row_number, name, zip_code, address, POSTAL_STATUS_MESSAGES[status], expected, suggestion])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def issue_count(self):
+        return sum(count for status, count in self.counts.items() if status != POSTAL_OK)
+
+    def summary(self):
+        """照合結果の件数をまとめた文字列を返す。"""
+        parts = [f"{POSTAL_STATUS_MESSAGES[status]} {count} 件" for status, count in sorted(self.counts.items())
+                 if status != POSTAL_OK]
+        text = f"郵便番号の照合: 一致 {self.counts.get(POSTAL_OK, 0)} 件"
+        if parts:
+            text += " / " + " / ".join(parts)
+        if self.completed:
+            text += f" (住所を補完した行 {self.completed} 件)"
+        if self.path is not None and self.issue_count:
+            text += f"\n一致しなかった行を書き出しました: {self.path}"
+        return text
@@ -1,30 +1,50 @@
+import codecs
+from collections import OrderedDict, deque, namedtuple
 import csv
-from PIL import Image, ImageDraw, ImageFont
+import functools
+import hashlib
+import io
+import itertools
+import json
+import math
 import os
 import sys
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 import re # 郵便番号のハイフン削除用
 import unicodedata # 半角→全角変換用
-import chardet # エンコーディング自動検出用
-
-# Tkinterのルートウィンドウを作成（ユーザーには見えない）
-root = tk.Tk()
-root.withdraw() # メインウィンドウを非表示にする
+from pdf_writer import ImposedPdfWriter, ShardedPdfWriter, StreamingPdfWriter, encode_page
+from page_cache import PAGE_CACHE_DEFAULT_MAX_MB, PageCache
+from profiler import NULL_PROFILER, Profiler
+from postal_index import POSTAL_COMPLETABLE, PostalIndex, PostalReport
+
+# 起動を速くするため、時間のかかるモジュールは最初に使う関数の中で読み込む
+# (Pillow・chardet・プロセスプール・Excelブックの読み込み・argparse)。
+# GUIモードでは、最初のダイアログを表示している間に別スレッドで読み込まれる (RendererLoader)。
+# tkinterはGUIモード (run_gui) でのみ読み込む。
+# import時やCLIモードではウィンドウやダイアログを一切作成しない。
+root = None
 
 # --- プログレスウィンドウ関連の変数と関数 ---
+# 描画は別スレッドで行い、進捗はキュー経由で受け取る。GUIは一定間隔でキューを確認して表示を更新する。
+PROGRESS_POLL_MS = 50 # 進捗の表示を更新する間隔 (ミリ秒)
 progress_window = None
 progress_label = None
 progress_bar = None
-total_files_to_process = 0
-current_file_count = 0
+cancel_button = None
+progress_queue = None # 描画スレッド → GUI へのメッセージ
+cancel_event = None # GUI → 描画スレッドへのキャンセル要求
 
 def create_progress_window():
     """処理進行状況を示すプログレスウィンドウを作成する。"""
-    global progress_window, progress_label, progress_bar
+    global progress_window, progress_label, progress_bar, cancel_button, progress_queue, cancel_event
+    import queue
+    import threading
+    import tkinter as tk
+    from tkinter import ttk
+    progress_queue = queue.Queue()
+    cancel_event = threading.Event()
     progress_window = tk.Toplevel(root)
     progress_window.title("処理中...")
-    progress_window.geometry("400x120")
+    progress_window.geometry("400x160")
     progress_window.resizable(False, False)
     progress_window.attributes("-topmost", True) # 最前面に表示
     tk.Label(progress_window, text="ハガキ画像を生成中...", font=("Arial", 12)).pack(pady=10)
@@ -32,20 +52,42 @@ def create_progress_window():
     progress_label.pack(pady=5)
     progress_bar = ttk.Progressbar(progress_window, orient="horizontal", length=300, mode="determinate")
     progress_bar.pack(pady=5)
-    progress_window.protocol("WM_DELETE_WINDOW", lambda: None) # ユーザーによるクローズを無効化
-    root.update_idletasks()
-    root.update()
-
-def update_progress(current_name, processed_count, total_count):
-    """プログレスバーとラベルを更新する。"""
-    if progress_window and progress_label and progress_bar:
-        progress_label.config(text=f"処理中: {current_name}\n({processed_count}/{total_count} 件)")
-        if total_count > 0:
-            progress_bar["value"] = (processed_count / total_count) * 100
-        else:
-            progress_bar["value"] = 0
-        root.update_idletasks()
-        root.update()
+    cancel_button = tk.Button(progress_window, text="キャンセル", command=request_cancel)
+    cancel_button.pack(pady=5)
+    progress_window.protocol("WM_DELETE_WINDOW", request_cancel) # ウィンドウを閉じる操作もキャンセルとして扱う
+
+def request_cancel():
+    """キャンセルボタンの処理。描画スレッドは現在のハガキを書き出した後で停止する。"""
+    if cancel_event is not None and not cancel_event.is_set():
+        cancel_event.set()
+        progress_label.config(text="キャンセルしています...\n(生成済みのハガキはPDFに保存されます)")
+        cancel_button.config(state="disabled")
+
+def update_progress(current_name, processed_count, fraction):
+    """
+    描画スレッドから呼ばれる進捗の通知。fraction はCSVを読み込んだ割合 (0.0〜1.0)。
+    tkinterはメインスレッドからしか操作できないため、ここではキューに入れるだけにする。
+    """
+    progress_queue.put(('progress', current_name, processed_count, fraction))
+
+def poll_progress(on_finished):
+    """
+    キューに溜まった進捗をまとめて取り出し、最新の1件だけを表示する。PROGRESS_POLL_MS ごとに呼び出す。
+    描画スレッドから終了のメッセージを受け取った場合は on_finished(メッセージ) を呼び出して終わる。
+    """
+    latest = None
+    while not progress_queue.empty():
+        message = progress_queue.get_nowait()
+        if message[0] != 'progress':
+            on_finished(message)
+            return
+        latest = message
+
+    if latest is not None and not cancel_event.is_set():
+        _, current_name, processed_count, fraction = latest
+        progress_label.config(text=f"処理中: {current_name}\n({processed_count} 件完了 / {fraction * 100:.0f}%)")
+        progress_bar["value"] = fraction * 100
+    root.after(PROGRESS_POLL_MS, poll_progress, on_finished)
 
 def destroy_progress_window():
     """プログレスウィンドウを破棄する。"""
@@ -54,44 +96,51 @@ def destroy_progress_window():
         progress_window.destroy()
         progress_window = None
 
+
 # --- テンプレート生成に関する設定 ---
-GENERATE_TEMPLATE = True # Trueにするとテンプレート画像を自動生成する
-AUTO_TEMPLATE_FILENAME = 'generated_postcard_template.jpg' # 自動生成されるテンプレートのファイル名
+GENERATE_TEMPLATE = True # Trueにするとテンプレート画像をメモリ上に自動生成する (ファイルには書き出さない)
 TEMPLATE_DPI = 300       # テンプレートのDPI (Dots Per Inch) - 印刷品質に影響
+COLOR_MODE = 'RGB'       # ページの色モード: 'RGB' (カラー) / 'L' (グレースケール) / '1' (白黒2値)
+COLOR_MODES = ('RGB', 'L', '1')
 
 # ハガキの物理的なサイズ (mm)
 POSTCARD_WIDTH_MM = 100 # 短辺が幅
 POSTCARD_HEIGHT_MM = 148 # 長辺が高さ
 
 # --- テンプレート画像を自動生成する関数 (郵便番号枠なし) ---
-def generate_postcard_template(filename, dpi, width_mm, height_mm):
+def create_postcard_template(dpi, width_mm, height_mm, mode='RGB'):
     """
-    指定されたDPIとサイズで、白い背景のハガキテンプレート画像を自動生成する。
-    郵便番号枠は描画しない。
+    指定されたDPIとサイズで、白い背景のハガキテンプレート画像をメモリ上に生成する。
+    mode には 'RGB' / 'L' (グレースケール) / '1' (白黒2値) を指定できる。
+    郵便番号枠は描画しない (必要な場合は StaticLayer で描画する)。
     """
-    print(f"ハガキテンプレートを自動生成します: {filename}")
-
     # ピクセルサイズの計算
     width_px = int(width_mm / 25.4 * dpi)
     height_px = int(height_mm / 25.4 * dpi)
 
+    from PIL import Image
+
     # 白い背景の画像を作成
-    img = Image.new('RGB', (width_px, height_px), (255, 255, 255))
-    
-    # 画像を保存
-    img.save(filename, 'JPEG', quality=95)
-    print(f"テンプレート「{filename}」を生成しました。")
-    return filename
+    return Image.new(mode, (width_px, height_px), _color_for_mode((255, 255, 255), mode))
+
+
+def _color_for_mode(color, mode):
+    """RGBの色を、指定した画像モード ('L' や '1') で使える色の値に変換する。"""
+    if mode == 'RGB':
+        return color
+    from PIL import Image
+    return Image.new('RGB', (1, 1), color).convert(mode).getpixel((0, 0))
+
+# --- 面付けの設定 (--n-up) ---
+IMPOSITION_SHEET_SIZE_MM = (210, 297) # 用紙の大きさ (A4、縦向きの幅・高さ)。向きは自動で選ぶ
+IMPOSITION_CARDS_PER_SHEET = (2, 4) # 1枚の用紙に並べられるハガキの枚数
 
 # --- 設定項目 ---
 # ※ここにある「パス」や「座標」「フォントサイズ」は、お使いのテンプレート画像や
 # プリンターの出力結果に合わせて適宜調整してください。
 
-# テンプレートの自動生成設定に基づいてパスを設定
-if GENERATE_TEMPLATE:
-    TEMPLATE_IMAGE_PATH = AUTO_TEMPLATE_FILENAME # 自動生成されるテンプレートを使用
-else:
-    TEMPLATE_IMAGE_PATH = 'template_postcard.jpg' # 手動で用意したテンプレートを使用
+# 手動で用意したテンプレート画像 (GENERATE_TEMPLATE が False の場合に使用)
+TEMPLATE_IMAGE_PATH = 'template_postcard.jpg'
 
 # 同梱するNoto Sans JPフォントのファイル名
 FONT_FILENAME = 'NotoSansJP-Regular.ttf'
@@ -104,13 +153,17 @@ else:
 
 FONT_PATH = os.path.join(BASE_DIR, FONT_FILENAME)
 
-# フォントサイズの設定 (DPI300のハガキテンプレートを想定した初期値)
-COMMON_NAME_FONT_SIZE = 130
-NAME_FONT_SIZE = COMMON_NAME_FONT_SIZE
-NAME2_FONT_SIZE = COMMON_NAME_FONT_SIZE
-TITLE_FONT_SIZE = COMMON_NAME_FONT_SIZE
-ADDRESS_FONT_SIZE = 68
-ZIP_FONT_SIZE = 86
+# レイアウトは全てハガキの実寸 (mm) で、文字サイズはポイント (1pt = 1/72インチ) で指定する。
+# 描画するときに、その解像度 (印刷用は TEMPLATE_DPI、プレビューは PREVIEW_DPI) のピクセルに変換する (PageLayout)。
+# 初期値は、DPI300のハガキテンプレートで調整したピクセル値を換算したもの。
+
+# フォントサイズの設定 (ポイント)
+COMMON_NAME_FONT_SIZE_PT = 31.2
+NAME_FONT_SIZE_PT = COMMON_NAME_FONT_SIZE_PT
+NAME2_FONT_SIZE_PT = COMMON_NAME_FONT_SIZE_PT
+TITLE_FONT_SIZE_PT = COMMON_NAME_FONT_SIZE_PT
+ADDRESS_FONT_SIZE_PT = 16.32
+ZIP_FONT_SIZE_PT = 20.64
 
 TEXT_COLOR = (0, 0, 0) # テキストの色 (黒)
 
@@ -123,81 +176,181 @@ ZIP_BOX_INNER_GAP_MM = 1.3 # 各枠の間の隙間 (数字間の隙間)
 ZIP_TOP_MARGIN_MM = 11.0 # ハガキ上端から郵便番号枠上端まで
 ZIP_LEFT_MARGIN_MM = 46.0 # ハガキ左端から一番左の枠の左端まで
 
-# --- 描画位置の計算 (ピクセル) ---
-PIXELS_PER_MM = TEMPLATE_DPI / 25.4
-
-CALC_POSTCARD_WIDTH_PX = int(POSTCARD_WIDTH_MM * PIXELS_PER_MM)
-CALC_POSTCARD_HEIGHT_PX = int(POSTCARD_HEIGHT_MM * PIXELS_PER_MM)
+# 郵便番号の各数字間のオフセット（描画後に加えるオフセット、mm）
+ZIP_CHAR_OFFSETS_MM = [2.96, 2.96, 3.05, 2.96, 2.96, 2.88, 0] # 微調整済みの値
 
-CALC_ZIP_BOX_HEIGHT_PX = int(ZIP_BOX_HEIGHT_MM * PIXELS_PER_MM)
-CALC_ZIP_BOX_INDIVIDUAL_WIDTH_PX = int(ZIP_BOX_INDIVIDUAL_WIDTH_MM * PIXELS_PER_MM)
-CALC_ZIP_BOX_INNER_GAP_PX = int(ZIP_BOX_INNER_GAP_MM * PIXELS_PER_MM)
+# 描画位置の調整 (mm、縦向きを想定した初期値)。X座標は文字の中心
+ADDRESS_COL1_X_MM = 84.67
+ADDRESS_COL2_X_MM = 76.2
+ADDRESS_LINE_Y_START_MM = 25.4
+ADDRESS_CHAR_Y_SPACING_MM = 5.93
 
-CALC_ZIP_TOP_MARGIN_PX = int(ZIP_TOP_MARGIN_MM * PIXELS_PER_MM) # ここを修正しました
-CALC_ZIP_LEFT_MARGIN_PX = int(ZIP_LEFT_MARGIN_MM * PIXELS_PER_MM)
+# 氏名の開始位置 (中央からやや左、上から下へ)
+NAME_COL1_X_MM = 55.03
+NAME_LINE_Y_START_MM = 29.63
+NAME_CHAR_Y_SPACING_MM = 12.7
 
-# 郵便番号の描画Y座標（テキストの垂直中央揃えを考慮）
-ZIP_TEXT_VERTICAL_OFFSET_IN_BOX_PX = (CALC_ZIP_BOX_HEIGHT_PX - ZIP_FONT_SIZE) / 2
-if ZIP_TEXT_VERTICAL_OFFSET_IN_BOX_PX < 0:
-    ZIP_TEXT_VERTICAL_OFFSET_IN_BOX_PX = 0
+# --- レイアウト調整用オフセット (mm) ---
+OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE_MM = 8.47
 
-# 郵便番号の共通Y座標 (ハガキの上端から)
-ZIP_COMMON_Y = CALC_ZIP_TOP_MARGIN_PX + ZIP_TEXT_VERTICAL_OFFSET_IN_BOX_PX
+# 氏名1の名前が配置される列(NAME_COL1_X_MM)から、氏名2の名前が配置される列までのX方向のオフセット。
+# 負の値を指定すると左にずれます。
+OFFSET_NAME2_X_FROM_NAME1_COL_MM = -12.7
 
-# 郵便番号の描画開始X座標 (ハガキの左端を基準に計算)
-ZIP_OVERALL_LEFT_X_PX = CALC_ZIP_LEFT_MARGIN_PX
+# 敬称のY座標オフセット（氏名1の名前の最終Y座標から）
+OFFSET_TITLE_Y_FROM_NAME_END_MM = 0.85
 
-# 郵便番号の各数字間のオフセット（描画後に加えるオフセット）
-ZIP_CHAR_OFFSETS = [35, 35, 36, 35, 35, 34, 0] # 微調整済みの値
+# --- 敬称の設定 ---
+DEFAULT_TITLE = '様' # デフォルトの敬称
 
-# 描画位置の調整 (DPI300のハガキテンプレート、縦向きを想定した初期値)
-ADDRESS_COL1_X = 1000
-ADDRESS_COL2_X = 900
-ADDRESS_LINE_Y_START = 300
-ADDRESS_CHAR_Y_SPACING = 70
+# --- 固定レイヤーの設定 (全てのハガキに共通する要素。StaticLayerで一度だけ描画する) ---
+ZIP_BOX_LINE_WIDTH_MM = 0.25 # 郵便番号枠の線の太さ
 
-# 氏名の開始位置 (中央からやや左、上から下へ)
-NAME_COL1_X = 650
-NAME_LINE_Y_START = 350
-NAME_CHAR_Y_SPACING = 150
+# 差出人 (左下に縦書き)
+SENDER_FONT_SIZE_PT = 9.6
+SENDER_ADDRESS_X_MM = 25.4
+SENDER_NAME_X_MM = 16.93
+SENDER_LINE_Y_START_MM = 84.67
+SENDER_ADDRESS_CHAR_Y_SPACING_MM = 3.81
+SENDER_NAME_CHAR_Y_SPACING_MM = 5.08
 
-# --- レイアウト調整用オフセット ---
-OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE = 100
+# 差出人の郵便番号 (左下に横書き)
+SENDER_ZIP_POS_MM = (5.93, 138.01)
+SENDER_ZIP_CHAR_OFFSETS_MM = [0.68, 0.68, 0.68, 0.68, 0.68, 0.68, 0]
 
-# 氏名1の名前が配置される列(NAME_COL1_X)から、氏名2の名前が配置される列までのX方向のオフセット。
-# 負の値を指定すると左にずれます。
-OFFSET_NAME2_X_FROM_NAME1_COL = -150
+# ロゴ画像 (左上)
+LOGO_POS_MM = (5.08, 5.08)
+LOGO_MAX_SIZE_MM = (25.4, 25.4) # これより大きいロゴは縦横比を保って縮小する
 
-# 敬称のY座標オフセット（氏名1の名前の最終Y座標から）
-OFFSET_TITLE_Y_FROM_NAME_END = 10
+# --- 描画位置の計算 (ピクセル) ---
+class PageLayout:
+    """
+    mm・ポイントで指定したレイアウトを、dpi で描画する場合のピクセル値に変換したもの。
+    属性名は上の設定項目の名前を小文字にして、単位 (_mm / _pt) を外したもの (例: address_col1_x)。
+    TEMPLATE_DPI 以外 (プレビューなど) でも、同じ位置関係のハガキを描画できる。
+    """
 
-# --- 敬称の設定 ---
-DEFAULT_TITLE = '様' # デフォルトの敬称
+    def __init__(self, dpi=TEMPLATE_DPI):
+        self.dpi = dpi
+        self.pixels_per_mm = dpi / 25.4
+        px = self.px
+
+        self.postcard_width = int(POSTCARD_WIDTH_MM * self.pixels_per_mm)
+        self.postcard_height = int(POSTCARD_HEIGHT_MM * self.pixels_per_mm)
+
+        self.name_font_size = self.pt(NAME_FONT_SIZE_PT)
+        self.name2_font_size = self.pt(NAME2_FONT_SIZE_PT)
+        self.title_font_size = self.pt(TITLE_FONT_SIZE_PT)
+        self.address_font_size = self.pt(ADDRESS_FONT_SIZE_PT)
+        self.zip_font_size = self.pt(ZIP_FONT_SIZE_PT)
+
+        # 郵便番号枠 (枠の位置は切り捨て)
+        self.zip_box_height = int(ZIP_BOX_HEIGHT_MM * self.pixels_per_mm)
+        self.zip_box_individual_width = int(ZIP_BOX_INDIVIDUAL_WIDTH_MM * self.pixels_per_mm)
+        self.zip_box_inner_gap = int(ZIP_BOX_INNER_GAP_MM * self.pixels_per_mm)
+        self.zip_top_margin = int(ZIP_TOP_MARGIN_MM * self.pixels_per_mm)
+        self.zip_left_margin = int(ZIP_LEFT_MARGIN_MM * self.pixels_per_mm)
+        self.zip_box_line_width = max(1, round(px(ZIP_BOX_LINE_WIDTH_MM)))
+
+        # 郵便番号の描画Y座標（テキストの垂直中央揃えを考慮）
+        self.zip_common_y = self.zip_top_margin + max(0, (self.zip_box_height - self.zip_font_size) / 2)
+        self.zip_overall_left_x = self.zip_left_margin
+        self.zip_char_offsets = [px(offset) for offset in ZIP_CHAR_OFFSETS_MM]
+
+        self.address_col1_x = px(ADDRESS_COL1_X_MM)
+        self.address_col2_x = px(ADDRESS_COL2_X_MM)
+        self.address_line_y_start = px(ADDRESS_LINE_Y_START_MM)
+        self.address_char_y_spacing = px(ADDRESS_CHAR_Y_SPACING_MM)
+
+        self.name_col1_x = px(NAME_COL1_X_MM)
+        self.name_line_y_start = px(NAME_LINE_Y_START_MM)
+        self.name_char_y_spacing = px(NAME_CHAR_Y_SPACING_MM)
+        self.offset_name1_y_from_surname_end_after_space = px(OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE_MM)
+        self.offset_name2_x_from_name1_col = px(OFFSET_NAME2_X_FROM_NAME1_COL_MM)
+        self.offset_title_y_from_name_end = px(OFFSET_TITLE_Y_FROM_NAME_END_MM)
+
+        self.sender_font_size = self.pt(SENDER_FONT_SIZE_PT)
+        self.sender_address_x = px(SENDER_ADDRESS_X_MM)
+        self.sender_name_x = px(SENDER_NAME_X_MM)
+        self.sender_line_y_start = px(SENDER_LINE_Y_START_MM)
+        self.sender_address_char_y_spacing = px(SENDER_ADDRESS_CHAR_Y_SPACING_MM)
+        self.sender_name_char_y_spacing = px(SENDER_NAME_CHAR_Y_SPACING_MM)
+        self.sender_zip_pos = tuple(px(value) for value in SENDER_ZIP_POS_MM)
+        self.sender_zip_char_offsets = [px(offset) for offset in SENDER_ZIP_CHAR_OFFSETS_MM]
+
+        self.logo_pos = tuple(round(px(value)) for value in LOGO_POS_MM)
+        self.logo_max_size = tuple(max(1, round(px(value))) for value in LOGO_MAX_SIZE_MM)
+
+    def px(self, mm):
+        """
+        mm をこのDPIのピクセル数に変換する。印刷用の解像度 (TEMPLATE_DPI) の整数ピクセルに揃えてから
+        このDPIに換算するため、プレビューでも印刷用と同じ位置になる (文字間隔の丸めの誤差が列の下ほど積み重ならない)。
+        """
+        return self.from_print_px(round(mm * TEMPLATE_DPI / 25.4))
+
+    def from_print_px(self, print_px):
+        """印刷用の解像度 (TEMPLATE_DPI) でのピクセル値を、このDPIのピクセル値に換算する。"""
+        return print_px if self.dpi == TEMPLATE_DPI else print_px * self.dpi / TEMPLATE_DPI
+
+    def pt(self, points):
+        """文字サイズ (ポイント) をこのDPIのピクセル数 (1以上の整数) に変換する。"""
+        return max(1, round(points * self.dpi / 72))
+
+
+# 印刷用 (TEMPLATE_DPI) のレイアウト
+DEFAULT_LAYOUT = PageLayout(TEMPLATE_DPI)
 
 # --- ヘルパー関数 ---
+NORMALIZE_CACHE_SIZE = 16384 # 正規化結果をキャッシュする件数 (同じ住所・氏名の繰り返しを再計算しない)
+
+class _FullwidthTable(dict):
+    """
+    _convert_halfwidth_to_fullwidth_all 用の str.translate 変換表。
+    半角英数字とスペースは全角に、その他の文字はNFKC正規化した結果に対応付ける。
+    よく使う文字は事前に登録し、それ以外は初めて出現したときに一度だけ計算して登録する。
+    """
+
+    def __missing__(self, code):
+        converted = unicodedata.normalize('NFKC', chr(code))
+        self[code] = converted
+        return converted
+
+
+_FULLWIDTH_TABLE = _FullwidthTable()
+# 半角アルファベット・数字・スペースを全角に変換
+_FULLWIDTH_TABLE.update({code: chr(code - ord('a') + ord('ａ')) for code in range(ord('a'), ord('z') + 1)})
+_FULLWIDTH_TABLE.update({code: chr(code - ord('A') + ord('Ａ')) for code in range(ord('A'), ord('Z') + 1)})
+_FULLWIDTH_TABLE.update({code: chr(code - ord('0') + ord('０')) for code in range(ord('0'), ord('9') + 1)})
+_FULLWIDTH_TABLE[ord(' ')] = '　'
+# その他のASCII記号と半角カタカナはNFKC正規化の結果を事前に登録しておく
+for _code in list(range(0x21, 0x7F)) + list(range(0xFF61, 0xFFA0)):
+    if _code not in _FULLWIDTH_TABLE:
+        _FULLWIDTH_TABLE[_code] = unicodedata.normalize('NFKC', chr(_code))
+del _code
+
+
 def _convert_halfwidth_to_fullwidth_all(text):
     """
     文字列中の全ての半角文字（英数字、記号、カタカナ、スペース）を全角に変換する。
     特に半角アルファベットの変換を強化。
+    1文字ずつの変換は変換表 (_FULLWIDTH_TABLE) を使った str.translate で一度に行う。
     """
-    fullwidth_chars = []
-    for char in text:
-        # 半角アルファベットを全角に変換
-        if 'a' <= char <= 'z':
-            fullwidth_chars.append(chr(ord(char) - ord('a') + ord('ａ')))
-        elif 'A' <= char <= 'Z':
-            fullwidth_chars.append(chr(ord(char) - ord('A') + ord('Ａ')))
-        # 半角数字を全角に変換
-        elif '0' <= char <= '9':
-            fullwidth_chars.append(chr(ord(char) - ord('0') + ord('０')))
-        # 半角スペースを全角スペースに変換
-        elif char == ' ':
-            fullwidth_chars.append('　')
-        # その他の文字（半角カタカナ、特定の記号など）はNFKC正規化を適用
-        else:
-            fullwidth_chars.append(unicodedata.normalize('NFKC', char))
-            
-    return "".join(fullwidth_chars)
+    return text.translate(_FULLWIDTH_TABLE)
+
+
+# 漢数字変換をスキップする部分のパターン:
+# 1桁以上の全角数字が続き、その直後に特定の非数字文字 (英字・カタカナ・階号室棟) が1つ以上続く
+_ADDRESS_SKIP_PATTERN = re.compile(
+    r'[０-９]+'  # 1桁以上の全角数字
+    r'[a-zA-ZＡ-Ｚａ-ｚァ-ヶア-ンーヴｱ-ﾝｦ-ﾟ階号室棟]+' # その後に続く特定の文字群
+)
+
+# 全角数字を漢数字に、ハイフン（半角・全角・長音符）を全角縦棒に変換する変換表
+_ADDRESS_NUMBER_TABLE = str.maketrans({
+    '０': '〇', '１': '一', '２': '二', '３': '三', '４': '四',
+    '５': '五', '６': '六', '７': '七', '８': '八', '９': '九',
+    '-': '｜', '－': '｜', 'ー': '｜',
+})
 
 
 def _convert_address_numbers_and_hyphens(text):
@@ -207,65 +360,18 @@ def _convert_address_numbers_and_hyphens(text):
     その数字は漢数字に変換せず、全角数字のままにする。
     この関数は、_convert_halfwidth_to_fullwidth_all の後に呼び出されることを想定。
     これにより、半角ハイフンは先に全角ハイフンに変換され、その後縦棒になる。
+    スキップする部分はそのまま残し、その間の部分だけを変換表で一度に変換する。
     """
-    kanji_map = {
-        '0': '〇', '1': '一', '2': '二', '3': '三', '4': '四',
-        '5': '五', '6': '六', '7': '七', '8': '八', '9': '九',
-    }
-
-    # フェーズ1: 漢数字変換をスキップすべき部分を特定し、プレースホルダーに置き換える
-    # パターン: 1桁以上の全角数字が続き、その直後に特定の非数字文字が1つ以上続く
-    skip_pattern = re.compile(
-        r'[０-９]+'  # 1桁以上の全角数字
-        r'([a-zA-ZＡ-Ｚａ-ｚァ-ヶア-ンーヴｱ-ﾝｦ-ﾟ階号室棟]+)' # その後に続く特定の文字群
-    )
-
-    preserved_parts = {} # プレースホルダーと元の文字列のマッピング
-    placeholder_idx = 0
-
-    def replace_with_placeholder(match):
-        nonlocal placeholder_idx
-        full_match = match.group(0)  
-        placeholder = f"__PLACEHOLDER_{placeholder_idx}__"
-        preserved_parts[placeholder] = full_match
-        placeholder_idx += 1
-        return placeholder
-
-    # まず、スキップすべきパターンをプレースホルダーに置き換え
-    temp_text = skip_pattern.sub(replace_with_placeholder, text)
-
-    # フェーズ2: プレースホルダー以外の部分に対して通常の変換を行う
-    converted_temp_text = ""
-    i = 0
-    while i < len(temp_text):
-        char = temp_text[i]
-        
-        # プレースホルダーかどうかのチェック
-        if char == '_' and temp_text[i:i+16].startswith('__PLACEHOLDER_'): # __PLACEHOLDER_XX__ の長さ
-            end_idx = temp_text.find('__', i + 1)
-            if end_idx != -1:
-                end_idx += 2
-                placeholder = temp_text[i:end_idx]
-                converted_temp_text += placeholder
-                i = end_idx
-                continue
-            
-        # 数字と判断される文字 (全角数字)
-        if '０' <= char <= '９':
-            converted_temp_text += kanji_map[chr(ord(char) - ord('０') + ord('0'))]
-        # ハイフン（全角・半角長音符）を縦棒に変換
-        elif char in ['-', '－', 'ー']:
-            converted_temp_text += '｜'
-        else:
-            converted_temp_text += char
-        i += 1
-    
-    # フェーズ3: プレースホルダーを元の文字列に戻す
-    final_text = converted_temp_text
-    for placeholder, original_text in preserved_parts.items():
-        final_text = final_text.replace(placeholder, original_text)
-
-    return final_text
+    parts = []
+    last_end = 0
+    for match in _ADDRESS_SKIP_PATTERN.finditer(text):
+        parts.append(text[last_end:match.start()].translate(_ADDRESS_NUMBER_TABLE))
+        parts.append(match.group())
+        last_end = match.end()
+    if not parts:
+        return text.translate(_ADDRESS_NUMBER_TABLE)
+    parts.append(text[last_end:].translate(_ADDRESS_NUMBER_TABLE))
+    return "".join(parts)
 
 
 def _normalize_name_spacing(name_fullwidth_input):
@@ -278,341 +384,2279 @@ def _normalize_name_spacing(name_fullwidth_input):
     return normalized_name
 
 
-def draw_vertical_text(img_obj, draw_obj, text, font, start_x, start_y, char_y_spacing, text_color=(0,0,0)):
+# 住所録では同じ市区町村名や建物名が何度も現れるため、正規化の結果を件数上限付きでキャッシュする
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_address(text):
+    """住所を全角に変換し、数字を漢数字に、ハイフンを全角縦棒に変換する。"""
+    return _convert_address_numbers_and_hyphens(_convert_halfwidth_to_fullwidth_all(text))
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_name(text):
+    """氏名を全角に変換し、スペースを正規化する。"""
+    return _normalize_name_spacing(_convert_halfwidth_to_fullwidth_all(text))
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_fullwidth(text):
+    """文字列を全角に変換する (氏名２など、スペースの正規化を行わない項目用)。"""
+    return _convert_halfwidth_to_fullwidth_all(text)
+
+
+
+# --- グリフキャッシュ ---
+GLYPH_CACHE_MAX_ENTRIES = 4096 # グリフキャッシュに保持する最大文字数 (0でキャッシュしない)
+
+class GlyphCache:
     """
-    縦書きでテキストを描画するヘルパー関数。
-    一文字ずつ描画し、縦に積み重ねる。
-    全角文字（日本語、漢数字、全角縦棒、全角アルファベットなど）は回転しない。
-    Returns the Y-coordinate after the last character is drawn.
+    ラスタライズ済みのグリフをLRU方式で保持するキャッシュ。
+    (フォントファイル, サイズ, 文字) ごとのバウンディングボックス・送り幅と、
+    (フォントファイル, サイズ, 文字, 描画位置の小数部) ごとのマスク画像を保存し、
+    同じ文字の2回目以降はFreeTypeを呼ばずにマスクを貼り付ける。
+    マスクは ImageDraw.text で描画し、ImageDraw.bitmap で貼り付ける (どちらもPillowの公開API)。
+    ImageDraw.text と同じ塗り方になるため、結果はピクセル単位で一致する。
+    寸法とマスクはどちらも1件として数え、合計が max_entries を超えると古いものから削除する。
+    1つのキャッシュを氏名・敬称・住所・郵便番号の全フォントで共有できる。
+    """
+
+    def __init__(self, max_entries=GLYPH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _get_metrics(self, font, char, mode):
+        """(バウンディングボックス, 送り幅) を取得する。無ければ計算して登録する。"""
+        key = (font.path, font.size, font.index, char, mode)
+        entry = self._lookup(key)
+        if entry is None:
+            # 送り幅は draw_horizontal_zip_code と同じく既定のモードで計算する
+            entry = self._store(key, (font.getbbox(char, mode), font.getlength(char)))
+        return entry
+
+    def getbbox(self, font, char, mode):
+        """font.getbbox(char, mode) (= ImageDraw.textbbox((0, 0), char, font=font)) と同じ値を返す。"""
+        return self._get_metrics(font, char, mode)[0]
+
+    def getlength(self, font, char, mode):
+        """font.getlength(char) と同じ値を返す。"""
+        return self._get_metrics(font, char, mode)[1]
+
+    def _render_mask(self, font, char, mode, start):
+        """
+        描画位置の小数部が start の場合のグリフを、mode ('1' または 'L') のマスク画像に描画する。
+        Returns (mask image, (x, y) offset of the mask from the integer part of the drawing position).
+        """
+        from PIL import Image, ImageDraw
+        left, top, right, bottom = self._get_metrics(font, char, mode)[0]
+        # 描画位置が負にならないよう余白を取り、小数部が start と同じ位置に描画する
+        # (ImageDraw.text は位置の整数部にグリフを置き、小数部をラスタライズの開始位置として使う)
+        margin_x = 1 - min(left, 0)
+        margin_y = 1 - min(top, 0)
+        mask = Image.new(mode, (margin_x + max(right, 0) + 2, margin_y + max(bottom, 0) + 2), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        mask_draw.fontmode = mode
+        mask_draw.text((margin_x + start[0], margin_y + start[1]), char, font=font, fill=255)
+        return mask, (-margin_x, -margin_y)
+
+    def text(self, draw_obj, xy, char, font, fill):
+        """draw_obj.text(xy, char, font=font, fill=fill) と同じ結果になるように1文字描画する。"""
+        mode = draw_obj.fontmode
+        # ImageDraw.text と同様に、座標の小数部はラスタライズ時の開始位置として扱う
+        start = (math.modf(xy[0])[0], math.modf(xy[1])[0])
+        key = (font.path, font.size, font.index, char, mode, start)
+        cached = self._lookup(key)
+        if cached is None:
+            self.misses += 1
+            cached = self._store(key, self._render_mask(font, char, mode, start))
+        else:
+            self.hits += 1
+        mask, offset = cached
+        draw_obj.bitmap((int(xy[0]) + offset[0], int(xy[1]) + offset[1]), mask, fill=fill)
+
+
+# --- レイアウト (ディスプレイリストの作成) ---
+# ディスプレイリストは1枚分の文字を (フォント, 文字, X座標, Y座標) のタプルで並べたもの。
+# 座標は ImageDraw.text と同じ左上基準で、ピクセルを描画せずに計算できる。
+
+def layout_vertical_text(glyphs, font_key, font, text, start_x, start_y, char_y_spacing, fontmode='L', glyph_cache=None):
+    """
+    縦書きのテキストを一文字ずつ縦に積み重ねた位置を計算し、glyphs に (font_key, 文字, X, Y) を追加する。
+    各文字は start_x を中心に横方向の位置を揃える。全角文字は回転しない。
+    fontmode には描画先の ImageDraw.fontmode ('1' または 'L') を指定する。
+    Returns the Y-coordinate after the last character.
     """
     current_y = start_y
     for char in text:
-        bbox = draw_obj.textbbox((0, 0), char, font=font)
+        if glyph_cache is not None:
+            bbox = glyph_cache.getbbox(font, char, fontmode)
+        else:
+            bbox = font.getbbox(char, fontmode)
         char_width = bbox[2] - bbox[0]
-        
+
         char_draw_x = start_x - (char_width / 2)
-        
-        draw_obj.text((char_draw_x, current_y), char, font=font, fill=text_color)
+        glyphs.append((font_key, char, char_draw_x, current_y))
         current_y += char_y_spacing
     return current_y
 
-def draw_horizontal_zip_code(draw_obj, text, font, start_x, start_y, char_offsets, text_color=(0,0,0)):
+def layout_horizontal_zip_code(glyphs, font_key, font, text, start_x, start_y, char_offsets, fontmode='L', glyph_cache=None):
     """
-    郵便番号を横書きで、個別の桁間隔を考慮して描画する。
-    Returns the X-coordinate after the last character is drawn and its offset is applied.
+    郵便番号を横書きで、個別の桁間隔を考慮して並べた位置を計算し、glyphs に (font_key, 文字, X, Y) を追加する。
+    Returns the X-coordinate after the last character and its offset.
     """
     current_x = start_x
     for i, char in enumerate(text):
-        draw_obj.text((current_x, start_y), char, font=font, fill=text_color)
-        char_length = font.getlength(char)
+        glyphs.append((font_key, char, current_x, start_y))
+        if glyph_cache is not None:
+            char_length = glyph_cache.getlength(font, char, fontmode)
+        else:
+            char_length = font.getlength(char)
         current_x += char_length
-        
+
         if i < len(char_offsets):
             current_x += char_offsets[i]
     return current_x
 
+def draw_glyph(draw_obj, font, char, x, y, text_color=(0,0,0), glyph_cache=None):
+    """ディスプレイリストの1文字を描画する。glyph_cache を指定すると、ラスタライズ済みのグリフを再利用する。"""
+    if glyph_cache is not None:
+        glyph_cache.text(draw_obj, (x, y), char, font, text_color)
+    else:
+        draw_obj.text((x, y), char, font=font, fill=text_color)
+
+def draw_vertical_text(img_obj, draw_obj, text, font, start_x, start_y, char_y_spacing, text_color=(0,0,0), glyph_cache=None):
+    """
+    縦書きでテキストを描画するヘルパー関数。
+    一文字ずつ描画し、縦に積み重ねる。
+    全角文字（日本語、漢数字、全角縦棒、全角アルファベットなど）は回転しない。
+    glyph_cache を指定すると、ラスタライズ済みのグリフを再利用する。
+    Returns the Y-coordinate after the last character is drawn.
+    """
+    glyphs = []
+    current_y = layout_vertical_text(glyphs, font, font, text, start_x, start_y, char_y_spacing, draw_obj.fontmode, glyph_cache)
+    for _, char, x, y in glyphs:
+        draw_glyph(draw_obj, font, char, x, y, text_color, glyph_cache)
+    return current_y
+
+def draw_horizontal_zip_code(draw_obj, text, font, start_x, start_y, char_offsets, text_color=(0,0,0), glyph_cache=None):
+    """
+    郵便番号を横書きで、個別の桁間隔を考慮して描画する。
+    glyph_cache を指定すると、ラスタライズ済みのグリフを再利用する。
+    Returns the X-coordinate after the last character is drawn and its offset is applied.
+    """
+    glyphs = []
+    current_x = layout_horizontal_zip_code(glyphs, font, font, text, start_x, start_y, char_offsets, draw_obj.fontmode, glyph_cache)
+    for _, char, x, y in glyphs:
+        draw_glyph(draw_obj, font, char, x, y, text_color, glyph_cache)
+    return current_x
+
+
+def normalize_row(row):
+    """
+    CSVの1行 (辞書) から宛名に使う値を取り出し、描画用に正規化する。
+    Returns (zip_code, address1, address2, name1, name2, title, title2).
+    """
+    # CSVから必要なデータを取り出す
+    name1_raw = row.get('氏名', '').strip()
+    name2_raw = row.get('氏名２', '').strip()
+    zip_code_raw = row.get('郵便番号', '').strip()
+    address1_raw = row.get('住所１', '').strip()
+    address2_raw = row.get('住所２', '').strip()
+    title = row.get('敬称', DEFAULT_TITLE).strip()
+    title2 = row.get('敬称２', '').strip() # 新しい敬称２の取得
+
+    # --- 住所を全角に変換し、数字を漢数字に、半角・全角ハイフンを全角縦棒に変換 ---
+    address1_final = normalize_address(address1_raw)
+    address2_final = normalize_address(address2_raw)
+
+    # --- 氏名の全角変換とスペース正規化 ---
+    name1_final = normalize_name(name1_raw)
+
+    name2_full_converted = normalize_fullwidth(name2_raw) # 氏名2も全角変換
+
+    # --- 郵便番号 (数字以外を取り除く) ---
+    zip_code = re.sub(r'[^0-9]', '', zip_code_raw)
+
+    return zip_code, address1_final, address2_final, name1_final, name2_full_converted, title, title2
+
+
+def _layout_names(name1, name2, start_y, char_y_spacing, surname_gap, title_gap):
+    """
+    氏名1・氏名2 (連名) を名字と名前に分け、名前と敬称の開始Y座標を求める。
+    名前の開始位置は長い方の名字に、敬称の開始位置はより下で終わる氏名に揃える。
+    start_y 以降は PageLayout のピクセル値 (文字の間隔と名字・敬称との間隔は、自動調整 (fit_fields) で縮小した値)。
+    Returns (surname1, first_name1, surname2, first_name2, name_start_y, title_start_y).
+    """
+    # 氏名1の処理
+    surname1_part = ""
+    name1_first_name_part = ""
+    if '　' in name1:
+        surname1_part, name1_first_name_part = name1.split('　', 1)
+    else:
+        surname1_part = name1
+
+    # 氏名2の処理
+    surname2_part = ""
+    name2_first_name_part = ""
+    if '　' in name2:
+        surname2_part, name2_first_name_part = name2.split('　', 1)
+    else:
+        name2_first_name_part = name2 # スペースがない場合は全体を名前とみなす
+
+    # 名前開始のY座標を揃えるための基準Y座標を決定
+    # 名字部分が長い場合も考慮し、全体として長くなる方に合わせる
+    # 氏名1と氏名2それぞれの名字の終端Y座標を計算
+    temp_y_after_surname1 = start_y + len(surname1_part) * char_y_spacing
+    temp_y_after_surname2 = start_y
+    if surname2_part:
+        temp_y_after_surname2 = start_y + len(surname2_part) * char_y_spacing
+
+    # 名前部分が始まるY座標は、長い方の名字の終端にオフセットを加えた位置に揃える
+    unified_name_start_y = max(temp_y_after_surname1, temp_y_after_surname2) + surname_gap
+
+    # 敬称のY座標を揃えるための基準Y座標を決定
+    # 氏名1の最終Y座標を正確に計算
+    final_y_name1_end = start_y + len(surname1_part) * char_y_spacing
+    if name1_first_name_part:
+        final_y_name1_end = unified_name_start_y + len(name1_first_name_part) * char_y_spacing
+
+    # 氏名2の最終Y座標を正確に計算
+    final_y_name2_end = start_y # 初期値
+    if name2:
+        if surname2_part:
+            final_y_name2_end = start_y + len(surname2_part) * char_y_spacing # 名字の最終Y
+        if name2_first_name_part:
+            final_y_name2_end = unified_name_start_y + len(name2_first_name_part) * char_y_spacing # 名前の最終Y
+
+    # 敬称のY座標は、氏名1と氏名2のより下にある氏名の終端Y座標に合わせる
+    unified_title_start_y = max(final_y_name1_end, final_y_name2_end) + title_gap
+
+    return surname1_part, name1_first_name_part, surname2_part, name2_first_name_part, unified_name_start_y, unified_title_start_y
+
+
+# --- 自動調整 (はみ出しの検出と縮小・折り返し) ---
+# 住所・氏名の列がハガキの下端 (印刷できる範囲) からはみ出すかどうかを、ピクセルを描画せずに
+# 文字の送り (文字間隔) と全角の字面の高さ (フォントサイズ) だけから計算する。
+# はみ出す列は、文字サイズと間隔を同じ比率で縮小するか、住所は2列に折り返す
+# (住所１と住所２の両方を折り返すと氏名の列に重なるため、住所２は住所１を折り返さない場合だけ折り返す)。
+AUTOFIT_BOTTOM_MARGIN_MM = 5.0 # ハガキの下端から、文字を配置しない余白 (mm)
+AUTOFIT_MIN_SCALE = 0.7 # 縮小する場合の最小の比率 (元の文字サイズに対して)
+# 住所を折り返す場合に、この文字の後ろで改行することを優先する (住所の区切り)
+AUTOFIT_WRAP_AFTER = frozenset('都道府県市区町村郡丁目番号')
+
+# 調整の結果
+FIT_OK = 'ok'
+FIT_SHRUNK = 'shrunk' # 文字サイズと間隔を縮小した
+FIT_WRAPPED = 'wrapped' # 2列に折り返した
+FIT_OVERFLOW = 'overflow' # 最小の比率でも収まらない (自動調整しない場合は、はみ出す列)
+FIT_STATUS_MESSAGES = {FIT_SHRUNK: '縮小', FIT_WRAPPED: '折り返し', FIT_OVERFLOW: 'はみ出し'}
+
+# status: 調整の結果 / font_size, spacing: 配置に使う文字サイズと文字間隔 /
+# parts: 列ごとの文字列 (住所のみ) / overflow: 元の文字サイズで下端からはみ出す量 (ピクセル、収まる場合は0以下)
+ColumnFit = namedtuple('ColumnFit', 'status font_size spacing parts overflow')
+FitPlan = namedtuple('FitPlan', 'address1 address2 names')
+
+
+def _autofit_bottom_y(layout):
+    """文字を収める下端のY座標 (ピクセル)。"""
+    return layout.postcard_height - int(AUTOFIT_BOTTOM_MARGIN_MM * layout.pixels_per_mm)
+
+
+def _scaled(value, font_size, base_font_size):
+    """文字サイズの縮小に合わせて、間隔などの値を同じ比率で縮小する。"""
+    return value if font_size == base_font_size else round(value * font_size / base_font_size)
+
+
+def _column_bottom(start_y, length, spacing, font_size):
+    """縦書きの列の最後の文字の下端のY座標。"""
+    return start_y + (length - 1) * spacing + font_size if length else start_y
+
+
+def _largest_fitting_size(fits, base_size):
+    """fits(文字サイズ) が True になる最大の文字サイズを二分探索で求める (最小の比率でも収まらなければ None)。"""
+    low = max(1, math.ceil(base_size * AUTOFIT_MIN_SCALE))
+    if not fits(low):
+        return None
+    high = base_size
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _wrap_point(text, capacity):
+    """text を2列に分ける位置。1列目に収まる範囲で、なるべく住所の区切りの直後で分ける。"""
+    earliest = len(text) - capacity # 2列目に収まる最小の位置
+    for i in range(capacity, max(earliest, capacity // 2, 1) - 1, -1):
+        if text[i - 1] in AUTOFIT_WRAP_AFTER:
+            return i
+    return capacity
+
+
+def fit_vertical_column(text, start_y, base_size, base_spacing, bottom_y, allow_wrap=False):
+    """
+    縦書きの1列が bottom_y に収まる最大の文字サイズと間隔を求める。
+    allow_wrap が True の場合、縮小しても収まらない列は2列に折り返す (折り返した上で縮小することもある)。
+    Returns a ColumnFit.
+    """
+    length = len(text)
+    overflow = _column_bottom(start_y, length, base_spacing, base_size) - bottom_y
+    if overflow <= 0:
+        return ColumnFit(FIT_OK, base_size, base_spacing, (text,), overflow)
+
+    def spacing_for(size):
+        return _scaled(base_spacing, size, base_size)
+
+    size = _largest_fitting_size(
+        lambda size: _column_bottom(start_y, length, spacing_for(size), size) <= bottom_y, base_size)
+    if size is not None:
+        return ColumnFit(FIT_SHRUNK, size, spacing_for(size), (text,), overflow)
+
+    if allow_wrap:
+        def capacity(size):
+            return int((bottom_y - start_y - size) // spacing_for(size)) + 1
+
+        size = _largest_fitting_size(lambda size: 2 * capacity(size) >= length, base_size)
+        if size is not None:
+            split = _wrap_point(text, capacity(size))
+            return ColumnFit(FIT_WRAPPED, size, spacing_for(size), (text[:split], text[split:]), overflow)
+
+    size = max(1, math.ceil(base_size * AUTOFIT_MIN_SCALE))
+    return ColumnFit(FIT_OVERFLOW, size, spacing_for(size), (text,), overflow)
+
+
+def _names_bottom(name1, name2, title, title2, name_size, layout):
+    """氏名・敬称を name_size (氏名１の文字サイズ) で配置した場合の、最も下の文字の下端のY座標。"""
+    base_size = layout.name_font_size
+    spacing = _scaled(layout.name_char_y_spacing, name_size, base_size)
+    title_gap = _scaled(layout.offset_title_y_from_name_end, name_size, base_size)
+    title_size = _scaled(layout.title_font_size, name_size, base_size)
+    *_, title_start_y = _layout_names(name1, name2, layout.name_line_y_start, spacing,
+                                      _scaled(layout.offset_name1_y_from_surname_end_after_space, name_size, base_size),
+                                      title_gap)
+    title_length = max(len(title), len(title2))
+    if title_length:
+        # 敬称は文字サイズと同じ間隔で並べる
+        return _column_bottom(title_start_y, title_length, title_size, title_size)
+    # 最後の氏名の文字の送りの終端から、字面の下端に戻す
+    return title_start_y - title_gap - spacing + max(name_size, _scaled(layout.name2_font_size, name_size, base_size))
+
+
+def fit_names(name1, name2, title, title2, layout=DEFAULT_LAYOUT):
+    """
+    氏名・連名・敬称が bottom_y に収まる最大の文字サイズを求める。氏名のフォント・文字間隔・敬称との間隔は
+    全て同じ比率で縮小する (氏名は折り返さない)。font_size は氏名１の文字サイズ、spacing は氏名の文字間隔。
+    Returns a ColumnFit (parts is empty).
+    """
+    bottom_y = _autofit_bottom_y(layout)
+    base_size = layout.name_font_size
+    overflow = _names_bottom(name1, name2, title, title2, base_size, layout) - bottom_y
+    if overflow <= 0:
+        return ColumnFit(FIT_OK, base_size, layout.name_char_y_spacing, (), overflow)
+    size = _largest_fitting_size(lambda size: _names_bottom(name1, name2, title, title2, size, layout) <= bottom_y,
+                                 base_size)
+    status = FIT_SHRUNK
+    if size is None:
+        status, size = FIT_OVERFLOW, max(1, math.ceil(base_size * AUTOFIT_MIN_SCALE))
+    return ColumnFit(status, size, _scaled(layout.name_char_y_spacing, size, base_size), (), overflow)
+
+
+def fit_fields(zip_code, address1, address2, name1, name2, title, title2, layout=DEFAULT_LAYOUT):
+    """
+    normalize_row で正規化した1行分の値から、住所１・住所２・氏名のそれぞれの列の調整方法を求める。
+    文字数と設定値だけから計算するため、フォントの読み込みも描画も必要ない。
+    座標と文字サイズは layout (PageLayout) のピクセル値で計算する。
+    Returns a FitPlan.
+    """
+    bottom_y = _autofit_bottom_y(layout)
+    address_args = (layout.address_line_y_start, layout.address_font_size, layout.address_char_y_spacing, bottom_y)
+    address1_fit = fit_vertical_column(address1, *address_args, allow_wrap=True)
+    address2_fit = fit_vertical_column(address2, *address_args, allow_wrap=address1_fit.status != FIT_WRAPPED)
+    return FitPlan(address1_fit, address2_fit, fit_names(name1, name2, title, title2, layout))
+
+
+class FitReport:
+    """
+    自動調整で縮小・折り返しした列と、はみ出す列をCSVに書き出すレポート。文字サイズは印刷用の解像度 (TEMPLATE_DPI) のピクセル値。
+    path が None の場合はファイルに書かず、件数だけを数える。
+    auto_fit が False の場合 (調整せずに描画する場合) は、元の文字サイズではみ出す列だけを記録する。
+    """
+
+    FIELDNAMES = ['行', '氏名', '項目', '判定', '文字サイズ', '調整後の文字サイズ', '元の文字サイズでのはみ出し(mm)']
+    COLUMNS = (('address1', '住所１'), ('address2', '住所２'), ('names', '氏名・敬称'))
+
+    def __init__(self, path=None, auto_fit=True):
+        self.path = path
+        self.auto_fit = auto_fit
+        self.counts = {}
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        if path is not None:
+            self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.FIELDNAMES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, row_number, name, plan):
+        """1行分の FitPlan を記録する。"""
+        adjusted = False
+        for field, label in self.COLUMNS:
+            fit = getattr(plan, field)
+            status = fit.status if self.auto_fit else (FIT_OK if fit.overflow <= 0 else FIT_OVERFLOW)
+            if status == FIT_OK:
+                continue
+            adjusted = True
+            self.counts[status] = self.counts.get(status, 0) + 1
+            if self._writer is not None:
+                base_size = DEFAULT_LAYOUT.name_font_size if field == 'names' else DEFAULT_LAYOUT.address_font_size
+                self._writer.writerow([row_number, name, label, FIT_STATUS_MESSAGES[status], base_size,
+                                       fit.font_size if self.auto_fit else base_size,
+                                       f'{fit.overflow / DEFAULT_LAYOUT.pixels_per_mm:.1f}'])
+        self.rows += adjusted
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        """調整した列の件数をまとめた文字列を返す (調整もはみ出しもなければ空文字列)。"""
+        if not self.rows:
+            return ''
+        parts = ' / '.join(f"{FIT_STATUS_MESSAGES[status]} {count} 列" for status, count in sorted(self.counts.items()))
+        if self.auto_fit:
+            text = f"文字が下端に収まらない {self.rows} 枚のハガキを自動調整しました ({parts})。"
+        else:
+            text = f"文字がハガキの下端からはみ出すハガキが {self.rows} 枚あります ({parts})。--auto-fit で縮小・折り返しできます。"
+        if self.path is not None:
+            text += f"\n対象の行を書き出しました: {self.path}"
+        return text
+
+
+# --- 行ごとのエラーとチェックポイント (中断した処理の再開) ---
+CHECKPOINT_INTERVAL_CARDS = 500 # この枚数を処理するごとにチェックポイントを保存する
+CHECKPOINT_VERSION = 1
+
+# 描画できなかった行の代わりに返す値 (ワーカープロセスから親プロセスへ渡せるよう、例外ではなく文字列で持つ)
+RowFailure = namedtuple('RowFailure', ['message'])
 
-# --- テンプレートの準備 ---
-if GENERATE_TEMPLATE:
+
+def _row_failure(error, row=None):
+    """描画中の例外から RowFailure を作る。列の足りない行などでは、例外の代わりに check_row の理由を使う。"""
+    return RowFailure((row is not None and check_row(row)) or f"{type(error).__name__}: {error}")
+
+
+def check_row(row):
+    """
+    行データを描画できるかを調べ、できない場合はその理由を返す (描画できる場合は None)。
+    ヘッダーより列の少ない行 (値が None の列がある行) と、正規化できない行を見つける。
+    """
+    missing = [str(key) for key, value in row.items() if value is None]
+    if missing:
+        return f"列の数がヘッダーより少なくなっています (値の無い列: {', '.join(missing)})"
     try:
-        TEMPLATE_IMAGE_PATH = generate_postcard_template(
-            AUTO_TEMPLATE_FILENAME, TEMPLATE_DPI,
-            POSTCARD_WIDTH_MM, POSTCARD_HEIGHT_MM
-        )
+        normalize_row(row)
     except Exception as e:
-        messagebox.showerror("エラー", f"テンプレートの自動生成に失敗しました: {e}\n「GENERATE_TEMPLATE」をFalseに設定し、手動でテンプレート画像を用意してください。")
-        sys.exit()
-else:
-    if not os.path.exists(TEMPLATE_IMAGE_PATH):
-        messagebox.showerror("エラー", f"指定されたテンプレート画像が見つかりません: {TEMPLATE_IMAGE_PATH}\n「TEMPLATE_IMAGE_PATH」の設定と、ファイルが存在するか確認してください。")
-        sys.exit()
-
-# --- フォントのロード ---
-name_font = None
-name2_font = None
-title_font = None
-address_font = None
-zip_font = None
-
-print(f"フォント「{FONT_FILENAME}」をロードしています...")
-try:
-    font_index = 0
-    name_font = ImageFont.truetype(FONT_PATH, COMMON_NAME_FONT_SIZE, index=font_index)
-    name2_font = ImageFont.truetype(FONT_PATH, COMMON_NAME_FONT_SIZE, index=font_index)
-    title_font = ImageFont.truetype(FONT_PATH, COMMON_NAME_FONT_SIZE, index=font_index)
-    address_font = ImageFont.truetype(FONT_PATH, ADDRESS_FONT_SIZE, index=font_index)
-    zip_font = ImageFont.truetype(FONT_PATH, ZIP_FONT_SIZE, index=font_index)
-
-    print(f"フォント「{os.path.basename(FONT_PATH)}」をロードしました。")
-except IOError:
-    messagebox.showerror("エラー", f"フォントファイルが見つからないか、読み込めません: {FONT_PATH}\n指定されたフォントファイルがスクリプトと同じディレクトリにあるか、PyInstallerの--add-dataオプションで正しくバンドルされているか確認してください。")
-    sys.exit()
-except Exception as e:
-    messagebox.showerror("エラー", f"フォントのロード中に予期せぬエラーが発生しました: {e}")
-    sys.exit()
-
-# --- CSVファイルの選択 ---
-messagebox.showinfo("CSVファイル選択", "次に、住所録CSVファイルを選択してください。\n\nCSVファイルには以下のヘッダーが必要です:\n氏名,郵便番号,住所１\n\nオプションで連名用: 氏名２\nオプションで敬称個別指定用: 敬称\nオプションで連名用の敬称: 敬称２\nオプションで住所詳細: 住所２\n\n**全ての半角文字（英数字、カタカナ、記号、スペースを含む）は自動的に全角に変換されます。\n氏名１に含まれる全角スペースは自動的に1つに正規化されます。複数のスペースを入れすぎるとレイアウトが崩れる可能性があります。\n氏名２には、名字（スペース区切りで）と名前を入力してください。名字がない場合は名前のみで構いません。\n住所中の半角・全角ハイフンは自動で縦棒に、半角数字は漢数字に変換されます。**")
-
-CSV_FILE_PATH = filedialog.askopenfilename(
-    title="住所録CSVファイルを選択",
-    filetypes=[("CSVファイル", "*.csv"), ("全てのファイル", "*.*")]
-)
+        return f"{type(e).__name__}: {e}"
+    return None
 
-if not CSV_FILE_PATH:
-    messagebox.showwarning("処理中断", "CSVファイルが選択されませんでした。スクリプトを終了します。")
-    sys.exit()
 
-# --- PDFファイル名の指定と保存場所の選択 ---
-messagebox.showinfo("PDFファイル保存", "生成されたPDFファイルの保存先とファイル名を指定してください。")
+class ErrorReport:
+    """
+    描画できなかった行 (行番号・氏名・エラーの内容) を記録し、CSVに書き出すレポート。
+    ファイルは最初のエラーを記録する時点で作成する (エラーが無ければ作成しない)。path が None の場合は件数だけを数える。
+    """
 
-output_pdf_path = filedialog.asksaveasfilename(
-    title="PDFファイルを保存",
-    defaultextension=".pdf",
-    filetypes=[("PDFファイル", "*.pdf"), ("全てのファイル", "*.*")],
-    initialfile="generated_postcards.pdf"
-)
+    FIELDNAMES = ['行', '氏名', 'エラー']
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = [] # (行番号, 氏名, エラー)。チェックポイントにも保存する
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, row_number, name, message):
+        self.entries.append((row_number, name, message))
+        if self.path is None:
+            return
+        if self._writer is None:
+            self._file = open(self.path, 'w', encoding='utf-8-sig', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.FIELDNAMES)
+        self._writer.writerow([row_number, name, message])
+        # 途中で強制終了されても、記録したエラーが残るようにする
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        """エラーの件数をまとめた文字列を返す (エラーが無ければ空文字列)。"""
+        if not self.entries:
+            return ''
+        text = f"描画できなかった {len(self.entries)} 行を飛ばして処理しました。"
+        if self.path is not None:
+            text += f"\n対象の行とエラーの内容を書き出しました: {self.path}"
+        return text
+
+
+def default_error_report_path(out_path):
+    """出力ファイルのパスから、エラーのレポートの保存先 (拡張子を .errors.csv にしたもの) を作る。"""
+    return os.path.splitext(out_path)[0] + '.errors.csv'
+
+
+def default_checkpoint_path(out_path):
+    """出力ファイルのパスから、チェックポイントの保存先 (拡張子を .checkpoint.json にしたもの) を作る。"""
+    return os.path.splitext(out_path)[0] + '.checkpoint.json'
+
+
+def save_checkpoint(path, state):
+    """チェックポイントを保存する。一時ファイルに書いてから置き換えるため、保存中に中断しても前回の内容が残る。"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """保存したチェックポイントを読み込む。ファイルが無い場合は None を返す。"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise ValueError(f"チェックポイントのファイルを読み込めません: {path}") from e
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"チェックポイントの形式が異なるため再開できません: {path}")
+    return state
+
+
+# --- 固定レイヤー ---
+class StaticLayer:
+    """
+    全てのハガキに共通して描画する要素 (郵便番号枠・差出人・ロゴ) をまとめた固定レイヤー。
+    PostcardRenderer の生成時にテンプレートへ一度だけ描画され、以降は各ハガキで使い回される。
+    """
 
-if not output_pdf_path:
-    messagebox.showwarning("処理中断", "PDFファイルの保存先が指定されませんでした。スクリプトを終了します。")
-    sys.exit()
+    def __init__(self, zip_boxes=False, sender_name='', sender_address='', sender_zip_code='', logo_path=None):
+        self.zip_boxes = zip_boxes
+        self.sender_name = sender_name
+        self.sender_address = sender_address
+        self.sender_zip_code = sender_zip_code
+        self.logo_path = logo_path
+
+    def draw(self, img, font_path, layout=DEFAULT_LAYOUT):
+        """テンプレート画像に固定レイヤーを描画する。座標は layout (img と同じDPIの PageLayout) に従う。"""
+        from PIL import ImageDraw, ImageFont
+        draw = ImageDraw.Draw(img)
+
+        if self.zip_boxes:
+            self._draw_zip_boxes(draw, layout)
+
+        if self.sender_name or self.sender_address or self.sender_zip_code:
+            sender_font = ImageFont.truetype(font_path, layout.sender_font_size)
+            self._draw_sender(img, draw, sender_font, layout)
+
+        if self.logo_path:
+            self._draw_logo(img, layout)
+
+    def _draw_zip_boxes(self, draw, layout):
+        """郵便番号枠 (7桁) を描画する。"""
+        box_width = layout.zip_box_individual_width
+        top = layout.zip_top_margin
+        for i in range(7):
+            left = layout.zip_overall_left_x + i * (box_width + layout.zip_box_inner_gap)
+            draw.rectangle(
+                (left, top, left + box_width, top + layout.zip_box_height),
+                outline=_color_for_mode(TEXT_COLOR, draw.mode), width=layout.zip_box_line_width
+            )
+
+    def _draw_sender(self, img, draw, font, layout):
+        """差出人の住所・氏名 (縦書き) と郵便番号 (横書き) を描画する。"""
+        text_color = _color_for_mode(TEXT_COLOR, img.mode)
+        if self.sender_address:
+            address = normalize_address(self.sender_address)
+            draw_vertical_text(img, draw, address, font, layout.sender_address_x, layout.sender_line_y_start, layout.sender_address_char_y_spacing, text_color)
+        if self.sender_name:
+            name = normalize_name(self.sender_name)
+            draw_vertical_text(img, draw, name, font, layout.sender_name_x, layout.sender_line_y_start, layout.sender_name_char_y_spacing, text_color)
+
+        zip_code = re.sub(r'[^0-9]', '', self.sender_zip_code)
+        if len(zip_code) == 7:
+            draw_horizontal_zip_code(draw, zip_code, font, layout.sender_zip_pos[0], layout.sender_zip_pos[1], layout.sender_zip_char_offsets, text_color)
 
-# 選択されたパスからディレクトリを抽出し、存在しない場合は作成
-OUTPUT_DIR = os.path.dirname(output_pdf_path)
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-    print(f"出力フォルダ「{OUTPUT_DIR}」を作成しました。")
-else:
-    print(f"出力フォルダ「{OUTPUT_DIR}」を使用します。")
+    def _draw_logo(self, img, layout):
+        """ロゴ画像を貼り付ける。透過PNGの場合は透過部分を残す。"""
+        from PIL import Image
+        with Image.open(self.logo_path) as logo:
+            logo = logo.convert("RGBA")
+            logo.thumbnail(layout.logo_max_size)
+            img.paste(logo, layout.logo_pos, logo)
 
 
-# --- CSVファイルの読み込みと画像生成 ---
-print(f"CSVファイル「{CSV_FILE_PATH}」を読み込み、ハガキ画像を生成します...")
+# --- CSVファイルの読み込み ---
+CSV_SNIFF_BYTES = 4096 # エンコーディングの検出に使う先頭のバイト数
+CSV_ENCODINGS_TO_TRY = ['utf-8', 'shift_jis', 'cp932', 'euc_jp'] # 試すエンコーディングのリスト
 
-# 処理対象のファイル数を事前に取得
-detected_encoding = None
-try:
-    # ファイルのバイナリを読み込み、エンコーディングを検出
-    with open(CSV_FILE_PATH, 'rb') as f:
-        # 先頭の数バイトを読み込むことで、小さいファイルでも検出精度を上げる
-        raw_data = f.read(4096) # Read up to 4KB for detection
-    
+def detect_encoding(raw_data, is_complete=False):
+    """
+    CSVファイルの先頭のバイト列からエンコーディングを検出する。
+    chardetの信頼度が低い場合は、一般的なエンコーディングでバイト列を順次デコードしてみる。
+    is_complete は raw_data がファイル全体かどうか (末尾の文字が途中で切れていないか) を表す。
+    検出できなかった場合は ValueError を送出する。
+    """
+    import chardet # エンコーディング自動検出用
     result = chardet.detect(raw_data)
-    
+
     # 信頼度が高い場合はそのエンコーディングを使用
     if result['confidence'] > 0.9: # 信頼度をやや高めに設定
-        detected_encoding = result['encoding']
-        print(f"CSVファイルのエンコーディングを {detected_encoding} と高信頼度で検出しました (信頼度: {result['confidence']:.2f})")
-    else:
-        # 信頼度が低い場合は、一般的なエンコーディングで試行
-        print(f"CSVファイルのエンコーディング検出の信頼度が低いです ({result['encoding']} 信頼度: {result['confidence']:.2f})。")
-        print("一般的なエンコーディング（UTF-8, Shift-JISなど）で順次試行します...")
-        
-        encodings_to_try = ['utf-8', 'shift_jis', 'cp932', 'euc_jp'] # 試すエンコーディングのリスト
+        print(f"CSVファイルのエンコーディングを {result['encoding']} と高信頼度で検出しました (信頼度: {result['confidence']:.2f})")
+        # 先頭がASCIIのみでも、その後に日本語が続く可能性があるためUTF-8として読む
+        if result['encoding'].lower() == 'ascii':
+            return 'utf-8'
+        return result['encoding']
 
-        for enc in encodings_to_try:
-            try:
-                with open(CSV_FILE_PATH, 'r', encoding=enc) as f:
-                    # ヘッダーを読み込み、エラーがなければ成功とみなす
-                    reader = csv.reader(f)
-                    header = next(reader)
-                    detected_encoding = enc
-                    print(f"CSVファイルを '{enc}' エンコーディングで正常に読み込めました。")
-                    break # 成功したらループを抜ける
-            except UnicodeDecodeError:
-                print(f"'{enc}' エンコーディングでの読み込みに失敗しました。")
-                continue
-            except Exception as e:
-                print(f"'{enc}' エンコーディングでの読み込み中に予期せぬエラー: {e}")
-                continue
-        
-        if not detected_encoding:
-            raise Exception("適切なエンコーディングを自動検出できませんでした。ファイルが破損しているか、対応していないエンコーディングかもしれません。")
-
-    # 検出されたエンコーディングでCSVを読み込み、行数を取得
-    with open(CSV_FILE_PATH, 'r', encoding=detected_encoding) as csvfile:
-        reader = csv.reader(csvfile)
-        header = next(reader, None) # ヘッダー行をスキップ
-        total_files_to_process = sum(1 for row in reader)
-        
-except Exception as e:
-    messagebox.showerror("エラー", f"CSVファイルの読み込み中にエラーが発生しました: {e}\nファイル形式やエンコーディングが正しいか確認してください。")
-    sys.exit()
-
-create_progress_window() # プログレスウィンドウを表示
-
-# PDF用の画像リスト
-pdf_pages = []
-
-try:
-    # 検出されたエンコーディングで再度CSVを開く
-    with open(CSV_FILE_PATH, 'r', encoding=detected_encoding) as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader) # 全行を読み込み
-
-    for i, row in enumerate(rows):
-        current_name_for_progress = row.get('氏名', '不明') # プログレスバー表示用
-        update_progress(current_name_for_progress, i + 1, total_files_to_process)
-
-        # テンプレート画像を開く (自動生成されたものまたは手動で用意したもの)
+    # 信頼度が低い場合は、一般的なエンコーディングで試行
+    print(f"CSVファイルのエンコーディング検出の信頼度が低いです ({result['encoding']} 信頼度: {result['confidence']:.2f})。")
+    print("一般的なエンコーディング（UTF-8, Shift-JISなど）で順次試行します...")
+
+    for enc in CSV_ENCODINGS_TO_TRY:
         try:
-            img = Image.open(TEMPLATE_IMAGE_PATH).copy()
-            img = img.convert("RGB")
-        except FileNotFoundError:
-            messagebox.showerror("致命的なエラー", f"テンプレート画像「{TEMPLATE_IMAGE_PATH}」が見つかりません。\n自動生成に失敗したか、手動で指定したファイルが存在しません。")
-            destroy_progress_window()
-            sys.exit()
-
-        draw = ImageDraw.Draw(img) # ImageDrawオブジェクトはここで作成
-
-        # CSVから必要なデータを取り出す
-        name1_raw = row.get('氏名', '').strip()
-        name2_raw = row.get('氏名２', '').strip()
-        zip_code_raw = row.get('郵便番号', '').strip()
-        address1_raw = row.get('住所１', '').strip()
-        address2_raw = row.get('住所２', '').strip()
-        title = row.get('敬称', DEFAULT_TITLE).strip()
-        title2 = row.get('敬称２', '').strip() # 新しい敬称２の取得
-
-        # --- 全ての半角文字を全角に変換する処理を最初に適用 ---
-        address1_fullwidth = _convert_halfwidth_to_fullwidth_all(address1_raw)
-        address2_fullwidth = _convert_halfwidth_to_fullwidth_all(address2_raw)
-
-        # --- 住所の数字を漢数字に変換し、半角・全角ハイフンを全角縦棒に変換 ---
-        address1_final = _convert_address_numbers_and_hyphens(address1_fullwidth)
-        address2_final = _convert_address_numbers_and_hyphens(address2_fullwidth)
-
-        # --- 氏名の全角変換とスペース正規化 ---
-        name1_fullwidth = _convert_halfwidth_to_fullwidth_all(name1_raw)
-        name1_final = _normalize_name_spacing(name1_fullwidth)
-
-        name2_full_converted = _convert_halfwidth_to_fullwidth_all(name2_raw) # 氏名2も全角変換
+            # 先頭のバイト列が最後まで正しくデコードできれば成功とみなす
+            codecs.getincrementaldecoder(enc)().decode(raw_data, final=is_complete)
+            print(f"CSVファイルを '{enc}' エンコーディングで正常に読み込めました。")
+            return enc
+        except UnicodeDecodeError:
+            print(f"'{enc}' エンコーディングでの読み込みに失敗しました。")
+            continue
+
+    raise ValueError("適切なエンコーディングを自動検出できませんでした。ファイルが破損しているか、対応していないエンコーディングかもしれません。")
+
+
+# 住所録の列名 → 同じ列とみなす別名。列名は全角・半角・大文字・小文字の違いと前後の空白を無視して比較する (「住所1」も「住所１」になる)
+HEADER_ALIASES = {
+    '氏名': ('名前', 'お名前', '宛名', '氏名1'),
+    '氏名２': ('連名', '名前2'),
+    '郵便番号': ('〒', '郵便'),
+    '住所１': ('住所',),
+    '住所２': ('建物名', '建物'),
+    '敬称': (),
+    '敬称２': ('連名敬称',),
+}
+
+def _header_key(name):
+    # 先頭のBOMは、BOM付きのUTF-8のCSVをUTF-8として読んだ場合に残る
+    return unicodedata.normalize('NFKC', name).strip().lstrip('\ufeff').casefold()
+
+def resolve_header_aliases(fieldnames, header_aliases=None):
+    """
+    住所録のヘッダー行の列名を、HEADER_ALIASES と header_aliases ({別名: 列名}) に従って本来の列名 (氏名・住所１など) に置き換える。
+    本来の列名と同じ列がある場合はその列を優先し、同じ列名になる別名の列が複数ある場合は左の列を使う。
+    置き換えない列は元の列名のまま残す。
+    Returns the list of field names.
+    """
+    aliases = {}
+    for name, names in HEADER_ALIASES.items():
+        aliases[_header_key(name)] = name
+        for alias in names:
+            aliases.setdefault(_header_key(alias), name)
+    for alias, name in (header_aliases or {}).items():
+        aliases[_header_key(alias)] = name
+
+    keys = [_header_key(name) for name in fieldnames]
+    resolved = list(fieldnames)
+    used = set(fieldnames)
+    # 本来の列名と一致する列を先に割り当てる
+    for i, key in enumerate(keys):
+        name = aliases.get(key)
+        if name is not None and _header_key(name) == key and name not in used:
+            resolved[i] = name
+            used.add(name)
+    for i, key in enumerate(keys):
+        name = aliases.get(key)
+        if name is not None and resolved[i] == fieldnames[i] and name not in used:
+            resolved[i] = name
+            used.add(name)
+    return resolved
+
+
+def _source_name(path, default):
+    """住所録のパス、またはストリームの名前 (一時ファイルなど、名前がパスでない場合は default)。"""
+    if not hasattr(path, 'read'):
+        return os.fspath(path)
+    name = getattr(path, 'name', None)
+    return name if isinstance(name, str) else default
+
+
+class CsvRowReader:
+    """
+    CSVファイルを先頭から一度だけ読み、各行を辞書として1行ずつ返すリーダー。
+    エンコーディングは先頭のバイト列から一度だけ検出し、ファイルを開き直さずにそのままデコードする。
+    全行をメモリに読み込まず、行数を数えるための事前の読み込みも行わない。
+    進捗は読み込んだバイト数とファイルサイズから求める (progress)。
+    csv_path にはファイルのパスの代わりに、シーク可能なバイナリのストリーム (アップロードされたCSVなど) も指定できる。
+    ヘッダー行の列名は resolve_header_aliases で本来の列名に置き換える (header_aliases は {別名: 列名})。
+    with文で使用するか、最後に close() を呼び出すこと。
+    """
 
-        # --- 郵便番号の処理 (横書き) ---
-        zip_code = re.sub(r'[^0-9]', '', zip_code_raw)
-        if len(zip_code) == 7:
-            draw_horizontal_zip_code(draw, zip_code, zip_font,
-                                     ZIP_OVERALL_LEFT_X_PX, ZIP_COMMON_Y,
-                                     ZIP_CHAR_OFFSETS, TEXT_COLOR)
-
-        # --- 住所の描画 (縦書き) ---
-        draw_vertical_text(img, draw, address1_final, address_font, ADDRESS_COL1_X, ADDRESS_LINE_Y_START, ADDRESS_CHAR_Y_SPACING, TEXT_COLOR)
-        
-        if address2_final:
-            draw_vertical_text(img, draw, address2_final, address_font, ADDRESS_COL2_X, ADDRESS_LINE_Y_START, ADDRESS_CHAR_Y_SPACING, TEXT_COLOR)
-
-        # --- 氏名全体の描画ロジック ---
-        # 氏名1の処理
-        surname1_part = ""
-        name1_first_name_part = ""
-        if '　' in name1_final:
-            name1_parts = name1_final.split('　', 1)
-            surname1_part = name1_parts[0]
-            name1_first_name_part = name1_parts[1]
+    def __init__(self, csv_path, header_aliases=None):
+        self.csv_path = csv_path
+        self.header_aliases = header_aliases
+        self.name = _source_name(csv_path, 'アップロードされたCSV')
+        if hasattr(csv_path, 'read'):
+            self.total_bytes = csv_path.seek(0, os.SEEK_END)
+            csv_path.seek(0)
         else:
-            surname1_part = name1_final
-
-        # 氏名2の処理
-        surname2_part = ""
-        name2_first_name_part = ""
-        if '　' in name2_full_converted:
-            name2_parts = name2_full_converted.split('　', 1)
-            surname2_part = name2_parts[0]
-            name2_first_name_part = name2_parts[1]
+            self.total_bytes = os.path.getsize(csv_path)
+        self.encoding = None
+        self._file = None
+        self._text = None
+
+    def __enter__(self):
+        if self._text is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """ファイルを開き、エンコーディングを検出する。"""
+        self._file = self.csv_path if hasattr(self.csv_path, 'read') else open(self.csv_path, 'rb')
+        raw_data = self._file.read(CSV_SNIFF_BYTES)
+        self.encoding = detect_encoding(raw_data, is_complete=len(raw_data) < CSV_SNIFF_BYTES)
+        # 読み込み済みのバッファ内で先頭に戻るだけなので、ディスクからの再読み込みは発生しない
+        self._file.seek(0)
+        self._text = io.TextIOWrapper(self._file, encoding=self.encoding, newline='')
+
+    def close(self):
+        if self._text is not None:
+            self._text.close()
+            self._text = None
+            self._file = None
+
+    def __iter__(self):
+        if self._text is None:
+            self.open()
+        rows = csv.DictReader(self._text)
+        # ヘッダー行だけを読み、列名を置き換える (各行の辞書は置き換えた列名で作られる)
+        if rows.fieldnames:
+            rows.fieldnames = resolve_header_aliases(rows.fieldnames, self.header_aliases)
+        return iter(rows)
+
+    @property
+    def progress(self):
+        """読み込んだバイト数の割合 (0.0〜1.0)。"""
+        if self._file is None or self.total_bytes == 0:
+            return 1.0
+        return min(self._file.tell() / self.total_bytes, 1.0)
+
+
+# --- Excelブック (.xlsx) の読み込み ---
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+class XlsxRowReader:
+    """
+    Excelブック (.xlsx) のシートを先頭から一度だけ読み、各行を CsvRowReader と同じ辞書として1行ずつ返すリーダー。
+    最初の (値のある) 行をヘッダー行とし、列名は resolve_header_aliases で本来の列名に置き換える。
+    値の無いセルは '' になり、値の無い行は読み飛ばす。
+    シートのXMLは展開しながら1行ずつ解析するため (xlsx_reader.XlsxSheetReader)、行数が多くてもメモリ使用量はほぼ一定で、
+    エンコーディングの検出も行わない。sheet にはシート名か、ワークシートの順番 (1から) を指定する (None で最初のシート)。
+    xlsx_path にはファイルのパスの代わりに、シーク可能なバイナリのストリームも指定できる。
+    with文で使用するか、最後に close() を呼び出すこと。
+    """
+
+    def __init__(self, xlsx_path, sheet=None, header_aliases=None):
+        self.xlsx_path = xlsx_path
+        self.header_aliases = header_aliases
+        self.name = _source_name(xlsx_path, 'アップロードされたブック')
+        from xlsx_reader import XlsxSheetReader
+        self._sheet = XlsxSheetReader(xlsx_path, sheet)
+        self._opened = False
+
+    def __enter__(self):
+        if not self._opened:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """ブックを開き、シートの場所と共有文字列を読み込む。"""
+        self._sheet.open()
+        self._opened = True
+        print(f"Excelブックのシート「{self._sheet.sheet_name}」を読み込みます。")
+
+    def close(self):
+        self._sheet.close()
+
+    def __iter__(self):
+        if not self._opened:
+            self.open()
+        return self._iter_rows(iter(self._sheet))
+
+    def _iter_rows(self, values):
+        header = next(values, None)
+        if header is None:
+            return
+        fieldnames = resolve_header_aliases(header, self.header_aliases)
+        width = len(fieldnames)
+        for row in values:
+            if len(row) < width:
+                row.extend([''] * (width - len(row)))
+            yield dict(zip(fieldnames, row))
+
+    @property
+    def progress(self):
+        """シートのXMLを読み込んだ割合 (0.0〜1.0)。"""
+        return self._sheet.progress
+
+
+def open_address_book(path, sheet=None, header_aliases=None):
+    """
+    住所録のリーダーを作成する。拡張子が .xlsx / .xlsm のファイルは XlsxRowReader、それ以外は CsvRowReader で読み込む。
+    path に作成済みのリーダーを指定した場合は、そのまま返す。
+    sheet はExcelブックの場合だけ使う。
+    """
+    if isinstance(path, (CsvRowReader, XlsxRowReader)):
+        return path
+    if not hasattr(path, 'read') and os.fspath(path).lower().endswith(XLSX_EXTENSIONS):
+        return XlsxRowReader(path, sheet, header_aliases)
+    return CsvRowReader(path, header_aliases)
+
+
+# --- プレビュー (低解像度) ---
+# レイアウトの確認用に、選んだ行だけを低いDPIで描画する。座標は PageLayout でDPIに合わせて換算するため、
+# 印刷用 (TEMPLATE_DPI) と同じ位置関係のハガキを、数十分の一の画素数で描画できる。
+PREVIEW_DPI = 96 # --preview で描画するDPI
+PREVIEW_DEFAULT_ROWS = '1-20' # --preview で行を指定しない場合に描画する行
+PREVIEW_THUMBNAIL_DPI = 72 # GUIのプレビューウィンドウに並べるサムネイルのDPI
+PREVIEW_COLUMNS = 3 # プレビューウィンドウの1段に並べるハガキの枚数
+PREVIEW_MAX_THUMBNAILS = 120 # プレビューウィンドウで保持するサムネイルの数 (見える範囲から遠いものから破棄する)
+
+def parse_row_selection(spec):
+    """
+    "1-20" や "3,10-12,40" のような行の指定 (1始まり、ヘッダー行を除く) を解析する。
+    重なる範囲や連続する範囲は1つにまとめる。
+    Returns a sorted list of (first, last) ranges (inclusive).
+    """
+    ranges = []
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, separator, last = part.partition('-')
+        if not first.isdigit() or (separator and not last.isdigit()):
+            raise ValueError(f"行は「1-20」や「3,10-12」の形式で指定してください: {spec}")
+        first = int(first)
+        last = int(last) if separator else first
+        if first < 1 or last < first:
+            raise ValueError(f"行の範囲が正しくありません: {part}")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError(f"行は「1-20」や「3,10-12」の形式で指定してください: {spec}")
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
         else:
-            name2_first_name_part = name2_full_converted # スペースがない場合は全体を名前とみなす
+            merged.append((first, last))
+    return merged
 
-        # 各氏名の描画に必要な縦方向の長さを計算
-        # 名字の長さ + スペースの長さ + 名前の長さ
-        len_name1_full = len(surname1_part) * NAME_CHAR_Y_SPACING
-        if name1_first_name_part:
-            len_name1_full += OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE + len(name1_first_name_part) * NAME_CHAR_Y_SPACING
 
-        len_name2_full = 0
-        if name2_full_converted:
-            len_name2_full = len(surname2_part) * NAME_CHAR_Y_SPACING
-            if name2_first_name_part:
-                len_name2_full += OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE + len(name2_first_name_part) * NAME_CHAR_Y_SPACING
-        
-        # 名前開始のY座標を揃えるための基準Y座標を決定
-        # 名字部分が長い場合も考慮し、全体として長くなる方に合わせる
-        
-        # 仮描画で名字の最終Y座標を取得 (実際に描画はしない)
-        # 氏名1と氏名2それぞれの名字の終端Y座標を計算
-        temp_y_after_surname1 = NAME_LINE_Y_START + len(surname1_part) * NAME_CHAR_Y_SPACING
-        temp_y_after_surname2 = NAME_LINE_Y_START 
-        if surname2_part:
-            temp_y_after_surname2 = NAME_LINE_Y_START + len(surname2_part) * NAME_CHAR_Y_SPACING
+def select_rows(rows, ranges):
+    """
+    行データのイテラブルから、ranges (parse_row_selection の結果) に含まれる行だけを返すジェネレーター。
+    最後に指定した行より後ろは読み込まない。
+    """
+    ranges = iter(ranges)
+    first, last = next(ranges, (0, -1))
+    for row_number, row in enumerate(rows, 1):
+        if row_number < first:
+            continue
+        yield row
+        if row_number == last:
+            first, last = next(ranges, (0, -1))
+            if last < 0:
+                break
 
-        # 名前部分が始まるY座標は、長い方の名字の終端にオフセットを加えた位置に揃える
-        unified_name_start_y = max(temp_y_after_surname1, temp_y_after_surname2) + OFFSET_NAME1_Y_FROM_SURNAME_END_AFTER_SPACE
 
+def selected_row_numbers(ranges):
+    """select_rows が返す行の行番号 (1始まり) を順に返すイテレーター。"""
+    return itertools.chain.from_iterable(range(first, last + 1) for first, last in ranges)
 
-        # 1. 氏名1の名字を描画
-        draw_vertical_text(img, draw, surname1_part, name_font, NAME_COL1_X, NAME_LINE_Y_START, NAME_CHAR_Y_SPACING, TEXT_COLOR)
-        
-        # 2. 氏名1の名前を描画 (統一された開始Y座標を使用)
-        if name1_first_name_part:
-            draw_vertical_text(img, draw, name1_first_name_part, name_font, NAME_COL1_X, unified_name_start_y, NAME_CHAR_Y_SPACING, TEXT_COLOR)
 
-        # 3. 氏名2（連名）の描画ロジック
-        if name2_full_converted:
-            name2_draw_x = NAME_COL1_X + OFFSET_NAME2_X_FROM_NAME1_COL
-            
-            # 氏名2の名字が存在する場合に描画
-            if surname2_part:
-                draw_vertical_text(img, draw, surname2_part, name2_font, name2_draw_x, NAME_LINE_Y_START, NAME_CHAR_Y_SPACING, TEXT_COLOR)
+# --- ハガキ宛名面のレンダラー ---
+class _FontTable(dict):
+    """
+    フォント名からフォントを引く辞書。自動調整で縮小した「フォント名@サイズ」(例: 'address@60') の
+    フォントは、最初に使われた時点で読み込む (ワーカープロセスでも同じキーで引ける)。
+    文字サイズが同じフォント (氏名・氏名２・敬称など) は、1つのフォントオブジェクトを共有する。
+    """
 
-            # 氏名2の名前を描画（統一された開始Y座標を使用）
-            if name2_first_name_part:
-                draw_vertical_text(img, draw, name2_first_name_part, name2_font, name2_draw_x, unified_name_start_y, NAME_CHAR_Y_SPACING, TEXT_COLOR)
-        
-        # 敬称のY座標を揃えるための基準Y座標を決定
-        # 氏名1の最終Y座標を正確に計算
-        final_y_name1_end = NAME_LINE_Y_START + len(surname1_part) * NAME_CHAR_Y_SPACING
+    def __init__(self, font_path, font_index, sizes):
+        super().__init__()
+        self.font_path = font_path
+        self.font_index = font_index
+        self._faces = {} # 文字サイズ → フォント
+        for key, size in sizes.items():
+            self[key] = self.face(size)
+
+    def face(self, size):
+        """指定した文字サイズのフォント。同じサイズは一度だけ読み込む。"""
+        font = self._faces.get(size)
+        if font is None:
+            from PIL import ImageFont
+            font = ImageFont.truetype(self.font_path, size, index=self.font_index)
+            self._faces[size] = font
+        return font
+
+    def __missing__(self, key):
+        base, _, size = key.partition('@')
+        if base not in self or not size.isdigit():
+            raise KeyError(key)
+        font = self.face(int(size))
+        self[key] = font
+        return font
+
+
+def _font_key(base_key, font_size, base_size):
+    """自動調整で文字サイズを変えた場合のフォント名 (変えていなければ base_key のまま)。"""
+    return base_key if font_size == base_size else f'{base_key}@{font_size}'
+
+
+FONT_KEYS = ('name', 'name2', 'title', 'address', 'zip') # 元の文字サイズのフォント名
+
+DEDUP_MAX_PAGES = 16 # ディスプレイリストが同じハガキを使い回すために保持する圧縮済みページの数
+# 描画や圧縮の処理を変更して出力が変わる場合は、この値を増やしてページキャッシュを無効にする
+RENDERER_VERSION = 1
+class PostcardRenderer:
+    """
+    CSVの行データからハガキ宛名面の画像を生成するレンダラー。
+    フォントとテンプレート画像はインスタンス生成時に一度だけ読み込み、
+    以降の render / render_csv の呼び出しで使い回す。
+    tkinterには一切依存しないため、サーバー上や他のコードからも利用できる。
+    """
+
+    def __init__(self, font_path=FONT_PATH, template_path=None, glyph_cache_size=GLYPH_CACHE_MAX_ENTRIES, static_layer=None,
+                 color_mode=COLOR_MODE, page_cache=None, profiler=None, postal_index=None, postal_complete=False,
+                 auto_fit=False, dpi=TEMPLATE_DPI):
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"色モードは {', '.join(COLOR_MODES)} のいずれかを指定してください: {color_mode}")
+        if dpi <= 0:
+            raise ValueError(f"DPIには正の値を指定してください: {dpi}")
+        # 座標・文字サイズは全てこの解像度のピクセル値で計算する (プレビューでは低いDPIを指定する)
+        self.layout = PageLayout(dpi)
+        self.font_path = font_path
+        self.template_path = template_path
+        self.static_layer = static_layer
+        # テンプレートの作成からページの圧縮まで、全てこの色モードで処理する
+        self.color_mode = color_mode
+        self.text_color = _color_for_mode(TEXT_COLOR, color_mode)
+        self.glyph_cache_size = glyph_cache_size
+        # 全フォントで共有するグリフキャッシュ (サイズ0で無効)
+        self.glyph_cache = GlyphCache(glyph_cache_size) if glyph_cache_size > 0 else None
+        # レイアウトの計算に使う文字の寸法は、描画先と同じモードで求める
+        self.fontmode = '1' if color_mode == '1' else 'L'
+        # ディスプレイリストが同じハガキは、圧縮済みのページを使い回す
+        self._dedup_pages = OrderedDict()
+        self.dedup_hits = 0
+        # 前回までの実行で描画したページを再利用するディスクキャッシュ (PageCache、Noneで無効)
+        self.page_cache = page_cache
+        self._cache_fingerprint = None
+        # 工程ごとの時間を計測するプロファイラー (Profiler、Noneで計測しない)
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        # 郵便番号と住所１を照合する索引 (PostalIndex、Noneで照合しない)。
+        # postal_complete が True の場合、都道府県が省略された住所１を補完してから描画する
+        self.postal_index = postal_index
+        self.postal_complete = postal_complete
+        # True の場合、下端からはみ出す住所・氏名を縮小・折り返しして配置する (fit_fields)
+        self.auto_fit = auto_fit
+        self.last_fit_report = None
+        self.last_error_report = None
+        with self.profiler.span('load_template'):
+            self.template = self._load_template()
+        with self.profiler.span('load_fonts'):
+            self._load_fonts()
+
+    def worker_options(self):
+        """並列描画用のワーカープロセスで同じレンダラーを作成するための引数。"""
+        return {
+            'font_path': self.font_path,
+            'template_path': self.template_path,
+            'glyph_cache_size': self.glyph_cache_size,
+            'static_layer': self.static_layer,
+            'color_mode': self.color_mode,
+            'auto_fit': self.auto_fit,
+            'dpi': self.layout.dpi,
+            # 計測する場合は、ワーカーごとに空のプロファイラーを作り、記録を親プロセスへ返す
+            'profiler': Profiler() if self.profiler.enabled else None,
+        }
+
+    def _load_template(self):
+        """
+        テンプレート画像を準備し、デコード済みの画像としてメモリ上に保持する。
+        固定レイヤーが指定されている場合は、ここで一度だけテンプレートに描画しておく。
+        手動で用意したテンプレート画像は TEMPLATE_DPI のものとみなし、異なるDPIで描画する場合は縮小・拡大する。
+        """
+        from PIL import Image
+        dpi = self.layout.dpi
+        if self.template_path is None and GENERATE_TEMPLATE:
+            template = create_postcard_template(dpi, POSTCARD_WIDTH_MM, POSTCARD_HEIGHT_MM, self.color_mode)
+        else:
+            if self.template_path is None:
+                self.template_path = TEMPLATE_IMAGE_PATH
+            if not os.path.exists(self.template_path):
+                raise FileNotFoundError(f"指定されたテンプレート画像が見つかりません: {self.template_path}")
+            with Image.open(self.template_path) as image:
+                template = image.convert(self.color_mode)
+            if dpi != TEMPLATE_DPI:
+                size = (max(1, round(template.width * dpi / TEMPLATE_DPI)), max(1, round(template.height * dpi / TEMPLATE_DPI)))
+                template = template.resize(size, Image.LANCZOS if self.color_mode != '1' else Image.NEAREST)
+
+        if self.static_layer is not None:
+            self.static_layer.draw(template, self.font_path, self.layout)
+        return template
+
+    def _load_fonts(self):
+        """描画に使用するフォントをロードする。"""
+        print(f"フォント「{os.path.basename(self.font_path)}」をロードしています...")
+        try:
+            font_index = 0
+            layout = self.layout
+            # ディスプレイリストではフォントをこの辞書のキーで参照する
+            # 文字サイズが同じフォントは1つを共有する (氏名・氏名２・敬称は既定で同じサイズ)
+            self.fonts = _FontTable(self.font_path, font_index, {
+                'name': layout.name_font_size,
+                'name2': layout.name2_font_size,
+                'title': layout.title_font_size,
+                'address': layout.address_font_size,
+                'zip': layout.zip_font_size,
+            })
+        except OSError as e:
+            raise OSError(f"フォントファイルが見つからないか、読み込めません: {self.font_path}") from e
+        self.name_font = self.fonts['name']
+        self.name2_font = self.fonts['name2']
+        self.title_font = self.fonts['title']
+        self.address_font = self.fonts['address']
+        self.zip_font = self.fonts['zip']
+        print(f"フォント「{os.path.basename(self.font_path)}」をロードしました。")
+
+    def render_row(self, row):
+        """
+        CSVの1行 (辞書) からハガキ1枚分の画像を生成する。
+        Returns the rendered page image (in the renderer's color mode).
+        """
+        return self.rasterize(self.layout_row(row))
+
+    def rasterize(self, display_list):
+        """
+        ディスプレイリストをテンプレートのコピーに描画する。
+        Returns the rendered page image (in the renderer's color mode).
+        """
+        from PIL import ImageDraw
+        profiler = self.profiler
+        # メモリ上のテンプレート (固定レイヤー描画済み) をコピーして描画先とする
+        with profiler.span('template_copy'):
+            img = self.template.copy()
+            draw = ImageDraw.Draw(img) # ImageDrawオブジェクトはここで作成
+        with profiler.span('rasterize'):
+            fonts = self.fonts
+            for font_key, char, x, y in display_list:
+                draw_glyph(draw, fonts[font_key], char, x, y, self.text_color, self.glyph_cache)
+        profiler.count('glyphs', len(display_list))
+        return img
+
+    def encode_row(self, row):
+        """
+        CSVの1行 (辞書) から圧縮済みのページ (EncodedPage) を生成する。
+        同じ世帯が何度も出てくる場合など、ディスプレイリストが直前の数枚と同じ場合は描画せずに使い回す。
+        """
+        display_list = self.layout_row(row)
+        page = self._dedup_pages.get(display_list)
+        if page is not None:
+            self._dedup_pages.move_to_end(display_list)
+            self.dedup_hits += 1
+            self.profiler.count('dedup_hits')
+            return page
+
+        img = self.rasterize(display_list)
+        with self.profiler.span('encode'):
+            page = encode_page(img)
+        self._dedup_pages[display_list] = page
+        if len(self._dedup_pages) > DEDUP_MAX_PAGES:
+            self._dedup_pages.popitem(last=False)
+        return page
+
+    def page_cache_key(self, display_list):
+        """
+        ページキャッシュのキーを返す。ディスプレイリスト (正規化後の文字とレイアウト定数から決まる座標) に加え、
+        フォントファイル・フォントサイズ・DPI・色モード・テンプレート (固定レイヤーを含む)・RENDERER_VERSION が
+        全て同じ場合にだけ同じキーになる。
+        """
+        if self._cache_fingerprint is None:
+            digest = hashlib.sha256()
+            with open(self.font_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            settings = (RENDERER_VERSION, self.layout.dpi, self.color_mode, self.text_color,
+                        sorted((key, self.fonts[key].size, self.fonts[key].index) for key in FONT_KEYS),
+                        self.template.mode, self.template.size)
+            digest.update(repr(settings).encode('utf-8'))
+            digest.update(self.template.tobytes())
+            self._cache_fingerprint = digest.digest()
+
+        digest = hashlib.sha256(self._cache_fingerprint)
+        digest.update(repr(display_list).encode('utf-8'))
+        return digest.hexdigest()
+
+    def layout_row(self, row):
+        """
+        CSVの1行 (辞書) から、ハガキ1枚分のディスプレイリストを作成する。ピクセルは一切描画しない。
+        各要素は (フォント名, 文字, X座標, Y座標) で、フォント名は self.fonts のキー。
+        Returns the display list as a tuple (hashable and JSON-serializable).
+        """
+        with self.profiler.span('normalize'):
+            fields = normalize_row(row)
+        with self.profiler.span('layout'):
+            return self._layout_fields(*fields)
+
+    def _layout_fields(self, zip_code, address1_final, address2_final, name1_final, name2_full_converted, title, title2):
+        """
+        normalize_row で正規化した1行分の値から、ディスプレイリストを作成する。
+        auto_fit が True の場合は、fit_fields の結果に合わせて文字サイズ・間隔・列を変える。
+        """
+        fontmode = self.fontmode
+        glyph_cache = self.glyph_cache
+        glyphs = []
+        fonts = self.fonts
+        layout = self.layout
+        address_font_size = layout.address_font_size
+        name_font_size = layout.name_font_size
+        address_column_step = layout.address_col2_x - layout.address_col1_x # 住所の1列分のX方向の間隔
+
+        address1_parts = (address1_final,)
+        address2_parts = (address2_final,)
+        address_key = address2_key = 'address'
+        address_spacing = address2_spacing = layout.address_char_y_spacing
+        address2_x = layout.address_col2_x
+        name_size = name_font_size
+        if self.auto_fit:
+            # 縮小・折り返しは印刷用の解像度 (DEFAULT_LAYOUT) で決めてから、このDPIに換算する
+            # (プレビューでも、印刷するハガキと同じ判定・同じ折り返し位置になる)
+            plan = fit_fields(zip_code, address1_final, address2_final, name1_final, name2_full_converted, title, title2)
+            address1_parts = plan.address1.parts
+            address_key = _font_key('address', max(1, round(layout.from_print_px(plan.address1.font_size))), address_font_size)
+            address_spacing = layout.from_print_px(plan.address1.spacing)
+            address2_key = _font_key('address', max(1, round(layout.from_print_px(plan.address2.font_size))), address_font_size)
+            address2_spacing = layout.from_print_px(plan.address2.spacing)
+            address2_parts = plan.address2.parts
+            if len(address1_parts) > 1:
+                # 住所１を折り返した場合、住所２はさらに1列左へずらす
+                address2_x = layout.address_col2_x + address_column_step
+            name_size = max(1, round(layout.from_print_px(plan.names.font_size)))
+        name_key = _font_key('name', name_size, name_font_size)
+        name2_key = _font_key('name2', _scaled(layout.name2_font_size, name_size, name_font_size), layout.name2_font_size)
+        title_size = _scaled(layout.title_font_size, name_size, name_font_size)
+        title_key = _font_key('title', title_size, layout.title_font_size)
+        name_spacing = _scaled(layout.name_char_y_spacing, name_size, name_font_size)
+        name_x = layout.name_col1_x
+        name_y = layout.name_line_y_start
+        address_y = layout.address_line_y_start
+
+        # --- 郵便番号の処理 (横書き) ---
+        if len(zip_code) == 7:
+            layout_horizontal_zip_code(glyphs, 'zip', self.zip_font, zip_code,
+                                       layout.zip_overall_left_x, layout.zip_common_y,
+                                       layout.zip_char_offsets, fontmode, glyph_cache)
+
+        # --- 住所の配置 (縦書き) ---
+        layout_vertical_text(glyphs, address_key, fonts[address_key], address1_parts[0], layout.address_col1_x, address_y, address_spacing, fontmode, glyph_cache)
+        if len(address1_parts) > 1:
+            # 折り返した住所１の続き
+            layout_vertical_text(glyphs, address_key, fonts[address_key], address1_parts[1], layout.address_col2_x, address_y, address_spacing, fontmode, glyph_cache)
+
+        # 住所２ (折り返した場合は、続きをさらに1列左へ)
+        for i, part in enumerate(address2_parts):
+            if part:
+                layout_vertical_text(glyphs, address2_key, fonts[address2_key], part, address2_x + i * address_column_step, address_y, address2_spacing, fontmode, glyph_cache)
+
+        # --- 氏名全体の配置 ---
+        surname1_part, name1_first_name_part, surname2_part, name2_first_name_part, unified_name_start_y, unified_title_start_y = \
+            _layout_names(name1_final, name2_full_converted, name_y, name_spacing,
+                          _scaled(layout.offset_name1_y_from_surname_end_after_space, name_size, name_font_size),
+                          _scaled(layout.offset_title_y_from_name_end, name_size, name_font_size))
+
+        # 1. 氏名1の名字
+        layout_vertical_text(glyphs, name_key, fonts[name_key], surname1_part, name_x, name_y, name_spacing, fontmode, glyph_cache)
+
+        # 2. 氏名1の名前 (統一された開始Y座標を使用)
         if name1_first_name_part:
-            final_y_name1_end = unified_name_start_y + len(name1_first_name_part) * NAME_CHAR_Y_SPACING
+            layout_vertical_text(glyphs, name_key, fonts[name_key], name1_first_name_part, name_x, unified_name_start_y, name_spacing, fontmode, glyph_cache)
 
-        # 氏名2の最終Y座標を正確に計算
-        final_y_name2_end = NAME_LINE_Y_START # 初期値
+        # 3. 氏名2（連名）
         if name2_full_converted:
+            name2_draw_x = name_x + layout.offset_name2_x_from_name1_col
+
+            # 氏名2の名字が存在する場合
             if surname2_part:
-                final_y_name2_end = NAME_LINE_Y_START + len(surname2_part) * NAME_CHAR_Y_SPACING # 名字の最終Y
+                layout_vertical_text(glyphs, name2_key, fonts[name2_key], surname2_part, name2_draw_x, name_y, name_spacing, fontmode, glyph_cache)
+
+            # 氏名2の名前（統一された開始Y座標を使用）
             if name2_first_name_part:
-                final_y_name2_end = unified_name_start_y + len(name2_first_name_part) * NAME_CHAR_Y_SPACING # 名前の最終Y
-
-        # 敬称のY座標は、氏名1と氏名2のより下にある氏名の終端Y座標に合わせる
-        unified_title_start_y = max(final_y_name1_end, final_y_name2_end) + OFFSET_TITLE_Y_FROM_NAME_END
-        
-        # 4. 敬称1の描画
-        draw_vertical_text(img, draw, title, title_font, NAME_COL1_X, unified_title_start_y, TITLE_FONT_SIZE, TEXT_COLOR)
-        
-        # 5. 敬称2の描画（存在する場合のみ）
+                layout_vertical_text(glyphs, name2_key, fonts[name2_key], name2_first_name_part, name2_draw_x, unified_name_start_y, name_spacing, fontmode, glyph_cache)
+
+        # 4. 敬称1
+        layout_vertical_text(glyphs, title_key, fonts[title_key], title, name_x, unified_title_start_y, title_size, fontmode, glyph_cache)
+
+        # 5. 敬称2（存在する場合のみ）
         if title2:
-            title_draw_x_sub = NAME_COL1_X + OFFSET_NAME2_X_FROM_NAME1_COL # 氏名2の名前と同じX座標
-            draw_vertical_text(img, draw, title2, title_font, title_draw_x_sub, unified_title_start_y, TITLE_FONT_SIZE, TEXT_COLOR)
+            title_draw_x_sub = name_x + layout.offset_name2_x_from_name1_col # 氏名2の名前と同じX座標
+            layout_vertical_text(glyphs, title_key, fonts[title_key], title2, title_draw_x_sub, unified_title_start_y, title_size, fontmode, glyph_cache)
+
+        return tuple(glyphs)
+
+    def render(self, rows):
+        """
+        行データのイテラブルから、ハガキ画像を1枚ずつ生成するジェネレーター。
+        """
+        for row in rows:
+            yield self.render_row(row)
+
+    def render_encoded(self, rows, workers=1):
+        """
+        行データのイテラブルから、圧縮済みのページ (EncodedPage) を
+        CSVの行の順番どおりに1枚ずつ生成するジェネレーター。
+        workers に2以上を指定すると、プロセスプールで並列に描画する。
+        描画できない行があった場合は RuntimeError を送出する。
+        """
+        for _, page in self._iter_encoded(rows, workers):
+            if isinstance(page, RowFailure):
+                raise RuntimeError(f"ハガキを描画できませんでした: {page.message}")
+            yield page
+
+    def _try_encode_row(self, row):
+        """encode_row と同じ。ただし描画できない行では例外を送出せず、RowFailure を返す。"""
+        try:
+            return self.encode_row(row)
+        except Exception as e:
+            return _row_failure(e, row)
+
+    def _try_layout_row(self, row):
+        """layout_row と同じ。ただし配置できない行では例外を送出せず、RowFailure を返す。"""
+        try:
+            return self.layout_row(row)
+        except Exception as e:
+            return _row_failure(e, row)
+
+    def _iter_encoded(self, rows, workers, executor=None):
+        """
+        (行データ, 圧縮済みページ) の組をCSVの行の順番で返す。描画できなかった行のページは RowFailure になる。
+        executor に起動済みのプロセスプール (_init_render_worker で初期化したもの) を指定すると、
+        新しいプールを作らずにそのワーカーで描画する。
+        """
+        if self.page_cache is not None:
+            yield from self._iter_encoded_cached(rows, workers, executor)
+        elif workers <= 1 and executor is None:
+            for row in rows:
+                yield row, self._try_encode_row(row)
+        else:
+            yield from _render_in_process_pool(rows, workers, self.worker_options(), profiler=self.profiler,
+                                               executor=executor)
+
+    def _lookup_page_cache(self, rows):
+        """
+        (行データ, キャッシュのキー, キャッシュ済みのページまたはNone) の組を返す。
+        配置できない行では、キーを None、ページを RowFailure にする (キャッシュを使わない場合と同じく、描画せずに飛ばす)。
+        """
+        for row in rows:
+            display_list = self._try_layout_row(row)
+            if isinstance(display_list, RowFailure):
+                yield row, None, display_list
+                continue
+            key = self.page_cache_key(display_list)
+            with self.profiler.span('cache_lookup'):
+                page = self.page_cache.get(key)
+            yield row, key, page
+
+    def _iter_encoded_cached(self, rows, workers, executor=None):
+        """
+        ページキャッシュを使う場合の _iter_encoded。
+        レイアウトだけを計算してキャッシュを引き、見つからなかった行だけを描画してキャッシュに保存する。
+        """
+        cache = self.page_cache
+        profiler = self.profiler
+        lookups = self._lookup_page_cache(rows)
+
+        if workers <= 1 and executor is None:
+            for row, key, page in lookups:
+                if page is None:
+                    page = self._try_encode_row(row)
+                    if not isinstance(page, RowFailure):
+                        with profiler.span('cache_store'):
+                            cache.put(key, page)
+                yield row, page
+        else:
+            # キャッシュ済みの行はワーカーへ送らない (None を渡す)
+            results = _render_in_process_pool(lookups, workers, self.worker_options(),
+                                              job=lambda lookup: lookup[0] if lookup[2] is None else None,
+                                              profiler=profiler, executor=executor)
+            for (row, key, page), rendered in results:
+                if page is None:
+                    page = rendered
+                    if not isinstance(page, RowFailure):
+                        with profiler.span('cache_store'):
+                            cache.put(key, page)
+                yield row, page
+
+    def _vector_page_writer(self, writer):
+        """
+        ディスプレイリストを、ベクターPDFの1ページとして書き出す関数を返す。
+        フォントは最初のページを書き出す時点で登録し、文書 (分割出力では各ファイル) 全体で1つだけ埋め込む。
+        """
+        state = {}
+        width, height = self.template.size
+
+        ascents = {}
+
+        def write_page(display_list):
+            # 分割出力ではファイルが切り替わるたびに、新しいファイルへフォントと背景を登録し直す
+            target = writer.card_writer()
+            if state.get('target') is not target:
+                state['target'] = target
+                state['font'] = target.embed_font(self.font_path)
+                state['background_id'] = None
+                if self.static_layer is not None or self.template_path is not None:
+                    # 固定レイヤーや手動のテンプレートは一度だけ画像として埋め込み、全ページから参照する
+                    state['background_id'] = target.add_image(encode_page(self.template))
+
+            placed = []
+            for font_key, char, x, y in display_list:
+                font = self.fonts[font_key]
+                ascent = ascents.get(font_key)
+                if ascent is None:
+                    ascent = ascents[font_key] = font.getmetrics()[0]
+                # ImageDraw.text の座標は文字の左上 (アセンダー位置) なので、ベースラインに変換する
+                placed.append((font.size, x, y + ascent, char))
+            writer.add_text_page(width, height, placed, state['font'], TEXT_COLOR, state['background_id'])
+            self.profiler.count('glyphs', len(display_list))
+
+        return write_page
+
+    def render_csv(self, csv_path, out_pdf, progress=None, workers=1, vector=False, cancel=None,
+                   shard_cards=None, shard_mb=None, n_up=None, postal_report=None, fit_report=None, row_selection=None,
+                   error_report=None, checkpoint=None, checkpoint_every=CHECKPOINT_INTERVAL_CARDS, resume=False,
+                   executor=None, verbose=True):
+        """
+        住所録 (CSVファイルまたはExcelブック) を読み込み、全てのハガキを1つのPDFファイルに保存する。
+        csv_path には住所録のパスか、open_address_book で作成したリーダー (シートや列名の別名を指定する場合) を指定する。
+        progress には (現在の氏名, 処理済み件数, 読み込んだ割合 0.0〜1.0) を受け取る関数を指定できる。
+        workers に2以上を指定すると、その数のプロセスで並列に描画する。
+        vector を True にすると、画像ではなくテキストとして文字を配置したPDFを出力する。
+        ラスタライズも画像圧縮も行わないため、ファイルが小さく生成も速い (workers は使用しない)。
+        cancel には threading.Event などを指定でき、セットされると次のハガキから処理を止める。
+        その場合も、それまでに書き出したハガキは正しいPDFとして保存される。
+        shard_cards (枚数) または shard_mb (MB) を指定すると、その単位で「出力名_001.pdf」… に分割して書き出す。
+        n_up に 2 または 4 を指定すると、A4の用紙にその枚数ずつトンボ付きで面付けする。
+        postal_index を指定したレンダラーでは、郵便番号と住所１が一致しない行を postal_report (CSV) に書き出す。
+        住所・氏名がハガキの下端からはみ出す行 (auto_fit の場合は縮小・折り返しした行) は、件数を表示し、
+        fit_report を指定するとCSVに書き出す。
+        row_selection (parse_row_selection の結果) を指定すると、その行だけを描画する (プレビュー用)。
+        郵便番号の照合とはみ出しの確認も、指定した行だけについて行う (レポートの行番号はCSVでの行番号)。
+        描画できない行 (列の足りない行など) は飛ばして処理を続け、件数を表示し、error_report を指定するとCSVに書き出す。
+        checkpoint にファイルのパスを指定すると、checkpoint_every 枚を処理するごとに、途中まで書き出したPDFの状態と
+        処理済みの最後の行番号を保存する (ベクター出力では保存しない)。最後まで処理するとチェックポイントは削除し、
+        キャンセルした場合はその時点のチェックポイントを残す。
+        resume を True にすると、保存されたチェックポイントから処理を再開する。PDFはその時点の長さに切り詰め、続きのハガキを追記する
+        (郵便番号の照合とはみ出しの確認は、描画しない行も含めて全ての行について行う)。
+        executor については _iter_encoded を参照。複数の住所録を続けて処理する場合に、起動済みのワーカーを使い回せる。
+        verbose を False にすると、1枚ごとのメッセージを表示しない。
+        Returns the number of postcards written.
+        """
+        if vector:
+            if resume:
+                raise ValueError("ベクター出力は、途中から再開できません。")
+            # フォントは最後に埋め込むため、途中の状態を保存できない
+            checkpoint = None
+
+        # 選択されたパスからディレクトリを抽出し、存在しない場合は作成
+        output_dir = os.path.dirname(out_pdf)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+            print(f"出力フォルダ「{output_dir}」を作成しました。")
+
+        profiler = self.profiler
+        reader = open_address_book(csv_path)
+        print(f"住所録「{reader.name}」を読み込み、ハガキ画像を生成します...")
+        # CSVではエンコーディングの検出、Excelブックでは共有文字列の読み込み
+        with profiler.span('open_address_book'):
+            reader.open()
+
+        report = PostalReport(postal_report) if self.postal_index is not None else None
+        fit = FitReport(fit_report, auto_fit=self.auto_fit)
+        errors = ErrorReport(error_report)
+        # チェックポイントは、同じ住所録を同じ設定で描画する場合にだけ使える
+        checkpoint_options = json.loads(json.dumps({
+            'source': reader.name, 'font': os.path.basename(self.font_path), 'dpi': self.layout.dpi,
+            'color_mode': self.color_mode, 'auto_fit': self.auto_fit, 'postal_complete': self.postal_complete,
+            'shard_cards': shard_cards, 'shard_mb': shard_mb, 'n_up': n_up, 'row_selection': row_selection,
+        }))
+
+        # CSVは1行ずつ読み込み、1枚描画するごとにPDFへ書き出す (行もページ画像もメモリに溜めない)
+        with reader, errors, self._open_pdf_writer(out_pdf, shard_cards, shard_mb, n_up) as writer:
+            state = None
+            if checkpoint is not None and resume:
+                state = load_checkpoint(checkpoint)
+                if state is None:
+                    print(f"チェックポイント「{checkpoint}」が無いため、最初から処理します。")
+                elif state['options'] != checkpoint_options:
+                    raise ValueError(f"チェックポイント「{checkpoint}」は別の住所録または設定で作成されたため、再開できません。")
+            if state is not None:
+                writer.resume(state['writer'])
+                for entry in state['errors']:
+                    errors.add(*entry)
+                print(f"{state['last_row']} 行目まで処理済みのチェックポイントから再開します ({writer.card_count} 枚を書き出し済み)。")
+            else:
+                # 出力は最初から書き直すため、前回の実行のチェックポイントとエラーのレポートは使えなくなる
+                for stale_path in (checkpoint, error_report):
+                    if stale_path is not None and os.path.exists(stale_path):
+                        os.remove(stale_path)
+            last_row = state['last_row'] if state is not None else 0
+
+            def save_state():
+                with profiler.span('checkpoint'):
+                    save_checkpoint(checkpoint, {
+                        'version': CHECKPOINT_VERSION, 'options': checkpoint_options, 'last_row': last_row,
+                        # 描画の前の段は先読みしているため、まだ処理していない行のエラーは含めない
+                        'errors': [entry for entry in errors.entries if entry[0] <= last_row],
+                        'writer': writer.checkpoint(),
+                    })
+
+            rows = profiler.iter_rows(reader)
+            postal_row_numbers = fit_row_numbers = guard_row_numbers = None
+            if row_selection is not None:
+                rows = select_rows(rows, row_selection)
+                postal_row_numbers = selected_row_numbers(row_selection)
+                fit_row_numbers = selected_row_numbers(row_selection)
+                guard_row_numbers = selected_row_numbers(row_selection)
+            if report is not None:
+                rows = self._check_postal_codes(rows, report, postal_row_numbers)
+            rows = self._check_fit(rows, fit, fit_row_numbers)
+            # 描画する行の行番号。描画の段は行の順番を変えないため、書き出した順に先頭から取り出せる
+            pending_numbers = deque()
+            rows = self._skip_unrenderable_rows(rows, errors, pending_numbers, guard_row_numbers, last_row)
+
+            processed = 0 # 前回のチェックポイントの後に処理した行数
+            for row, error in self.write_pages(rows, writer, workers, vector, executor):
+                last_row = pending_numbers.popleft()
+                name = (row.get('氏名') or '').strip()
+                if error is not None:
+                    errors.add(last_row, name, error)
+                    print(f"{last_row} 行目「{name}」様のハガキを描画できないため、飛ばしました: {error}")
+                else:
+                    if progress:
+                        progress(row.get('氏名', '不明'), writer.card_count, reader.progress)
+                    if verbose:
+                        print(f"「{name}」様のハガキ画像を書き出しました。")
+                processed += 1
+                if checkpoint is not None and checkpoint_every and processed >= checkpoint_every:
+                    save_state()
+                    processed = 0
+                if cancel is not None and cancel.is_set():
+                    print("\nキャンセルされたため、処理を中断しました。")
+                    if checkpoint is not None:
+                        save_state()
+                        print(f"チェックポイントを保存しました: {checkpoint}")
+                    break
+            # ページツリーと相互参照表の書き出し
+            with profiler.span('finalize'):
+                writer.close()
+            page_count = writer.card_count
+        if checkpoint is not None and not (cancel is not None and cancel.is_set()) and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if report is not None:
+            report.close()
+            print(report.summary())
+        fit.close()
+        # GUIでは完了のメッセージに表示する
+        self.last_fit_report = fit
+        self.last_error_report = errors
+        if fit.summary():
+            print(fit.summary())
+        if errors.summary():
+            print(errors.summary())
+
+        if self.glyph_cache is not None and self.glyph_cache.hits + self.glyph_cache.misses:
+            profiler.count('glyph_cache_hits', self.glyph_cache.hits)
+            profiler.count('glyph_cache_misses', self.glyph_cache.misses)
+        if self.dedup_hits:
+            print(f"同じレイアウトのハガキ {self.dedup_hits} 枚は、描画済みのページを使い回しました。")
+        if self.page_cache is not None and not vector:
+            print(self.page_cache.summary())
+        if page_count and len(writer.paths) > 1:
+            print(f"\n全てのハガキを {len(writer.paths)} 個のPDFファイルに分けて保存しました:")
+            for path in writer.paths:
+                print(f"  {path}")
+        elif page_count:
+            print(f"\n全てのハガキを1つのPDFファイルにまとめました: {writer.paths[0]}")
+        else:
+            print("\n生成されたハガキがありませんでした。")
+        return page_count
+
+    def write_pages(self, rows, writer, workers=1, vector=False, executor=None):
+        """
+        行データのイテラブルを描画して writer (PDFライター) に1枚ずつ書き出し、(行データ, エラー) の組を返すジェネレーター。
+        描画できなかった行は書き出さずに飛ばし、エラーにその内容 (文字列) を返す。書き出した行のエラーは None。
+        途中で止める場合は、ジェネレーターを閉じてから writer.close() を呼び出す。
+        executor については _iter_encoded を参照。
+        """
+        if vector:
+            pages = ((row, self._try_layout_row(row)) for row in rows)
+            write_page = self._vector_page_writer(writer)
+        else:
+            pages = self._iter_encoded(rows, workers, executor)
+            write_page = writer.add_encoded_page
+
+        for row, page in pages:
+            if isinstance(page, RowFailure):
+                yield row, page.message
+                continue
+            with self.profiler.span('write'):
+                write_page(page)
+            yield row, None
+
+    def _check_postal_codes(self, rows, report, row_numbers=None):
+        """
+        行データのイテラブルを包み、各行の郵便番号を住所１と照合して report に記録する。
+        postal_complete が True の場合、補完できる行は住所１を補完した行 (コピー) を返す。
+        row_numbers にはレポートに書く行番号のイテラブルを指定できる (既定は1からの連番)。
+        """
+        postal_index = self.postal_index
+        profiler = self.profiler
+        for row_number, row in zip(row_numbers or itertools.count(1), rows):
+            zip_code = row.get('郵便番号') or ''
+            address = row.get('住所１') or ''
+            with profiler.span('postal_check'):
+                status, entries, suggestion = postal_index.check(zip_code, address)
+            report.add(row_number, (row.get('氏名') or '').strip(), zip_code, address, status, entries, suggestion)
+            if status == POSTAL_COMPLETABLE and self.postal_complete and suggestion:
+                row = dict(row)
+                row['住所１'] = suggestion
+                report.completed += 1
+            yield row
+
+    def _check_fit(self, rows, report, row_numbers=None):
+        """
+        行データのイテラブルを包み、各行の住所・氏名が下端に収まるかを fit_fields で計算して report に記録する。
+        文字数と設定値だけから計算するため、描画よりもはるかに速い。row_numbers は _check_postal_codes と同じ。
+        列の足りない行など、計算できない行は記録せずにそのまま返す (描画の前に _skip_unrenderable_rows で取り除く)。
+        """
+        profiler = self.profiler
+        for row_number, row in zip(row_numbers or itertools.count(1), rows):
+            try:
+                with profiler.span('fit'):
+                    plan = fit_fields(*normalize_row(row))
+            except Exception:
+                yield row
+                continue
+            report.add(row_number, (row.get('氏名') or '').strip(), plan)
+            yield row
+
+    def _skip_unrenderable_rows(self, rows, errors, numbers, row_numbers=None, skip_through=0):
+        """
+        行データのイテラブルを包み、描画できない行 (check_row) を errors に記録して取り除く。
+        残した行の行番号は、順に numbers (deque) に追加する。row_numbers は _check_postal_codes と同じ。
+        skip_through 行目までの行 (再開する場合の処理済みの行) は、調べずに読み飛ばす。
+        """
+        for row_number, row in zip(row_numbers or itertools.count(1), rows):
+            if row_number <= skip_through:
+                continue
+            error = check_row(row)
+            if error is not None:
+                errors.add(row_number, (row.get('氏名') or '').strip(), error)
+                print(f"{row_number} 行目を描画できないため、飛ばしました: {error}")
+                continue
+            numbers.append(row_number)
+            yield row
+
+    def check_fit(self, csv_path, report_path=None):
+        """
+        ハガキを描画せずに、住所録の全ての行で住所・氏名が下端からはみ出さないかを調べ、
+        はみ出す (auto_fit の場合は縮小・折り返しする) 行を report_path (CSV) に書き出す。
+        Returns the FitReport.
+        """
+        with open_address_book(csv_path) as reader, FitReport(report_path, auto_fit=self.auto_fit) as report:
+            rows = self.profiler.iter_rows(reader)
+            if self.postal_index is not None and self.postal_complete:
+                rows = self._check_postal_codes(rows, PostalReport())
+            for _ in self._check_fit(rows, report):
+                pass
+        print(report.summary() or "全てのハガキで、住所・氏名が下端に収まります。")
+        return report
+
+    def check_postal_codes(self, csv_path, report_path=None):
+        """
+        ハガキを描画せずに、住所録の全ての行の郵便番号を住所１と照合し、
+        一致しなかった行を report_path (CSV) に書き出す。
+        Returns the PostalReport (counts per status).
+        """
+        if self.postal_index is None:
+            raise ValueError("郵便番号の照合には、KEN_ALL.CSV (郵便番号データ) を指定してください。")
+        with open_address_book(csv_path) as reader, PostalReport(report_path) as report:
+            for _ in self._check_postal_codes(self.profiler.iter_rows(reader), report):
+                pass
+        print(report.summary())
+        return report
+
+    def _open_pdf_writer(self, out_pdf, shard_cards=None, shard_mb=None, n_up=None):
+        """出力の方法 (分割・面付け) に応じたPDFライターを作成する。ページの大きさはレンダラーのDPIから求める。"""
+        if n_up and n_up not in IMPOSITION_CARDS_PER_SHEET:
+            raise ValueError(f"面付けの枚数は {' / '.join(map(str, IMPOSITION_CARDS_PER_SHEET))} のいずれかを指定してください: {n_up}")
+
+        def open_document(path):
+            writer = StreamingPdfWriter(path, resolution=self.layout.dpi)
+            if n_up:
+                writer = ImposedPdfWriter(writer, n_up, IMPOSITION_SHEET_SIZE_MM)
+            return writer
+
+        if shard_cards or shard_mb:
+            max_bytes = int(shard_mb * 1024 * 1024) if shard_mb else None
+            return ShardedPdfWriter(out_pdf, open_document, max_cards=shard_cards, max_bytes=max_bytes)
+        return open_document(out_pdf)
+
+    def dump_layouts(self, csv_path, out_json, error_report=None):
+        """
+        住所録の全ての行のディスプレイリストを、画像を描画せずにJSON Lines形式で書き出す。
+        1行が1枚のハガキに対応し、{"row": 行番号, "name": 氏名, "glyphs": [[フォント名, 文字, X, Y], ...]} の形式。
+        最初の行にはフォント名ごとのサイズ ({"fonts": {フォント名: サイズ}}) を書き出す。
+        自動調整で縮小したフォントは「フォント名@サイズ」の形式になる。
+        配置できない行 (列の足りない行など) は飛ばし、render_csv と同じく error_report (CSV) に書き出す。
+        Returns the number of cards written.
+        """
+        count = 0
+        with open_address_book(csv_path) as reader, open(out_json, 'w', encoding='utf-8') as f, \
+                ErrorReport(error_report) as errors:
+            self.last_error_report = errors
+            f.write(json.dumps({'fonts': {key: self.fonts[key].size for key in FONT_KEYS}}, ensure_ascii=False) + '\n')
+            rows = self.profiler.iter_rows(reader)
+            if self.postal_index is not None and self.postal_complete:
+                # 描画する場合と同じく、住所１を補完した後のレイアウトを書き出す
+                rows = self._check_postal_codes(rows, PostalReport())
+            for row_number, row in enumerate(rows, 1):
+                name = (row.get('氏名') or '').strip()
+                display_list = self._try_layout_row(row)
+                if isinstance(display_list, RowFailure):
+                    errors.add(row_number, name, display_list.message)
+                    print(f"{row_number} 行目を配置できないため、飛ばしました: {display_list.message}")
+                    continue
+                record = {'row': row_number, 'name': name, 'glyphs': display_list}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        if errors.summary():
+            print(errors.summary())
+        print(f"{count} 枚分のレイアウトを書き出しました: {out_json}")
+        return count
+
+
+# --- 並列描画 (プロセスプール) ---
+PARALLEL_CHUNK_SIZE = 8 # ワーカーへ一度に渡す行数
+PARALLEL_MAX_PENDING_PER_WORKER = 2 # ワーカー1つあたりの先読みチャンク数 (メモリ使用量の上限)
+
+# ワーカープロセスごとに1つだけ作成されるレンダラー
+_worker_renderer = None
+
+def _init_render_worker(renderer_options):
+    """ワーカープロセスの初期化。フォントとテンプレートはここで一度だけ読み込む。"""
+    global _worker_renderer
+    _worker_renderer = PostcardRenderer(**renderer_options)
+
+
+def _render_chunk_in_worker(rows):
+    """
+    ワーカープロセスで複数行を描画し、PIL画像ではなく圧縮済みのページを返す。
+    None の行は描画せずに None を返し、描画できない行は RowFailure を返す (同じチャンクの他の行は描画する)。
+    Returns (pages, profile records) — the records are None unless profiling.
+    """
+    pages = [None if row is None else _worker_renderer._try_encode_row(row) for row in rows]
+    return pages, _worker_renderer.profiler.drain()
+
+
+def _iter_chunks(iterable, size):
+    """イテラブルを size 件ずつのリストに分割する。"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def create_render_pool(workers, renderer_options):
+    """ワーカーごとに renderer_options のレンダラーを1つ作成するプロセスプールを作成する。"""
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker, initargs=(renderer_options,))
 
-        pdf_pages.append(img)
-        print(f"「{name1_raw}」様のハガキ画像を一時的に生成しました。")
 
-    # 全ての画像を1つのPDFファイルに保存
-    if pdf_pages:
-        if len(pdf_pages) > 1:
-            pdf_pages[0].save(output_pdf_path, save_all=True, append_images=pdf_pages[1:], resolution=TEMPLATE_DPI)
+def _render_in_process_pool(rows, workers, renderer_options, job=None, profiler=NULL_PROFILER, executor=None):
+    """
+    行データをチャンクに分けてプロセスプールで描画し、
+    (行データ, 圧縮済みページ) の組をCSVの行の順番に並べ直して返す。
+    先読みするチャンク数に上限を設け、結果が溜まりすぎないようにする。
+    job を指定すると、rows の各要素を job(要素) に変換したものをワーカーへ渡す (Noneの場合は描画しない)。
+    ワーカーで計測した工程の時間は profiler に合算する。
+    executor に起動済みのプール (create_render_pool) を指定すると、それを使い、終了時にも停止しない。
+    途中で止めた場合は、まだ始まっていないチャンクを取り消す。
+    """
+    owns_executor = executor is None
+    if owns_executor:
+        executor = create_render_pool(workers, renderer_options)
+    pending = deque()
+    max_pending = workers * PARALLEL_MAX_PENDING_PER_WORKER
+    try:
+        for chunk in _iter_chunks(rows, PARALLEL_CHUNK_SIZE):
+            jobs = chunk if job is None else [job(item) for item in chunk]
+            pending.append((chunk, executor.submit(_render_chunk_in_worker, jobs)))
+            if len(pending) >= max_pending:
+                done_chunk, future = pending.popleft()
+                pages, records = future.result()
+                profiler.merge(records)
+                yield from zip(done_chunk, pages)
+        while pending:
+            done_chunk, future = pending.popleft()
+            pages, records = future.result()
+            profiler.merge(records)
+            yield from zip(done_chunk, pages)
+    finally:
+        if owns_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
         else:
-            pdf_pages[0].save(output_pdf_path, resolution=TEMPLATE_DPI)
-        print(f"\n全てのハガキを1つのPDFファイルにまとめました: {output_pdf_path}")
-    else:
-        print("\n生成されたハガキがありませんでした。")
+            for _, future in pending:
+                future.cancel()
+
+
+# --- プロファイル ---
+# GUIモード (コンソールのない実行ファイルを含む) では、この環境変数にトレースの保存先を指定すると計測する
+PROFILE_ENV_VAR = 'POSTCARD_PROFILE'
+
+def default_trace_path(out_path):
+    """出力ファイルのパスから、トレースの保存先 (拡張子を .trace.json にしたもの) を作る。"""
+    return os.path.splitext(out_path)[0] + '.trace.json'
+
+
+# --- GUIモード ---
+CSV_SELECTION_MESSAGE = "次に、住所録のCSVファイルまたはExcelブック (.xlsx) を選択してください。\nExcelブックは最初のシートを読み込みます。\n\n1行目には以下のヘッダーが必要です:\n氏名,郵便番号,住所１\n\nオプションで連名用: 氏名２\nオプションで敬称個別指定用: 敬称\nオプションで連名用の敬称: 敬称２\nオプションで住所詳細: 住所２\n\n**全ての半角文字（英数字、カタカナ、記号、スペースを含む）は自動的に全角に変換されます。\n氏名１に含まれる全角スペースは自動的に1つに正規化されます。複数のスペースを入れすぎるとレイアウトが崩れる可能性があります。\n氏名２には、名字（スペース区切りで）と名前を入力してください。名字がない場合は名前のみで構いません。\n住所中の半角・全角ハイフンは自動で縦棒に、半角数字は漢数字に変換されます。**"
+
+class PreviewWindow:
+    """
+    住所録のハガキをサムネイルで並べて表示するプレビューウィンドウ (GUIモード)。
+    CSVは表示に必要な行までしか読み込まず、サムネイルもスクロールして見える範囲に入ったものだけを描画する
+    (見える範囲から遠いサムネイルは PREVIEW_MAX_THUMBNAILS を超えた時点で破棄する)。
+    renderer には低いDPI (PREVIEW_THUMBNAIL_DPI) で作成したレンダラーを指定する。
+    """
+
+    PADDING = 10 # サムネイルの周りの余白 (ピクセル)
+    LABEL_HEIGHT = 20 # サムネイルの下に表示する行番号と氏名の高さ
+
+    def __init__(self, master, renderer, csv_path):
+        import tkinter as tk
+        self.renderer = renderer
+        self.reader = open_address_book(csv_path)
+        self.reader.open()
+        self._row_iterator = iter(self.reader)
+        self.rows = [] # これまでに読み込んだ行
+        self.all_rows_loaded = False
+        self.thumbnails = OrderedDict() # 行の位置 → (PhotoImage, キャンバス上の項目)。最後に表示したものほど後ろ
+        self.confirmed = False
+        self._update_pending = False
+        self._scroll_height = None
+        width, height = renderer.template.size
+        self.thumbnail_height = height
+        self.cell_width = width + 2 * self.PADDING
+        self.cell_height = height + self.LABEL_HEIGHT + 2 * self.PADDING
+
+        self.window = tk.Toplevel(master)
+        self.window.title(f"プレビュー - {os.path.basename(self.reader.name)}")
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+        buttons = tk.Frame(self.window)
+        buttons.pack(side="bottom", fill="x")
+        tk.Button(buttons, text="このままPDFを作成", command=self.confirm).pack(side="right", padx=5, pady=5)
+        tk.Button(buttons, text="中止", command=self.cancel).pack(side="right", pady=5)
+        self.status_label = tk.Label(buttons, text="")
+        self.status_label.pack(side="left", padx=5)
+
+        scrollbar = tk.Scrollbar(self.window, orient="vertical")
+        scrollbar.pack(side="right", fill="y")
+        self.canvas = tk.Canvas(self.window, width=self.cell_width * PREVIEW_COLUMNS, height=int(self.cell_height * 1.5),
+                                background="gray75", highlightthickness=0, yscrollincrement=self.cell_height // 4)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.config(command=self.canvas.yview)
+
+        def on_view_changed(first, last):
+            scrollbar.set(first, last)
+            self._schedule_update()
+
+        self.canvas.config(yscrollcommand=on_view_changed)
+        # マウスホイール (Windows・macOS は <MouseWheel>、Linux は Button-4 / Button-5)
+        self.canvas.bind("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.canvas.yview_scroll(1, "units"))
+        self.canvas.bind("<Configure>", lambda event: self._schedule_update())
+        self._schedule_update()
+
+    def _schedule_update(self):
+        """スクロールやウィンドウの大きさの変更をまとめて、アイドル時に一度だけ _update を呼び出す。"""
+        if not self._update_pending:
+            self._update_pending = True
+            self.window.after_idle(self._update)
+
+    def _update(self):
+        """見える範囲 (と1段先) の行を読み込み、まだ描画していないサムネイルを描画する。"""
+        self._update_pending = False
+        canvas = self.canvas
+        top = canvas.canvasy(0)
+        bottom = canvas.canvasy(max(canvas.winfo_height(), 1))
+        first = int(top // self.cell_height) * PREVIEW_COLUMNS
+        end = (int(bottom // self.cell_height) + 1) * PREVIEW_COLUMNS
+        self._load_rows(end + PREVIEW_COLUMNS)
+
+        for index in range(first, min(end, len(self.rows))):
+            if index in self.thumbnails:
+                self.thumbnails.move_to_end(index)
+            else:
+                self.thumbnails[index] = self._draw_thumbnail(index)
+        while len(self.thumbnails) > PREVIEW_MAX_THUMBNAILS:
+            _, (_, items) = self.thumbnails.popitem(last=False)
+            for item in items:
+                canvas.delete(item)
+
+        # まだ読み込んでいない行がある場合は、もう1段スクロールできるようにしておく (スクロールすると続きを読み込む)
+        row_count = -(-len(self.rows) // PREVIEW_COLUMNS) + (0 if self.all_rows_loaded else 1)
+        scroll_height = row_count * self.cell_height
+        if scroll_height != self._scroll_height:
+            # 変わらない場合に設定し直すと、yscrollcommand から再び _update が呼ばれ続けるため
+            self._scroll_height = scroll_height
+            canvas.config(scrollregion=(0, 0, self.cell_width * PREVIEW_COLUMNS, scroll_height))
+            if self.all_rows_loaded:
+                self.status_label.config(text=f"全 {len(self.rows)} 件")
+            else:
+                self.status_label.config(text=f"{len(self.rows)} 件目まで読み込みました (スクロールすると続きを表示します)")
+
+    def _load_rows(self, count):
+        """CSVから、合計 count 行になるまで続きの行を読み込む。"""
+        while len(self.rows) < count and not self.all_rows_loaded:
+            row = next(self._row_iterator, None)
+            if row is None:
+                self.all_rows_loaded = True
+                self.reader.close()
+            else:
+                self.rows.append(row)
+
+    def _draw_thumbnail(self, index):
+        """index 番目の行のハガキを描画してキャンバスに配置する。Returns (PhotoImage, canvas items)."""
+        import tkinter as tk
+        row = self.rows[index]
+        image = self.renderer.render_row(row)
+        # Tkが標準で読み込める PPM / PGM 形式で渡す (PIL.ImageTk を使わない)
+        buffer = io.BytesIO()
+        image.convert('RGB' if image.mode == 'RGB' else 'L').save(buffer, 'PPM')
+        photo = tk.PhotoImage(master=self.canvas, data=buffer.getvalue())
+        x = (index % PREVIEW_COLUMNS) * self.cell_width + self.PADDING
+        y = (index // PREVIEW_COLUMNS) * self.cell_height + self.PADDING
+        items = (
+            self.canvas.create_image(x, y, image=photo, anchor="nw"),
+            self.canvas.create_text(x, y + self.thumbnail_height + 4, anchor="nw",
+                                    text=f"{index + 1}: {(row.get('氏名') or '').strip()}"),
+        )
+        return photo, items
+
+    def confirm(self):
+        """「このままPDFを作成」ボタンの処理。"""
+        self.confirmed = True
+        self.close()
+
+    def cancel(self):
+        """「中止」ボタン (またはウィンドウを閉じる操作) の処理。"""
+        self.close()
+
+    def close(self):
+        self.reader.close()
+        self.thumbnails.clear()
+        self.window.destroy()
 
 
-except Exception as e:
-    messagebox.showerror("エラー", f"スクリプト実行中に予期せぬエラーが発生しました: {e}")
-    import traceback
-    traceback.print_exc()
-finally:
-    destroy_progress_window()
+class RendererLoader:
+    """
+    別スレッドで PostcardRenderer を作成する (Pillowの読み込み・テンプレートとフォントの準備)。
+    GUIモードでは、ユーザーがダイアログを操作している間に準備を終わらせておく。
+    """
+
+    def __init__(self, **renderer_options):
+        import threading
+        self._renderer = None
+        self._error = None
+        self._thread = threading.Thread(target=self._load, args=(renderer_options,), daemon=True)
+        self._thread.start()
+
+    def _load(self, renderer_options):
+        try:
+            self._renderer = PostcardRenderer(**renderer_options)
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        """
+        準備が終わるまで待つ。準備中に発生した例外は、ここで送出する。
+        Returns the PostcardRenderer.
+        """
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._renderer
+
+
+def run_gui():
+    """
+    ファイル選択ダイアログとプログレスウィンドウを使ってPDFを生成する。
+    描画処理そのものは PostcardRenderer に任せる。
+    """
+    global root
+    # 環境変数が指定されている場合は、工程ごとの時間を計測する
+    profile_path = os.environ.get(PROFILE_ENV_VAR)
+    profiler = Profiler() if profile_path else None
+
+    # --- テンプレートとフォントの準備 ---
+    # 最初のダイアログを表示している間に、別スレッドで準備する
+    loader = RendererLoader(profiler=profiler)
+
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+
+    # Tkinterのルートウィンドウを作成（ユーザーには見えない）
+    root = tk.Tk()
+    root.withdraw() # メインウィンドウを非表示にする
+
+    # --- CSVファイルの選択 ---
+    messagebox.showinfo("CSVファイル選択", CSV_SELECTION_MESSAGE)
+
+    csv_file_path = filedialog.askopenfilename(
+        title="住所録ファイルを選択",
+        filetypes=[("住所録 (CSV・Excel)", "*.csv *.xlsx *.xlsm"), ("CSVファイル", "*.csv"), ("Excelブック", "*.xlsx *.xlsm"),
+                   ("全てのファイル", "*.*")]
+    )
+
+    if not csv_file_path:
+        messagebox.showwarning("処理中断", "住所録ファイルが選択されませんでした。スクリプトを終了します。")
+        return 1
+
+    try:
+        renderer = loader.result()
+    except FileNotFoundError as e:
+        messagebox.showerror("エラー", f"{e}\n「TEMPLATE_IMAGE_PATH」の設定と、ファイルが存在するか確認してください。")
+        return 1
+    except OSError as e:
+        messagebox.showerror("エラー", f"{e}\n指定されたフォントファイルがスクリプトと同じディレクトリにあるか、PyInstallerの--add-dataオプションで正しくバンドルされているか確認してください。")
+        return 1
+    except Exception as e:
+        messagebox.showerror("エラー", f"テンプレートまたはフォントの準備中に予期せぬエラーが発生しました: {e}")
+        return 1
+
+    # --- プレビュー (低い解像度のサムネイルで配置を確認する) ---
+    if messagebox.askyesno("プレビュー", "PDFを作成する前に、ハガキの配置をプレビューで確認しますか？"):
+        try:
+            preview = PreviewWindow(root, PostcardRenderer(dpi=PREVIEW_THUMBNAIL_DPI), csv_file_path)
+        except Exception as e:
+            messagebox.showerror("エラー", f"プレビューの表示中にエラーが発生しました: {e}")
+            return 1
+        root.wait_window(preview.window)
+        if not preview.confirmed:
+            messagebox.showwarning("処理中断", "プレビューで中止されました。スクリプトを終了します。")
+            return 1
+
+    # --- PDFファイル名の指定と保存場所の選択 ---
+    messagebox.showinfo("PDFファイル保存", "生成されたPDFファイルの保存先とファイル名を指定してください。")
+
+    output_pdf_path = filedialog.asksaveasfilename(
+        title="PDFファイルを保存",
+        defaultextension=".pdf",
+        filetypes=[("PDFファイル", "*.pdf"), ("全てのファイル", "*.*")],
+        initialfile="generated_postcards.pdf"
+    )
+
+    if not output_pdf_path:
+        messagebox.showwarning("処理中断", "PDFファイルの保存先が指定されませんでした。スクリプトを終了します。")
+        return 1
+
+    # 同じ保存先で中断した処理の途中経過が残っていれば、続きから再開できる
+    checkpoint_path = default_checkpoint_path(output_pdf_path)
+    resume = os.path.exists(checkpoint_path) and messagebox.askyesno(
+        "処理の再開", f"「{output_pdf_path}」には、前回中断した処理の途中経過が残っています。\n\n続きから再開しますか？\n(「いいえ」を選ぶと最初から作成し直します)")
+
+    create_progress_window() # プログレスウィンドウを表示
+
+    # 描画は別スレッドで行い、メインスレッドはウィンドウの操作 (キャンセルなど) に応答し続ける
+    def render_in_background():
+        try:
+            page_count = renderer.render_csv(csv_file_path, output_pdf_path, progress=update_progress, cancel=cancel_event,
+                                             error_report=default_error_report_path(output_pdf_path),
+                                             checkpoint=checkpoint_path, resume=resume)
+            progress_queue.put(('done', page_count))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            progress_queue.put(('error', e))
+
+    finished = []
+    def on_finished(message):
+        finished.append(message)
+        destroy_progress_window()
+        root.quit()
+
+    import threading
+    threading.Thread(target=render_in_background, daemon=True).start()
+    root.after(PROGRESS_POLL_MS, poll_progress, on_finished)
+    root.mainloop()
+
+    status, result = finished[0]
+    if status == 'error':
+        messagebox.showerror("エラー", f"スクリプト実行中に予期せぬエラーが発生しました: {result}")
+        return 1
+
+    if profiler is not None:
+        print(profiler.save(profile_path))
+
+    if cancel_event.is_set():
+        if result:
+            messagebox.showinfo("キャンセル", f"処理をキャンセルしました。\n\nそれまでに生成した {result} 枚のハガキを「{output_pdf_path}」に保存しました。"
+                                "\n同じ住所録と保存先を選ぶと、続きから再開できます。")
+        else:
+            messagebox.showinfo("キャンセル", "処理をキャンセルしました。PDFファイルは作成されませんでした。")
+        return 1
+
+    summaries = [report.summary() for report in (renderer.last_fit_report, renderer.last_error_report) if report is not None]
+    messagebox.showinfo("処理完了", f"全てのハガキ画像の生成が完了し、PDFファイルが作成されました！\n\n「{output_pdf_path}」に保存されています。試し印刷して位置を確認してください。"
+                        + ''.join(f"\n\n{summary}" for summary in summaries if summary))
+    print("\n全てのハガキ画像の生成が完了しました。")
+    print(f"「{output_pdf_path}」に生成されたPDFファイルが保存されています。試し印刷して位置を確認してください。")
+    return 0
+
+
+# --- コマンドラインモード ---
+def build_arg_parser():
+    """コマンドライン引数のパーサーを作成する。"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="postcard_generator",
+        description="住所録 (CSV・Excel) からハガキ宛名面のPDFを生成します。引数を指定しない場合はGUIで起動します。"
+    )
+    parser.add_argument("--csv", help="住所録のパス (CSVファイル、または拡張子が .xlsx / .xlsm のExcelブック)")
+    parser.add_argument("--sheet", help="Excelブックから読み込むシートの名前、またはワークシートの順番 (1から。既定: 最初のシート)")
+    parser.add_argument("--header-alias", action="append", default=[], metavar="別名=列名",
+                        help="住所録の列名の別名 (例: --header-alias お届け先=住所１)。複数指定できる")
+    parser.add_argument("--out", help="出力するPDFファイルのパス")
+    parser.add_argument("--font", default=FONT_PATH, help=f"使用するフォントファイル (既定: {FONT_FILENAME})")
+    parser.add_argument("--glyph-cache-size", type=int, default=GLYPH_CACHE_MAX_ENTRIES, help=f"グリフキャッシュに保持する最大文字数 (0で無効、既定: {GLYPH_CACHE_MAX_ENTRIES})")
+    parser.add_argument("--zip-boxes", action="store_true", help="郵便番号枠を描画する")
+    parser.add_argument("--sender-name", default="", help="差出人の氏名 (全てのハガキに描画)")
+    parser.add_argument("--sender-address", default="", help="差出人の住所 (全てのハガキに描画)")
+    parser.add_argument("--sender-zip", default="", help="差出人の郵便番号 (全てのハガキに描画)")
+    parser.add_argument("--logo", help="全てのハガキに描画するロゴ画像のパス")
+    parser.add_argument("--color-mode", choices=COLOR_MODES, default=COLOR_MODE,
+                        help="ページの色モード: RGB (カラー) / L (グレースケール) / 1 (白黒2値、最も軽量)")
+    parser.add_argument("--vector", action="store_true", help="文字を画像ではなくテキストとして配置したPDFを出力する (fontToolsが必要)")
+    parser.add_argument("--workers", type=int, default=1, help="並列に描画するプロセス数 (0でCPUコア数、既定: 1)")
+    parser.add_argument("--shard-cards", type=int, metavar="N", help="N枚ごとにPDFファイルを分割する (出力名_001.pdf, 出力名_002.pdf, ...)")
+    parser.add_argument("--shard-mb", type=float, metavar="M", help="1ファイルがおよそMメガバイトを超えないようにPDFファイルを分割する")
+    parser.add_argument("--n-up", type=int, choices=IMPOSITION_CARDS_PER_SHEET,
+                        help="A4の用紙に2枚または4枚ずつハガキをトンボ付きで面付けする")
+    parser.add_argument("--cache-dir", help="描画済みのページを保存し、次回以降の実行で変更のない行に再利用するフォルダ")
+    parser.add_argument("--cache-size-mb", type=int, default=PAGE_CACHE_DEFAULT_MAX_MB,
+                        help=f"ページキャッシュの上限サイズ (MB、既定: {PAGE_CACHE_DEFAULT_MAX_MB})。超えると古いページから削除する")
+    parser.add_argument("--profile", nargs="?", const="", metavar="TRACE_JSON",
+                        help="工程ごとの処理時間を計測し、集計表とChromeのトレース (JSON) を出力する (既定: 出力PDF名.trace.json)")
+    parser.add_argument("--dump-layout", metavar="JSON", help="各ハガキの文字の配置をJSON Lines形式で書き出す (--out を省略すると画像は描画しない)")
+    parser.add_argument("--postal-db", metavar="KEN_ALL_CSV",
+                        help="日本郵便の郵便番号データ (KEN_ALL.CSV)。郵便番号と住所１を照合する (索引は初回に作成し、以降は再利用する)")
+    parser.add_argument("--postal-index", metavar="PATH", help="郵便番号の索引ファイルの保存先 (既定: KEN_ALL.CSV と同じフォルダの KEN_ALL.CSV.idx)")
+    parser.add_argument("--postal-report", metavar="CSV",
+                        help="郵便番号と住所１が一致しない行を書き出すCSV (既定: 出力PDF名.postal.csv。--out を省略すると照合だけを行う)")
+    parser.add_argument("--postal-complete", action="store_true", help="都道府県が省略された住所１ (または空の住所１) を郵便番号から補完して描画する")
+    parser.add_argument("--auto-fit", action="store_true",
+                        help="ハガキの下端からはみ出す住所・氏名を、文字サイズと間隔の縮小 (住所１は2列への折り返し) で収める")
+    parser.add_argument("--fit-report", metavar="CSV",
+                        help="はみ出す (--auto-fit では縮小・折り返しした) 行をCSVに書き出す。--out を省略すると描画せずに確認だけを行う")
+    parser.add_argument("--error-report", metavar="CSV",
+                        help="描画できずに飛ばした行 (列の足りない行など) を書き出すCSV (既定: 出力PDF名.errors.csv、エラーがある場合だけ作成)")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_INTERVAL_CARDS, metavar="N",
+                        help=f"N枚を処理するごとに、途中経過 (出力PDF名.checkpoint.json) を保存する (0で保存しない、既定: {CHECKPOINT_INTERVAL_CARDS})")
+    parser.add_argument("--resume", action="store_true",
+                        help="中断した処理を、保存された途中経過から再開する (前回と同じ住所録・出力先・設定を指定する)")
+    parser.add_argument("--dpi", type=int, help=f"描画する解像度 (既定: {TEMPLATE_DPI}、--preview では {PREVIEW_DPI})。レイアウトはmmで指定しているため、DPIを変えても位置関係は変わらない")
+    parser.add_argument("--preview", nargs="?", const=PREVIEW_DEFAULT_ROWS, metavar="ROWS",
+                        help=f"指定した行 (例: 1-20、3,10-12) だけを低い解像度で描画し、レイアウトをすばやく確認する (既定: {PREVIEW_DEFAULT_ROWS})")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                        help="住所録を受け取ってPDFを返すローカルHTTPサービスとして起動する (POST /render、GET /health、GET /metrics)")
+    parser.add_argument("--host", default="127.0.0.1", help="--serve で待ち受けるアドレス (既定: 127.0.0.1、同じマシンからのみ接続可能)")
+    parser.add_argument("--max-jobs", type=int, default=2, help="--serve で同時に処理するリクエストの数、--watch で同時に処理する住所録の数 (既定: 2)")
+    parser.add_argument("--max-queue", type=int, default=16, help="--serve で処理を待つリクエストの数の上限。超えると503を返す (既定: 16)")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="受け取りフォルダを監視し、置かれた住所録を次々にPDFにする (同時に処理する件数は --max-jobs)")
+    parser.add_argument("--watch-out", metavar="DIR", help="--watch で生成したPDFと完了の印 (.done) の出力先 (既定: 受け取りフォルダの中の pdf)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, metavar="SEC", help="--watch で受け取りフォルダを確認する間隔 (秒、既定: 2)")
+    parser.add_argument("--once", action="store_true", help="--watch で、今ある住所録を全て処理した時点で終了する")
+    return parser
+
+
+def main(argv=None):
+    """
+    エントリーポイント。--csv と --out (または --dump-layout / --postal-report / --fit-report)、あるいは --serve / --watch が指定された場合は
+    tkinterを使わずに処理する。
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        return run_gui()
+
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.serve is None and args.watch is None and (not args.csv or not (args.out or args.dump_layout or args.postal_report or args.fit_report)):
+        parser.error("--csv と --out (または --dump-layout / --postal-report / --fit-report) を指定してください。")
+    if (args.postal_report or args.postal_complete or args.postal_index) and not (args.postal_db or args.postal_index):
+        parser.error("--postal-report / --postal-complete には --postal-db (KEN_ALL.CSV) を指定してください。")
+    row_selection = None
+    if args.preview is not None:
+        if not args.out:
+            parser.error("--preview には --out (プレビューのPDF) を指定してください。")
+        try:
+            row_selection = parse_row_selection(args.preview)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.resume:
+        if not args.out or row_selection is not None or args.checkpoint_every <= 0:
+            parser.error("--resume には --out を指定してください (--preview と --checkpoint-every 0 では途中経過を保存しません)。")
+        if args.vector:
+            parser.error("ベクター出力 (--vector) は、途中から再開できません。")
+    dpi = args.dpi or (PREVIEW_DPI if row_selection is not None else TEMPLATE_DPI)
+    header_aliases = {}
+    for alias in args.header_alias:
+        name, sep, column = alias.partition('=')
+        if not sep or not name.strip():
+            parser.error(f"--header-alias は 別名=列名 の形式で指定してください: {alias}")
+        if column.strip() not in HEADER_ALIASES:
+            parser.error(f"--header-alias の列名は {', '.join(HEADER_ALIASES)} のいずれかを指定してください: {alias}")
+        header_aliases[name.strip()] = column.strip()
+    if args.sheet is not None and args.csv and not args.csv.lower().endswith(XLSX_EXTENSIONS):
+        parser.error("--sheet はExcelブック (.xlsx / .xlsm) の住所録にだけ指定できます。")
+
+    def address_book():
+        # 住所録は1回の処理ごとに先頭から読み込む
+        return open_address_book(args.csv, args.sheet, header_aliases)
+
+    try:
+        static_layer = None
+        if args.zip_boxes or args.sender_name or args.sender_address or args.sender_zip or args.logo:
+            static_layer = StaticLayer(
+                zip_boxes=args.zip_boxes, sender_name=args.sender_name, sender_address=args.sender_address,
+                sender_zip_code=args.sender_zip, logo_path=args.logo
+            )
+        page_cache = None
+        if args.cache_dir:
+            page_cache = PageCache(args.cache_dir, args.cache_size_mb * 1024 * 1024)
+        postal_index = None
+        if args.postal_db or args.postal_index:
+            postal_index = PostalIndex(args.postal_db, args.postal_index)
+        renderer_options = {
+            'font_path': args.font, 'glyph_cache_size': args.glyph_cache_size, 'static_layer': static_layer,
+            'color_mode': args.color_mode, 'page_cache': page_cache, 'auto_fit': args.auto_fit, 'dpi': dpi,
+        }
+        if args.serve is not None:
+            from render_service import serve
+            return serve(renderer_options, host=args.host, port=args.serve,
+                         workers=args.workers if args.workers > 0 else (os.cpu_count() or 1),
+                         max_jobs=args.max_jobs, max_queue=args.max_queue)
+        if args.watch is not None:
+            from watch_folder import watch
+            render_options = {'vector': args.vector, 'n_up': args.n_up, 'shard_cards': args.shard_cards,
+                              'shard_mb': args.shard_mb, 'checkpoint_every': args.checkpoint_every}
+            return watch(renderer_options, args.watch, args.watch_out, args.poll_interval,
+                         workers=args.workers if args.workers > 0 else (os.cpu_count() or 1), max_jobs=args.max_jobs,
+                         render_options=render_options, once=args.once)
+        profiler = Profiler() if args.profile is not None else None
+        renderer = PostcardRenderer(font_path=args.font, glyph_cache_size=args.glyph_cache_size, static_layer=static_layer,
+                                    color_mode=args.color_mode, page_cache=page_cache, profiler=profiler,
+                                    postal_index=postal_index, postal_complete=args.postal_complete, auto_fit=args.auto_fit,
+                                    dpi=dpi)
+        if args.dump_layout:
+            # --out も指定した場合は、同じ行を render_csv がエラーのレポートに書き出す
+            renderer.dump_layouts(address_book(), args.dump_layout, error_report=None if args.out else
+                                  (args.error_report or default_error_report_path(args.dump_layout)))
+        if args.postal_report and not args.out:
+            renderer.check_postal_codes(address_book(), args.postal_report)
+        if args.fit_report and not args.out:
+            renderer.check_fit(address_book(), args.fit_report)
+        if args.out:
+            workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+            if args.vector and workers > 1:
+                print("ベクター出力ではラスタライズを行わないため、--workers は使用せず1プロセスで処理します。")
+            postal_report = args.postal_report
+            if postal_index is not None and not postal_report:
+                postal_report = os.path.splitext(args.out)[0] + '.postal.csv'
+            checkpoint = None
+            if row_selection is None and args.checkpoint_every > 0:
+                checkpoint = default_checkpoint_path(args.out)
+            renderer.render_csv(address_book(), args.out, workers=workers, vector=args.vector,
+                                shard_cards=args.shard_cards, shard_mb=args.shard_mb, n_up=args.n_up,
+                                postal_report=postal_report, fit_report=args.fit_report, row_selection=row_selection,
+                                error_report=args.error_report or default_error_report_path(args.out),
+                                checkpoint=checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume)
+        if profiler is not None:
+            trace_path = args.profile or default_trace_path(args.out or args.dump_layout or args.postal_report or args.fit_report)
+            print("\n" + profiler.save(trace_path))
+            print(f"トレースを書き出しました: {trace_path} (chrome://tracing または https://ui.perfetto.dev で開けます)")
+    except Exception as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    return 0
+
 
-messagebox.showinfo("処理完了", f"全てのハガキ画像の生成が完了し、PDFファイルが作成されました！\n\n「{output_pdf_path}」に保存されています。試し印刷して位置を確認してください。")
-print("\n全てのハガキ画像の生成が完了しました。")
-print(f"「{output_pdf_path}」に生成されたPDFファイルが保存されています。試し印刷して位置を確認してください。")
+if __name__ == "__main__":
+    # PyInstallerで固めた実行ファイルでプロセスプールを使うために必要
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+処理の工程ごとの時間を計測するプロファイラー (--profile)。
+
+PostcardRenderer の各工程 (エンコーディング検出・CSV読み込み・正規化・レイアウト・
+テンプレートのコピー・ラスタライズ・圧縮・PDF書き出しなど) を span() で囲んで計測し、
+工程ごとの集計表と、Chrome のトレースイベント形式のJSON (chrome://tracing や
+https://ui.perfetto.dev で表示できる) を出力する。
+
+計測しない場合は NULL_PROFILER を使う。span() は何もしないコンテキストマネージャーを返し、
+iter_rows() は受け取ったイテラブルをそのまま返すため、オーバーヘッドはほぼゼロになる。
+標準ライブラリだけで動作するため、PyInstallerで固めた実行ファイルでも使用できる。
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+# トレースに記録するイベント数の上限。超えた分は集計表にだけ反映し、メモリが増え続けないようにする
+PROFILE_MAX_TRACE_EVENTS = 200000
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class NullProfiler:
+    """計測を行わないプロファイラー。Profiler と同じメソッドを持つ。"""
+
+    enabled = False
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def iter_rows(self, rows):
+        return rows
+
+    def count(self, name, value=1):
+        pass
+
+    def drain(self):
+        return None
+
+    def merge(self, events):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Span:
+    """Profiler.span() が返すコンテキストマネージャー。"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, self.start, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    工程ごとの時間を計測するプロファイラー。
+    totals / calls / maxima に工程ごとの合計時間・回数・最大時間、counters に描画した文字数などを記録する。
+    イベントは (工程名, 開始時刻, 所要時間, 行番号, プロセスID, スレッドID) のタプルで保持する。
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+        self.maxima = {}
+        self.counters = {}
+        self.events = []
+        self.dropped_events = 0
+        self.current_row = None
+        self.started = time.perf_counter()
+
+    def span(self, name):
+        """with文で囲んだ処理の時間を、工程 name として記録する。"""
+        return _Span(self, name)
+
+    def add(self, name, start, duration, row=None, pid=None, tid=None):
+        """開始時刻 start (perf_counter の秒) から duration 秒かかった工程 name を記録する。"""
+        self.totals[name] = self.totals.get(name, 0.0) + duration
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if duration > self.maxima.get(name, 0.0):
+            self.maxima[name] = duration
+        if len(self.events) < PROFILE_MAX_TRACE_EVENTS:
+            self.events.append((name, start, duration, self.current_row if row is None else row,
+                                os.getpid() if pid is None else pid,
+                                threading.get_ident() if tid is None else tid))
+        else:
+            self.dropped_events += 1
+
+    def iter_rows(self, rows):
+        """
+        行データのイテラブルを包み、1行の読み込みにかかった時間を工程 'read' として記録する。
+        以降の工程のイベントには、読み込んだ行の番号 (1から) が付く。
+        """
+        iterator = iter(rows)
+        row_number = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+            row_number += 1
+            self.current_row = row_number
+            self.add('read', start, time.perf_counter() - start)
+            yield row
+
+    def count(self, name, value=1):
+        """描画した文字数などのカウンターに value を加算する。"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def drain(self):
+        """
+        ワーカープロセスで記録したイベントとカウンターを取り出してリセットする。
+        Returns a picklable (events, counters) pair for merge().
+        """
+        events, counters = self.events, self.counters
+        self.events, self.counters = [], {}
+        return events, counters
+
+    def merge(self, drained):
+        """drain() で取り出した別プロセスの記録を、このプロファイラーに合算する。"""
+        if not drained:
+            return
+        events, counters = drained
+        for name, start, duration, row, pid, tid in events:
+            self.add(name, start, duration, row, pid, tid)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def summary(self):
+        """工程ごとの集計表 (文字列) を返す。"""
+        wall = time.perf_counter() - self.started
+        rows = self.calls.get('read', 0)
+        lines = [
+            f"{'工程':<16}{'回数':>10}{'合計(秒)':>12}{'平均(ms)':>12}{'最大(ms)':>12}{'1行あたり(ms)':>16}{'割合':>8}",
+        ]
+        for name, total in sorted(self.totals.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            per_row = total / rows * 1000 if rows else 0.0
+            share = total / wall * 100 if wall else 0.0
+            lines.append(f"{name:<16}{calls:>10}{total:>12.3f}{total / calls * 1000:>12.3f}"
+                         f"{self.maxima[name] * 1000:>12.3f}{per_row:>16.3f}{share:>7.1f}%")
+        lines.append(f"経過時間: {wall:.3f} 秒 / 行数: {rows}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        if self.dropped_events:
+            lines.append(f"(トレースのイベント数が上限を超えたため、{self.dropped_events} 件はトレースに含めていません)")
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """Chrome のトレースイベント形式 (JSON) でイベントを書き出す。時刻の単位はマイクロ秒。"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"traceEvents": [\n')
+            for i, (name, start, duration, row, pid, tid) in enumerate(self.events):
+                event = {'name': name, 'cat': 'postcard', 'ph': 'X', 'ts': round(start * 1e6, 1),
+                         'dur': round(duration * 1e6, 1), 'pid': pid, 'tid': tid}
+                if row is not None:
+                    event['args'] = {'row': row}
+                f.write(('' if i == 0 else ',\n') + json.dumps(event, ensure_ascii=False))
+            f.write('\n],\n"displayTimeUnit": "ms",\n')
+            f.write('"otherData": ' + json.dumps({'counters': self.counters, 'dropped_events': self.dropped_events},
+                                                 ensure_ascii=False))
+            f.write('}\n')
+
+    def save(self, trace_path):
+        """
+        トレース (trace_path) と集計表 (拡張子を .txt にしたファイル) を書き出す。
+        コンソールのないGUIの実行ファイルでも結果を確認できるよう、集計表もファイルに残す。
+        Returns the summary table.
+        """
+        summary = self.summary()
+        self.write_trace(trace_path)
+        with open(os.path.splitext(trace_path)[0] + '.txt', 'w', encoding='utf-8') as f:
+            f.write(summary + '\n')
+        return summary
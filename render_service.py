@@ -0,0 +1,449 @@
+"""
+ハガキ宛名面のPDFを生成するローカルHTTPサービス (--serve)。
+
+住所録CSV (または行データのJSON) をPOSTすると、描画したページから順にPDFをストリーミングで返す。
+標準ライブラリの http.server だけで動作し、外部のネットワークには一切接続しない。
+
+  POST /render            本文に住所録CSV (Content-Type: text/csv、エンコーディングは自動検出)、
+                          Excelブック (Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet) か、
+                          JSON ([{"氏名": ..., "郵便番号": ..., "住所１": ...}, ...] または {"rows": [...]}) を指定する。
+                          クエリ: vector=1 (テキストとして配置したPDF) / n_up=2,4 (A4に面付け) / filename=名前.pdf /
+                                  sheet=シート名または順番 (Excelブックの場合。既定は最初のシート)
+                          応答は application/pdf (Transfer-Encoding: chunked)。
+  GET  /health            稼働状態 ({"status": "ok", ...})
+  GET  /metrics           待ち行列の長さ・処理中のジョブ数・1秒あたりの枚数・所要時間のパーセンタイルなど (JSON)
+
+フォントとテンプレートは起動時に一度だけ読み込む。ラスタライズと圧縮は起動済みのプロセスプール
+(ワーカーごとにレンダラーを1つ保持) で行い、ジョブごとにワーカーを起動し直さない。
+同時に処理するジョブの数 (max_jobs) を超えたリクエストは待ち行列に入り、
+待ち行列も一杯 (max_queue) の場合は 503 を返す。
+
+使い方:
+    python postcard_generator.py --serve 8765 --workers 4
+    curl --data-binary @住所録.csv -H "Content-Type: text/csv" http://127.0.0.1:8765/render -o postcards.pdf
+"""
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+import csv
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import queue
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlsplit
+
+import postcard_generator
+from postcard_generator import IMPOSITION_CARDS_PER_SHEET, CsvRowReader, PostcardRenderer, XlsxRowReader, create_render_pool
+
+SERVICE_DEFAULT_HOST = '127.0.0.1' # 既定では同じマシンからの接続だけを受け付ける
+SERVICE_DEFAULT_MAX_JOBS = 2 # 同時に処理するジョブ (リクエスト) の数
+SERVICE_DEFAULT_MAX_QUEUE = 16 # 処理を待つジョブの数の上限。超えたリクエストには 503 を返す
+SERVICE_MAX_UPLOAD_MB = 64 # アップロードできる住所録の最大サイズ
+SERVICE_SPOOL_BYTES = 4 * 1024 * 1024 # これより大きいアップロードは一時ファイルに書き出す
+SERVICE_STREAM_BUFFER_BYTES = 64 * 1024 # レスポンスのチャンクの大きさの目安 (ページごとにも送る)
+SERVICE_LATENCY_SAMPLES = 1000 # パーセンタイルの計算に使う、直近のジョブの数
+SERVICE_RATE_WINDOW_SEC = 60 # 1秒あたりの枚数を計算する期間 (秒)
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class ServiceBusy(Exception):
+    """待ち行列が一杯で、リクエストを受け付けられない。"""
+
+
+class _ChunkedWriter:
+    """
+    HTTPのレスポンスを Transfer-Encoding: chunked で書き出すストリーム。
+    小さな書き込みはバッファに溜め、ある程度の大きさになるか flush() が呼ばれたら1つのチャンクとして送る。
+    """
+
+    def __init__(self, wfile, buffer_size=SERVICE_STREAM_BUFFER_BYTES):
+        self._wfile = wfile
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._wfile.write(b'%X\r\n' % len(self._buffer) + bytes(self._buffer) + b'\r\n')
+            self._buffer.clear()
+        self._wfile.flush()
+
+    def finish(self):
+        """残りを送り、終端のチャンクを書き出す。"""
+        self.flush()
+        self._wfile.write(b'0\r\n\r\n')
+        self._wfile.flush()
+
+
+def _content_disposition(filename, default='postcards.pdf'):
+    """
+    クエリで指定されたファイル名から Content-Disposition ヘッダーの値を作る (RFC 6266 / RFC 5987)。
+    ディレクトリの部分と制御文字 (改行を含む) は取り除き、filename からは " と \\ も取り除く。
+    日本語などの名前は filename* に UTF-8 で指定し、filename には ASCII 以外を _ に置き換えた名前を指定する。
+    """
+    name = filename.replace('\\', '/').rsplit('/', 1)[-1]
+    name = ''.join(char for char in name if char.isprintable()).strip()
+    if not name or name in ('.', '..'):
+        name = default
+    fallback = ''.join(char if ' ' <= char <= '~' else '_' for char in name if char not in '"\\')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
+
+
+def _percentiles(samples, points=(50, 90, 99)):
+    """サンプルのパーセンタイル (最近傍順位法) をミリ秒で返す。"""
+    if not samples:
+        return {f'p{point}': None for point in points}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        rank = max(0, -(-point * len(ordered) // 100) - 1)
+        result[f'p{point}'] = round(ordered[rank] * 1000, 1)
+    return result
+
+
+class ServiceMetrics:
+    """ジョブの件数・描画した枚数・所要時間を記録する。複数のスレッドから呼び出せる。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.queued = 0
+        self.active = 0
+        self.jobs_total = 0
+        self.jobs_failed = 0
+        self.jobs_rejected = 0
+        self.cards_total = 0
+        self._card_times = deque()
+        self._latencies = deque(maxlen=SERVICE_LATENCY_SAMPLES)
+        self._first_page_latencies = deque(maxlen=SERVICE_LATENCY_SAMPLES)
+
+    def card_written(self):
+        now = time.monotonic()
+        with self._lock:
+            self.cards_total += 1
+            self._card_times.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        limit = now - SERVICE_RATE_WINDOW_SEC
+        while self._card_times and self._card_times[0] < limit:
+            self._card_times.popleft()
+
+    def job_finished(self, latency, first_page_latency, failed=False):
+        with self._lock:
+            self.jobs_total += 1
+            if failed:
+                self.jobs_failed += 1
+                return
+            self._latencies.append(latency)
+            if first_page_latency is not None:
+                self._first_page_latencies.append(first_page_latency)
+
+    def snapshot(self):
+        """/metrics で返す辞書。"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            uptime = now - self.started
+            window = min(uptime, SERVICE_RATE_WINDOW_SEC)
+            return {
+                'uptime_sec': round(uptime, 1),
+                'queue_depth': self.queued,
+                'active_jobs': self.active,
+                'jobs_total': self.jobs_total,
+                'jobs_failed': self.jobs_failed,
+                'jobs_rejected': self.jobs_rejected,
+                'cards_total': self.cards_total,
+                'cards_per_sec': round(len(self._card_times) / window, 2) if window > 0 else 0.0,
+                'latency_ms': _percentiles(self._latencies),
+                'first_page_latency_ms': _percentiles(self._first_page_latencies),
+            }
+
+
+class RenderService:
+    """
+    HTTPサービスの本体。HTTPに依存しないため、他のコードから直接 render() を呼び出すこともできる。
+    renderer_options は PostcardRenderer の引数。起動時にジョブの数 (max_jobs) だけレンダラーを作り、
+    workers 個のワーカープロセスを起動してフォントを読み込ませておく。
+    """
+
+    def __init__(self, renderer_options=None, workers=1, max_jobs=SERVICE_DEFAULT_MAX_JOBS,
+                 max_queue=SERVICE_DEFAULT_MAX_QUEUE):
+        self.renderer_options = dict(renderer_options or {})
+        self.workers = max(1, workers)
+        self.max_jobs = max(1, max_jobs)
+        self.max_queue = max_queue
+        self.metrics = ServiceMetrics()
+        self._admission_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+
+        # ジョブごとに1つ貸し出すレンダラー。レイアウトの計算やベクター出力、ページキャッシュの参照に使う
+        # (グリフキャッシュなどはスレッド間で共有しない)
+        renderers = [PostcardRenderer(**self.renderer_options) for _ in range(self.max_jobs)]
+        self._renderers = queue.Queue()
+        for renderer in renderers:
+            self._renderers.put(renderer)
+        self._worker_options = renderers[0].worker_options()
+        self.executor = None
+        self._start_pool()
+
+    def _start_pool(self):
+        """ワーカープロセスを起動し、全てのワーカーがフォントを読み込むまで待つ。"""
+        self.executor = create_render_pool(self.workers, self._worker_options)
+        # プロセスは必要になるまで起動されないため、ワーカーの数だけ空のジョブを同時に投げて起動しておく
+        warm_up = [self.executor.submit(postcard_generator._render_chunk_in_worker, [])
+                   for _ in range(self.workers)]
+        for future in warm_up:
+            future.result()
+
+    def _restart_pool_if_broken(self, executor):
+        """ワーカーが異常終了した場合は、プールを作り直す (他のジョブが作り直し済みなら何もしない)。"""
+        with self._pool_lock:
+            if self.executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._start_pool()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def admit(self):
+        """
+        ジョブを開始できるまで待ち、レンダラーを1つ借りる。借りたものは release() で返すこと。
+        待ち行列が一杯の場合は ServiceBusy を送出する。
+        """
+        metrics = self.metrics
+        with self._admission_lock:
+            if self._renderers.empty() and metrics.queued >= self.max_queue:
+                metrics.jobs_rejected += 1
+                raise ServiceBusy()
+            metrics.queued += 1
+        try:
+            renderer = self._renderers.get()
+        finally:
+            with self._admission_lock:
+                metrics.queued -= 1
+        with self._admission_lock:
+            metrics.active += 1
+        return renderer
+
+    def release(self, renderer):
+        with self._admission_lock:
+            self.metrics.active -= 1
+        self._renderers.put(renderer)
+
+    def render(self, renderer, rows, out, vector=False, n_up=None, started=None):
+        """
+        行データを描画して out (バイナリのストリーム) にPDFを書き出す。1枚書き出すごとに out.flush() を呼ぶ。
+        描画できない行 (列の足りない行など) は、ログに出力して飛ばす。
+        Returns the number of postcards written.
+        """
+        started = time.monotonic() if started is None else started
+        first_page_latency = None
+        executor = self.executor
+        failed = True
+        try:
+            with renderer._open_pdf_writer(out, n_up=n_up) as writer:
+                for row_number, (row, error) in enumerate(renderer.write_pages(rows, writer, self.workers, vector,
+                                                                              executor=executor), 1):
+                    if error is not None:
+                        print(f"{row_number} 行目「{(row.get('氏名') or '').strip()}」を描画できないため、飛ばしました: {error}")
+                        continue
+                    if first_page_latency is None:
+                        first_page_latency = time.monotonic() - started
+                    out.flush()
+                    self.metrics.card_written()
+                writer.close()
+            failed = False
+            return writer.card_count
+        except BrokenProcessPool:
+            self._restart_pool_if_broken(executor)
+            raise
+        finally:
+            self.metrics.job_finished(time.monotonic() - started, first_page_latency, failed)
+
+    def health(self):
+        return {'status': 'ok', 'workers': self.workers, 'max_jobs': self.max_jobs, 'max_queue': self.max_queue}
+
+
+def _json_rows(data):
+    """JSONの本文から行データ (値は文字列) のリストを取り出す。"""
+    payload = json.loads(data.decode('utf-8'))
+    rows = payload.get('rows') if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError('JSONは行の配列、または {"rows": [...]} の形式で指定してください。')
+    return [{str(key): '' if value is None else str(value) for key, value in row.items()} for row in rows]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """RenderService へのリクエストを処理する。server.service に RenderService を持たせておく。"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PostcardGenerator'
+
+    def log_message(self, format, *args):
+        # 既定では標準エラー出力に書かれる1行のアクセスログを、他のメッセージと同じ形式で出力する
+        print(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=()):
+        self._send_json(status, {'error': message}, headers)
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(200, service.health())
+        elif path == '/metrics':
+            self._send_json(200, dict(service.health(), **service.metrics.snapshot()))
+        else:
+            self._send_error(404, f'見つかりません: {path}')
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        # 本文を読まずに応答する場合は、残った本文を次のリクエストとして読まないよう接続を閉じる
+        if url.path != '/render':
+            self._send_error(404, f'見つかりません: {url.path}')
+            self.close_connection = True
+            return
+        started = time.monotonic()
+        service = self.server.service
+        query = parse_qs(url.query)
+        vector = query.get('vector', ['0'])[0] in ('1', 'true', 'yes')
+        filename = query.get('filename', ['postcards.pdf'])[0]
+        try:
+            n_up = int(query['n_up'][0]) if 'n_up' in query else None
+        except ValueError:
+            n_up = -1
+        if n_up is not None and n_up not in IMPOSITION_CARDS_PER_SHEET:
+            self._send_error(400, f"n_up には {' / '.join(map(str, IMPOSITION_CARDS_PER_SHEET))} のいずれかを指定してください。")
+            self.close_connection = True
+            return
+
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self._send_error(411, 'Content-Length を指定してください。')
+            self.close_connection = True
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_error(400, 'Content-Length が正しくありません。')
+            self.close_connection = True
+            return
+        if length > SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            self._send_error(413, f'住所録が大きすぎます (上限 {SERVICE_MAX_UPLOAD_MB} MB)。')
+            self.close_connection = True
+            return
+
+        # 混み合っている場合は、本文を受け取る前に断る
+        try:
+            renderer = service.admit()
+        except ServiceBusy:
+            self._send_error(503, '混み合っているため、しばらくしてから再度お試しください。', [('Retry-After', '5')])
+            self.close_connection = True
+            return
+        try:
+            # 本文は一定の大きさを超えると一時ファイルに書き出し、メモリに溜めすぎないようにする
+            with tempfile.SpooledTemporaryFile(max_size=SERVICE_SPOOL_BYTES) as upload:
+                remaining = length
+                while remaining > 0:
+                    data = self.rfile.read(min(remaining, SERVICE_STREAM_BUFFER_BYTES))
+                    if not data:
+                        break
+                    upload.write(data)
+                    remaining -= len(data)
+                upload.seek(0)
+                self._render(service, renderer, upload, vector, n_up, filename, started, query.get('sheet', [None])[0])
+        finally:
+            service.release(renderer)
+
+    def _render(self, service, renderer, upload, vector, n_up, filename, started, sheet=None):
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        reader = None
+        try:
+            try:
+                if content_type == 'application/json':
+                    rows = iter(_json_rows(upload.read()))
+                elif content_type == XLSX_CONTENT_TYPE:
+                    reader = XlsxRowReader(upload, sheet)
+                    rows = iter(reader)
+                else:
+                    reader = CsvRowReader(upload)
+                    rows = iter(reader)
+                # 1行も無い場合は、PDFを返し始める前にエラーにする
+                first = next(rows, None)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                self._send_error(400, str(e))
+                return
+            if first is None:
+                self._send_error(400, '住所録に行がありません。')
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Disposition', _content_disposition(filename))
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            out = _ChunkedWriter(self.wfile)
+            try:
+                count = service.render(renderer, itertools.chain([first], rows), out, vector=vector, n_up=n_up,
+                                       started=started)
+                out.finish()
+                print(f"{count} 枚のハガキを返しました ({time.monotonic() - started:.2f} 秒)。")
+            except ConnectionError:
+                # クライアントが途中で切断した
+                print("クライアントが切断したため、処理を中断しました。")
+                self.close_connection = True
+            except Exception as e:
+                # 応答の途中ではステータスを変えられないため、接続を切ってクライアントに失敗を知らせる
+                print(f"エラー: {e}")
+                self.close_connection = True
+        finally:
+            if reader is not None:
+                reader.close()
+
+
+def create_server(service, host=SERVICE_DEFAULT_HOST, port=0):
+    """RenderService を公開するHTTPサーバーを作成する (port=0 で空いているポートを使う)。"""
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(renderer_options=None, host=SERVICE_DEFAULT_HOST, port=8765, workers=1,
+          max_jobs=SERVICE_DEFAULT_MAX_JOBS, max_queue=SERVICE_DEFAULT_MAX_QUEUE):
+    """サービスを起動し、Ctrl+C で止めるまでリクエストを処理する。"""
+    start = time.perf_counter()
+    service = RenderService(renderer_options, workers=workers, max_jobs=max_jobs, max_queue=max_queue)
+    server = create_server(service, host, port)
+    print(f"ワーカー {service.workers} 個の準備が完了しました ({time.perf_counter() - start:.2f} 秒)。")
+    print(f"http://{host}:{server.server_address[1]}/render で受け付けています (Ctrl+C で終了)。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n終了します。")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
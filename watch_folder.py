@@ -0,0 +1,263 @@
+"""
+受け取りフォルダに置かれた住所録を、次々にPDFにするバッチ処理 (--watch)。
+
+受け取りフォルダを一定の間隔で確認し (ポーリング)、新しく置かれた住所録 (CSV・Excelブック) を待ち行列に入れて、
+同時に max_jobs 件ずつPDFにする。書き込みの途中のファイルを読まないよう、大きさと更新日時が
+前回の確認から変わっていないファイルだけを処理する。
+
+出力フォルダ (既定は受け取りフォルダの中の pdf) には、住所録ごとに次のファイルを書き出す。
+名前は拡張子を含めた住所録のファイル名 (例: 名簿.csv) で、名簿.csv と 名簿.xlsx が同じファイルに書き出されることはない。
+  名前.pdf            生成したPDF (描画できなかった行は 名前.errors.csv)
+  名前.done           完了の印 (元のファイルの大きさ・更新日時と、枚数・所要時間のJSON)
+  名前.failed         住所録を読み込めないなどで失敗した印 (エラーの内容のJSON)
+  名前.running        処理中の印。中断した場合は残り、次に起動したときに途中経過 (チェックポイント) から再開する
+完了・失敗の印があるファイルは、内容が変わる (大きさか更新日時が変わる) まで処理し直さない。
+
+フォントとテンプレートは起動時に一度だけ読み込み (RenderService)、ラスタライズは全てのジョブで共有する
+起動済みのプロセスプールで行うため、住所録ごとの起動の時間はかからない。
+
+使い方:
+    python postcard_generator.py --watch 受け取りフォルダ --max-jobs 2 --workers 4
+    python postcard_generator.py --watch 受け取りフォルダ --once   # 今あるファイルだけを処理して終了する
+"""
+from concurrent.futures.process import BrokenProcessPool
+import json
+import os
+import queue
+import threading
+import time
+
+from postcard_generator import XLSX_EXTENSIONS, default_checkpoint_path, default_error_report_path
+from render_service import RenderService
+
+WATCH_DEFAULT_POLL_SEC = 2.0 # 受け取りフォルダを確認する間隔 (秒)
+WATCH_DEFAULT_OUTPUT_SUBDIR = 'pdf' # 出力フォルダを指定しない場合の、受け取りフォルダの中の出力先
+WATCH_EXTENSIONS = ('.csv',) + XLSX_EXTENSIONS
+WATCH_IGNORED_PREFIXES = ('.', '~$') # 隠しファイルと、Excelが開いている間に作る一時ファイル
+
+DONE_SUFFIX = '.done'
+FAILED_SUFFIX = '.failed'
+RUNNING_SUFFIX = '.running'
+
+
+def _signature(path):
+    """ファイルの内容が変わったかどうかを判定するための (大きさ, 更新日時[ns])。"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_marker(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(path, record):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class WatchFolder:
+    """
+    受け取りフォルダを監視し、住所録を service (RenderService) のレンダラーとプロセスプールでPDFにする。
+    同時に処理する住所録の数は service.max_jobs。render_options は render_csv に渡す出力の設定
+    (vector / n_up / shard_cards / shard_mb / checkpoint_every)。
+    """
+
+    def __init__(self, service, input_dir, output_dir=None, poll_interval=WATCH_DEFAULT_POLL_SEC, render_options=None):
+        if not os.path.isdir(input_dir):
+            raise ValueError(f"受け取りフォルダが見つかりません: {input_dir}")
+        self.service = service
+        self.input_dir = input_dir
+        self.output_dir = output_dir or os.path.join(input_dir, WATCH_DEFAULT_OUTPUT_SUBDIR)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.render_options = dict(render_options or {})
+        # セットすると、処理中のジョブは次のハガキで止まり、途中経過を保存する
+        self.cancel = threading.Event()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._active = set() # 待ち行列に入れたか、処理中のファイル
+        self._last_seen = {} # 前回の確認で見つけたファイルの (大きさ, 更新日時)
+        self._finished = {} # 処理し終えたファイルの (大きさ, 更新日時)。確認のたびに印を読み直さない
+
+    def _output_base(self, path):
+        # 拡張子を残し、名前だけが同じ住所録 (名簿.csv と 名簿.xlsx) の出力やチェックポイントが重ならないようにする
+        return os.path.join(self.output_dir, os.path.basename(path))
+
+    def _is_finished(self, path, signature):
+        """同じ内容のファイルを、すでに処理し終えた (完了または失敗した) かどうか。"""
+        if self._finished.get(path) == signature:
+            return True
+        base = self._output_base(path)
+        for suffix in (DONE_SUFFIX, FAILED_SUFFIX):
+            marker = _read_marker(base + suffix)
+            if marker is not None and (marker.get('size'), marker.get('mtime_ns')) == signature:
+                self._finished[path] = signature
+                return True
+        return False
+
+    def scan(self, settle=True):
+        """
+        受け取りフォルダを確認し、処理するファイルを待ち行列に入れる。
+        settle が True の場合は、前回の確認から大きさと更新日時が変わっていないファイルだけを入れる。
+        Returns the number of files queued.
+        """
+        seen = {}
+        queued = 0
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if (not entry.is_file() or name.startswith(WATCH_IGNORED_PREFIXES)
+                        or not name.lower().endswith(WATCH_EXTENSIONS)):
+                    continue
+                try:
+                    signature = _signature(entry.path)
+                except OSError:
+                    continue
+                seen[entry.path] = signature
+                with self._lock:
+                    if entry.path in self._active:
+                        continue
+                if settle and self._last_seen.get(entry.path) != signature:
+                    continue # 書き込み中かもしれないため、次の確認まで待つ
+                if self._is_finished(entry.path, signature):
+                    continue
+                with self._lock:
+                    self._active.add(entry.path)
+                self._jobs.put(entry.path)
+                queued += 1
+        self._last_seen = seen
+        return queued
+
+    def _worker(self):
+        while True:
+            path = self._jobs.get()
+            try:
+                if path is None:
+                    return
+                renderer = self.service.admit()
+                try:
+                    self.process(renderer, path)
+                finally:
+                    self.service.release(renderer)
+            finally:
+                with self._lock:
+                    self._active.discard(path)
+                self._jobs.task_done()
+
+    def process(self, renderer, path):
+        """1つの住所録をPDFにし、完了 (または失敗) の印を書き出す。"""
+        base = self._output_base(path)
+        out_pdf = base + '.pdf'
+        size, mtime_ns = _signature(path)
+        record = {'source': path, 'size': size, 'mtime_ns': mtime_ns}
+        options = self.render_options
+        checkpoint_every = options.get('checkpoint_every', 0)
+        # 前回同じ内容のファイルを処理している途中で止まった場合は、途中経過から再開する
+        running = _read_marker(base + RUNNING_SUFFIX)
+        resume = bool(checkpoint_every) and not options.get('vector') and running == record
+        _write_marker(base + RUNNING_SUFFIX, record)
+        _remove(base + FAILED_SUFFIX)
+
+        print(f"「{os.path.basename(path)}」の処理を{'再開' if resume else '開始'}します。")
+        started = time.monotonic()
+        executor = self.service.executor
+        try:
+            cards = renderer.render_csv(
+                path, out_pdf, workers=self.service.workers, executor=executor, vector=options.get('vector', False),
+                n_up=options.get('n_up'), shard_cards=options.get('shard_cards'), shard_mb=options.get('shard_mb'),
+                error_report=default_error_report_path(out_pdf),
+                checkpoint=default_checkpoint_path(out_pdf) if checkpoint_every else None,
+                checkpoint_every=checkpoint_every, resume=resume, cancel=self.cancel, verbose=False)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self.service._restart_pool_if_broken(executor)
+            if self.cancel.is_set():
+                return
+            _write_marker(base + FAILED_SUFFIX, dict(record, error=str(e)))
+            _remove(base + RUNNING_SUFFIX)
+            with self._lock:
+                self._finished[path] = (size, mtime_ns)
+                self.jobs_failed += 1
+            print(f"「{os.path.basename(path)}」を処理できませんでした: {e}")
+            return
+        if self.cancel.is_set():
+            # 処理中の印を残し、次に起動したときに再開する
+            print(f"「{os.path.basename(path)}」の処理を中断しました ({cards} 枚まで書き出し済み)。")
+            return
+
+        elapsed = time.monotonic() - started
+        errors = renderer.last_error_report.entries if renderer.last_error_report is not None else []
+        _write_marker(base + DONE_SUFFIX, dict(record, cards=cards, skipped_rows=len(errors), seconds=round(elapsed, 2)))
+        _remove(base + RUNNING_SUFFIX)
+        with self._lock:
+            self._finished[path] = (size, mtime_ns)
+            self.jobs_done += 1
+        print(f"「{os.path.basename(path)}」: {cards} 枚のハガキを書き出しました ({elapsed:.2f} 秒"
+              + (f"、描画できなかった行 {len(errors)} 件" if errors else '') + f") → {out_pdf}")
+
+    def run(self, once=False):
+        """
+        受け取りフォルダの監視を始め、Ctrl+C で止めるまで処理を続ける。
+        once が True の場合は、今あるファイルを全て処理した時点で終了する。
+        """
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.service.max_jobs)]
+        for thread in threads:
+            thread.start()
+        try:
+            if once:
+                # 起動時に置かれているファイルは、書き込みが終わっているものとして扱う
+                self.scan(settle=False)
+                self._jobs.join()
+            else:
+                while True:
+                    self.scan()
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("\n終了します。処理中の住所録は、次に起動したときに途中から再開します。")
+            self.cancel.set()
+            # まだ始まっていないジョブは取り消す
+            while True:
+                try:
+                    self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                self._jobs.task_done()
+        finally:
+            for _ in threads:
+                self._jobs.put(None)
+            for thread in threads:
+                thread.join()
+
+
+def watch(renderer_options, input_dir, output_dir=None, poll_interval=WATCH_DEFAULT_POLL_SEC, workers=1, max_jobs=2,
+          render_options=None, once=False):
+    """フォントとワーカーを準備して受け取りフォルダの監視を始め、Ctrl+C で止めるまで (once では全て処理するまで) 処理する。"""
+    start = time.perf_counter()
+    service = RenderService(renderer_options, workers=workers, max_jobs=max_jobs)
+    try:
+        watcher = WatchFolder(service, input_dir, output_dir, poll_interval, render_options)
+        print(f"ワーカー {service.workers} 個の準備が完了しました ({time.perf_counter() - start:.2f} 秒)。")
+        if once:
+            print(f"「{input_dir}」の住所録を処理します (出力先: {watcher.output_dir})。")
+        else:
+            print(f"「{input_dir}」を {poll_interval:g} 秒ごとに確認しています (出力先: {watcher.output_dir}、Ctrl+C で終了)。")
+        watcher.run(once)
+        print(f"完了 {watcher.jobs_done} 件 / 失敗 {watcher.jobs_failed} 件")
+        return 1 if watcher.jobs_failed else 0
+    finally:
+        service.close()
@@ -0,0 +1,452 @@
+"""
+Excelブック (.xlsx) のシートを、先頭から1行ずつ読み込むリーダー。
+
+.xlsx はZIPに格納されたXMLなので、標準ライブラリの zipfile と xml.etree.ElementTree.iterparse だけで読み込む
+(openpyxl などは不要)。シートのXMLは展開しながら解析し、読み終えた行の要素はすぐに破棄するため、
+行数が数十万行でもメモリ使用量はほぼ一定になる。文字列はUnicodeで格納されているので、エンコーディングの検出も不要。
+
+各セルの値は、CSVとして保存した場合と同じ文字列に変換する:
+  * 文字列 (共有文字列・インライン文字列) はそのまま (ふりがな (rPh) は除く)
+  * 数値は「0」「#」と区切り文字だけの表示形式 (郵便番号の「000-0000」など) であれば、その形式で
+    (先頭の0が消えない)。それ以外の数値は整数ならそのまま、小数は15桁までの表記
+  * 真偽値は TRUE / FALSE、エラーと数式の文字列結果はその文字列
+
+    with XlsxSheetReader('住所録.xlsx', sheet='2025年') as sheet:
+        for values in sheet:  # 1行分のセルの値のリスト (A列から、空のセルは '')
+            ...
+"""
+from array import array
+import os
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import ParseError, iterparse, parse
+
+# シートとパーツの関係を表す名前空間 (Transitional と Strict の両方に対応する)。
+# シートのXML自体の名前空間は、ルート要素から求める
+_REL_NAMESPACES = (
+    'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'http://purl.oclc.org/ooxml/officeDocument/relationships',
+)
+_PACKAGE_REL_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+SHARED_STRINGS_CHUNK = 4096 # 共有文字列をまとめて1つの文字列に連結する件数 (文字列ごとのオブジェクトを持たない)
+
+
+class XlsxError(ValueError):
+    """.xlsx ファイルとして読み込めない、または指定したシートが無い。"""
+
+
+def _column_index(cell_ref):
+    """セル参照 (例: 'AB12') の列番号 (A列が0)。"""
+    index = 0
+    for char in cell_ref:
+        if 'A' <= char <= 'Z':
+            index = index * 26 + ord(char) - 64
+        else:
+            break
+    return index - 1
+
+
+def _rich_text(element, ns):
+    """文字列の要素 (<si> / <is>) の文字列。書式付きの文字列 (<r>) は連結し、ふりがな (<rPh>) は除く。"""
+    text = element.findtext(ns + 't')
+    if text is not None:
+        return text
+    return ''.join(run.findtext(ns + 't') or '' for run in element.iterfind(ns + 'r'))
+
+
+# --- 数値の表示形式 ---
+_FORMAT_CONDITION = re.compile(r'\[(<=|>=|<>|<|>|=)(-?[0-9.]+)\]')
+_FORMAT_BRACKETS = re.compile(r'\[[^\]]*\]')
+_FORMAT_LITERALS = frozenset(' -+/():!^&\'~{}<>=$')
+_COMPARE = {
+    '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b, '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '>': lambda a, b: a > b, '=': lambda a, b: a == b,
+}
+
+
+def _split_sections(code):
+    """表示形式を ';' で区切ったセクションのリスト (引用符内とエスケープされた ';' では区切らない)。"""
+    sections = ['']
+    quoted = escaped = False
+    for char in code:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            sections.append('')
+            continue
+        sections[-1] += char
+    return sections
+
+
+def _digit_tokens(section):
+    """
+    「0」「#」と区切り文字だけのセクションを、桁 ('0' / '#') と文字列のリストに分解する。
+    小数点・桁区切り・日付などを含むセクションは扱わない (None を返す)。
+    """
+    tokens = []
+    i = 0
+    while i < len(section):
+        char = section[i]
+        if char in '0#':
+            tokens.append(char)
+        elif char == '"':
+            end = section.find('"', i + 1)
+            if end < 0:
+                return None
+            tokens.append(section[i + 1:end])
+            i = end
+        elif char == '\\' and i + 1 < len(section):
+            i += 1
+            tokens.append(section[i])
+        elif char in _FORMAT_LITERALS or not char.isascii():
+            tokens.append(char)
+        else:
+            return None
+        i += 1
+    return tokens if '0' in tokens or '#' in tokens else None
+
+
+def _format_digits(tokens, digits):
+    """整数の数字列 digits を、桁のトークンに右から当てはめる (余った上位の桁は先頭の桁にまとめる)。"""
+    places = [i for i, token in enumerate(tokens) if token in ('0', '#')]
+    out = list(tokens)
+    remaining = digits.lstrip('0')
+    for i in reversed(places):
+        if remaining:
+            out[i], remaining = remaining[-1], remaining[:-1]
+        else:
+            out[i] = '0' if tokens[i] == '0' else ''
+    if remaining:
+        out[places[0]] = remaining + out[places[0]]
+    return ''.join(out)
+
+
+def _number_formatter(code):
+    """
+    表示形式の文字列から、0以上の整数の数値を文字列にする関数を作る。
+    「000-0000」や「[<=999]000;[<=9999]000-00;000-0000」(郵便番号) のような、桁と区切り文字だけの形式のみ扱い、
+    それ以外の形式 (標準・小数・日付など) は None を返す。
+    """
+    sections = []
+    for section in _split_sections(code):
+        condition = _FORMAT_CONDITION.search(section)
+        tokens = _digit_tokens(_FORMAT_BRACKETS.sub('', section))
+        sections.append((condition.groups() if condition else None, tokens))
+    if not sections or all(tokens is None for _, tokens in sections):
+        return None
+
+    def format_number(number):
+        if any(condition for condition, _ in sections):
+            # 条件付きの形式は、最初に条件を満たすセクション (無ければ条件の無いセクション) を使う
+            chosen = next((tokens for condition, tokens in sections
+                           if condition and _COMPARE[condition[0]](number, float(condition[1]))), None)
+            if chosen is None:
+                chosen = next((tokens for condition, tokens in sections if not condition), None)
+        elif number == 0 and len(sections) >= 3:
+            chosen = sections[2][1]
+        else:
+            chosen = sections[0][1]
+        return _format_digits(chosen, str(number)) if chosen is not None else None
+
+    return format_number
+
+
+def _general_number(text):
+    """標準の表示形式の数値 (整数はそのまま、小数は15桁まで)。"""
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if number.is_integer() and abs(number) < 1e15:
+        return str(int(number))
+    return format(number, '.15g')
+
+
+class _SharedStrings:
+    """
+    共有文字列の表 (sharedStrings.xml)。
+    文字列を SHARED_STRINGS_CHUNK 件ずつ1つの文字列に連結し、区切りの位置を配列で持つ
+    (数十万件の文字列を個別の str オブジェクトとして持つより、数分の一のメモリで済む)。
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offsets = []
+        self._pending = []
+        self.count = 0
+
+    def append(self, text):
+        self._pending.append(text)
+        self.count += 1
+        if len(self._pending) == SHARED_STRINGS_CHUNK:
+            self._flush()
+
+    def _flush(self):
+        offsets = array('I', [0])
+        position = 0
+        for text in self._pending:
+            position += len(text)
+            offsets.append(position)
+        self._chunks.append(''.join(self._pending))
+        self._offsets.append(offsets)
+        self._pending = []
+
+    def finish(self):
+        if self._pending:
+            self._flush()
+
+    def __getitem__(self, index):
+        chunk, i = divmod(index, SHARED_STRINGS_CHUNK)
+        offsets = self._offsets[chunk]
+        return self._chunks[chunk][offsets[i]:offsets[i + 1]]
+
+
+class XlsxSheetReader:
+    """
+    .xlsx ブックの1つのシートを先頭から一度だけ読み、各行のセルの値を文字列のリストとして1行ずつ返すリーダー。
+    リストはA列から始まり、値の無いセルは '' になる (行の末尾の空のセルは含まない)。値の無い行は返さない。
+    sheet にはシート名か、ワークシートの順番 (1から、グラフシートは数えない) を指定する (None で最初のシート)。
+    path にはファイルのパスの代わりに、シーク可能なバイナリのストリーム (アップロードされたブックなど) も指定できる。
+    進捗はシートのXMLを展開したバイト数から求める (progress)。
+    with文で使用するか、最後に close() を呼び出すこと。
+    """
+
+    def __init__(self, path, sheet=None):
+        self.path = path
+        self.sheet = sheet
+        self.sheet_name = None
+        self._zip = None
+        self._sheet_file = None
+        self._sheet_size = 0
+        self._shared_strings = None
+        self._formatters = None
+
+    def __enter__(self):
+        if self._zip is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """ブックを開き、シートの場所・共有文字列・表示形式を読み込む。"""
+        self._open_zip()
+        try:
+            sheets, parts = self._read_workbook()
+            self.sheet_name, sheet_path = self._choose_sheet(sheets)
+            self._shared_strings = self._read_shared_strings(parts.get('sharedStrings'))
+            self._formatters = self._read_styles(parts.get('styles'))
+            info = self._zip.getinfo(sheet_path)
+            self._sheet_size = info.file_size
+            self._sheet_file = self._zip.open(info)
+        except (KeyError, ParseError, zipfile.BadZipFile) as e:
+            self.close()
+            raise XlsxError(f"Excelブック (.xlsx) の形式が正しくありません: {self._display_name()} ({e})") from e
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._sheet_file is not None:
+            self._sheet_file.close()
+            self._sheet_file = None
+        if self._zip is not None:
+            # ストリームを指定した場合も、ストリーム自体は閉じない (ZipFile はパスから開いたファイルだけを閉じる)
+            self._zip.close()
+            self._zip = None
+
+    def _open_zip(self):
+        try:
+            self._zip = zipfile.ZipFile(self.path)
+        except zipfile.BadZipFile as e:
+            raise XlsxError(f"Excelブック (.xlsx) として読み込めません: {self._display_name()}") from e
+
+    def _display_name(self):
+        if hasattr(self.path, 'read'):
+            # 一時ファイルなどの name はパスではない (None やファイル記述子) ことがある
+            name = getattr(self.path, 'name', None)
+            return name if isinstance(name, str) else 'アップロードされたブック'
+        return os.fspath(self.path)
+
+    def _relationships(self, part_path):
+        """パーツの関係 (_rels/*.rels) を {Id: (種類の末尾, ZIP内のパス)} として読み込む。"""
+        directory, name = posixpath.split(part_path)
+        rels_path = posixpath.join(directory, '_rels', name + '.rels')
+        try:
+            root = self._parse_tree(rels_path)
+        except KeyError:
+            return {}
+        relationships = {}
+        for rel in root.iter('{%s}Relationship' % _PACKAGE_REL_NAMESPACE):
+            target = rel.get('Target', '')
+            if rel.get('TargetMode') == 'External':
+                continue
+            if target.startswith('/'):
+                path = target.lstrip('/')
+            else:
+                path = posixpath.normpath(posixpath.join(directory, target))
+            relationships[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], path)
+        return relationships
+
+    def _parse_tree(self, part_path):
+        """ZIP内の小さなXML (ブック・関係・スタイル) を解析したルート要素。"""
+        with self._zip.open(part_path) as f:
+            return parse(f).getroot()
+
+    def _office_document_path(self):
+        for rel_type, path in self._relationships('').values():
+            if rel_type == 'officeDocument':
+                return path
+        return 'xl/workbook.xml'
+
+    def _read_workbook(self):
+        """ブックのシートの一覧 [(シート名, ZIP内のパス), ...] と、共有文字列・スタイルのパスを読み込む。"""
+        workbook_path = self._office_document_path()
+        root = self._parse_tree(workbook_path)
+        ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+        relationships = self._relationships(workbook_path)
+        sheets = []
+        for sheet in root.iter(ns + 'sheet'):
+            rel_id = next((sheet.get('{%s}id' % rel_ns) for rel_ns in _REL_NAMESPACES if sheet.get('{%s}id' % rel_ns)), None)
+            rel_type, path = relationships.get(rel_id, ('', None))
+            # グラフシート (chartsheet) などには行が無いため、ワークシートだけを対象にする
+            if path is not None and rel_type == 'worksheet':
+                sheets.append((sheet.get('name'), path))
+        parts = {rel_type: path for rel_type, path in relationships.values() if rel_type in ('sharedStrings', 'styles')}
+        return sheets, parts
+
+    def _choose_sheet(self, sheets):
+        if not sheets:
+            raise XlsxError(f"ワークシートがありません: {self._display_name()}")
+        sheet = self.sheet
+        if sheet is None:
+            return sheets[0]
+        for name, path in sheets:
+            if name == sheet:
+                return name, path
+        # 同じ名前のシートが無ければ、ワークシートの順番 (1から) とみなす
+        if isinstance(sheet, int) or str(sheet).isdigit():
+            number = int(sheet)
+            if 1 <= number <= len(sheets):
+                return sheets[number - 1]
+        names = '、'.join(f"「{name}」" for name, _ in sheets)
+        raise XlsxError(f"シート「{sheet}」が見つかりません (シート: {names})")
+
+    def _read_shared_strings(self, part_path):
+        shared_strings = _SharedStrings()
+        if part_path is None or part_path not in self._zip.NameToInfo:
+            return shared_strings
+        with self._zip.open(part_path) as f:
+            ns = None
+            root = None
+            for event, element in iterparse(f, events=('start', 'end')):
+                if root is None:
+                    root = element
+                    ns = element.tag[:element.tag.index('}') + 1] if element.tag.startswith('{') else ''
+                    si_tag = ns + 'si'
+                elif event == 'end' and element.tag == si_tag:
+                    shared_strings.append(_rich_text(element, ns))
+                    # 読み終えた文字列の要素は、ルートからも外して破棄する
+                    root.clear()
+        shared_strings.finish()
+        return shared_strings
+
+    def _read_styles(self, part_path):
+        """セルの書式 (s 属性の番号) ごとに、数値を表示形式で文字列にする関数 (標準の形式は None) のリスト。"""
+        if part_path is None or part_path not in self._zip.NameToInfo:
+            return []
+        root = self._parse_tree(part_path)
+        ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+        # 組み込みの表示形式のうち「0」だけは桁の形式として扱う (その他の組み込みは標準と同じ文字列にする)
+        codes = {'1': '0'}
+        for num_fmt in root.iter(ns + 'numFmt'):
+            codes[num_fmt.get('numFmtId')] = num_fmt.get('formatCode', '')
+        formatters = {}
+        cell_xfs = root.find(ns + 'cellXfs')
+        result = []
+        for xf in (cell_xfs.iterfind(ns + 'xf') if cell_xfs is not None else ()):
+            code = codes.get(xf.get('numFmtId', '0'))
+            if code not in formatters:
+                formatters[code] = _number_formatter(code) if code else None
+            result.append(formatters[code])
+        return result
+
+    def __iter__(self):
+        if self._zip is None:
+            self.open()
+        return self._iter_rows()
+
+    def _iter_rows(self):
+        shared_strings = self._shared_strings
+        formatters = self._formatters
+        ns = None
+        sheet_data = None
+        for event, element in iterparse(self._sheet_file, events=('start', 'end')):
+            if ns is None:
+                ns = element.tag[:element.tag.index('}') + 1] if element.tag.startswith('{') else ''
+                row_tag, cell_tag, value_tag, inline_tag = ns + 'row', ns + 'c', ns + 'v', ns + 'is'
+                sheet_data_tag = ns + 'sheetData'
+            if event == 'start':
+                if element.tag == sheet_data_tag:
+                    sheet_data = element
+                continue
+            if element.tag != row_tag:
+                continue
+
+            values = []
+            for cell in element.iterfind(cell_tag):
+                cell_type = cell.get('t')
+                if cell_type == 'inlineStr':
+                    inline = cell.find(inline_tag)
+                    text = _rich_text(inline, ns) if inline is not None else ''
+                else:
+                    text = cell.findtext(value_tag)
+                    if text is None:
+                        continue
+                    if cell_type == 's':
+                        text = shared_strings[int(text)]
+                    elif cell_type == 'b':
+                        text = 'TRUE' if text == '1' else 'FALSE'
+                    elif cell_type in (None, 'n'):
+                        text = self._format_number(text, cell.get('s'), formatters)
+                if not text:
+                    continue
+                ref = cell.get('r')
+                column = _column_index(ref) if ref else len(values)
+                if column >= len(values):
+                    values.extend([''] * (column + 1 - len(values)))
+                values[column] = text
+            # 読み終えた行の要素は、シートのデータ (<sheetData>) からも外して破棄する (メモリ使用量を一定に保つ)
+            if sheet_data is not None:
+                sheet_data.clear()
+            if values:
+                yield values
+
+    @staticmethod
+    def _format_number(text, style, formatters):
+        formatter = formatters[int(style)] if style and int(style) < len(formatters) else None
+        if formatter is not None:
+            try:
+                number = float(text)
+            except ValueError:
+                return text
+            if number.is_integer() and number >= 0:
+                formatted = formatter(int(number))
+                if formatted is not None:
+                    return formatted
+        return _general_number(text)
+
+    @property
+    def progress(self):
+        """シートのXMLを展開したバイト数の割合 (0.0〜1.0)。"""
+        if self._sheet_file is None or self._sheet_size == 0:
+            return 1.0
+        return min(self._sheet_file.tell() / self._sheet_size, 1.0)
+